@@ -47,7 +47,9 @@ def create_app(config_name: str = None) -> Flask:
     })
 
     # Реєстрація моделей
-    from app.models import User, FileMetadata, AuditLog, ThreatEvent
+    from app.models import (User, FileMetadata, AuditLog, ThreatEvent, AuditArchiveSegment,
+                            TokenRevocation, FileGrant)
+    from app.models.audit_search import AuditSearchIndex
 
     # Реєстрація blueprints
     from app.routes.auth import auth_bp
@@ -64,47 +66,142 @@ def create_app(config_name: str = None) -> Flask:
     app.register_blueprint(users_bp, url_prefix='/api/users')
     app.register_blueprint(cloud_bp, url_prefix='/api/cloud')
 
+    # Обмеження частоти запитів — першим, до будь-яких звернень до БД
+    from app.middleware.rate_limiter import setup_rate_limiting
+    setup_rate_limiting(app)
+
+    # Контекст запиту: JWT, ідентичність та IP — один раз, до решти хуків
+    from app.middleware.request_context import setup_request_context
+    setup_request_context(app)
+
     # Налаштування виявлення загроз
     from app.middleware.threat_detector import setup_threat_detection
     setup_threat_detection(app)
 
+    # Фонові задачі процесу: скидання агрегатів аудиту, оцінка ризику
+    from app.services.maintenance import MaintenanceScheduler
+    from app.services.audit_service import AuditService
+    from app.services.risk_scorer import RiskScorer
+    MaintenanceScheduler.init_app(app)
+    AuditService.init_app(app)
+    RiskScorer.init_app(app)
+
+    # CLI команди
+    from app.commands import register_commands
+    register_commands(app)
+
     # JWT callback для додавання інформації про користувача
     @jwt.user_identity_loader
     def user_identity_lookup(user):
         return str(user.id) if hasattr(user, 'id') else user
 
+    # Ідентичність — знімок з кешу процесу (UserSnapshot), без запиту до БД
+    # при влучанні; повний User — через current_user.load()
+    from app.services.user_cache import UserCache
+    UserCache.init_app(app)
+
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
-        identity = jwt_data["sub"]
-        return User.query.filter_by(id=identity, deleted_at=None).first()
+        return UserCache.get(jwt_data["sub"])
+
+    # Обробка відкликаних токенів: Bloom-фільтр у пам'яті, БД — лише для
+    # «можливо відкликано»
+    from app.services.token_revocation import TokenRevocationStore
+    TokenRevocationStore.init_app(app)
 
-    # Обробка заблокованих токенів
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
-        # В реальному проекті тут перевірка в Redis
-        return False
+        return TokenRevocationStore.is_revoked(jwt_payload)
 
     # Створення таблиць та початкових даних
     with app.app_context():
         db.create_all()
+        added = _add_missing_columns()
+        if any(table == 'audit_logs' and column.startswith('detail_') for table, column in added):
+            count = AuditLog.backfill_hot_details()
+            app.logger.info(f'Тіньові колонки details заповнено для {count} записів аудиту')
+        _create_missing_indexes()
+        AuditSearchIndex.setup(app)
         _create_initial_admin(app)
 
+    # Скомпільована матриця прав та гранти власника/публічності файлів
+    from app.services.access_policy import AccessPolicy
+    AccessPolicy.init_app(app)
+
+    # Bloom-фільтр наявних імен для швидкої відмови при вході
+    from app.services.username_filter import UsernameFilter
+    UsernameFilter.init_app(app)
+
     return app
 
 
+def _add_missing_columns() -> list:
+    """
+    create_all не змінює наявні таблиці — колонки, додані до моделей пізніше,
+    додаються тут (ALTER TABLE ... ADD COLUMN). Колонка зі скалярним default
+    отримує його як DEFAULT (і NOT NULL, якщо так у моделі), решта — nullable.
+
+    Returns:
+        [(таблиця, колонка)] — додані колонки
+    """
+    engine = db.engine
+    inspector = db.inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    existing_tables = set(inspector.get_table_names())
+
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} ' \
+                      f'{column.type.compile(dialect=engine.dialect)}'
+                default = column.default
+                if default is not None and default.is_scalar:
+                    literal = db.literal(default.arg, column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={'literal_binds': True}
+                    )
+                    ddl += f' DEFAULT {literal}'
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                connection.execute(db.text(ddl))
+                added.append((table.name, column.name))
+    return added
+
+
+def _create_missing_indexes():
+    """
+    create_all не додає індекси до вже наявних таблиць — індекси, оголошені
+    в моделях пізніше, створюються тут (IF NOT EXISTS), а замінені —
+    видаляються.
+    """
+    from app.models.file_meta import OBSOLETE_INDEXES
+
+    with db.engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.execute(db.text(f'DROP INDEX IF EXISTS {name}'))
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
 def _create_initial_admin(app: Flask):
     """
     Створює початкових користувачів (admin та user), якщо вони не існують.
+    Паролі хешуються напряму, без пулу bcrypt.
     """
     from app.models import User
-    from app.services.auth_service import AuthService
-
-    auth_service = AuthService()
+    from app.services.password_hasher import PasswordHasher
 
     # Адміністратор
     admin = User.query.filter_by(username='admin').first()
     if not admin:
-        password_hash = auth_service.hash_password('Admin123!@#')
+        password_hash = PasswordHasher.hash_sync('Admin123!@#')
         admin = User(
             username='admin',
             email='admin@shieldcloud.local',
@@ -117,7 +214,7 @@ def _create_initial_admin(app: Flask):
     # Звичайний користувач
     user = User.query.filter_by(username='user').first()
     if not user:
-        password_hash = auth_service.hash_password('User123!@#')
+        password_hash = PasswordHasher.hash_sync('User123!@#')
         user = User(
             username='user',
             email='user@shieldcloud.local',
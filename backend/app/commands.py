@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+CLI команди ShieldCloud (flask <group> <command>)
+"""
+import json
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+audit_cli = AppGroup('audit', help='Обслуговування аудит-логу')
+threats_cli = AppGroup('threats', help='Діагностика виявлення загроз')
+files_cli = AppGroup('files', help='Діагностика запитів до файлів')
+
+
+@audit_cli.command('archive')
+@click.option('--max-partitions', type=int, default=None,
+              help='Максимум денних партицій за один запуск')
+def archive_audit_logs(max_partitions):
+    """Переносить закриті денні партиції audit_logs в об'єктне сховище."""
+    from app.services.audit_archive_service import AuditArchiveService
+
+    result = AuditArchiveService().archive_closed_partitions(max_partitions=max_partitions)
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+@audit_cli.command('archive-stats')
+def archive_stats():
+    """Показує статистику архіву аудит-логу."""
+    from app.services.audit_archive_service import AuditArchiveService
+
+    click.echo(json.dumps(AuditArchiveService().get_archive_stats(), ensure_ascii=False, indent=2))
+
+
+@threats_cli.command('benchmark-tracker')
+@click.option('--threads', type=int, default=8, help='Кількість потоків')
+@click.option('--users', type=int, default=1000, help='Кількість різних користувачів')
+@click.option('--operations', type=int, default=20000, help='Операцій на потік')
+@click.option('--shards', default='1,16', help='Кількості шардів через кому (1 = один глобальний м\'ютекс)')
+@click.option('--backend', type=click.Choice(['memory', 'shared']), default='memory', help='Бекенд трекера')
+def benchmark_tracker_command(threads, users, operations, shards, backend):
+    """Вимірює пропускну здатність і конкуренцію м'ютексів трекера активності."""
+    from app.services.activity_tracker import create_tracker_backend, benchmark_tracker
+
+    results = []
+    for shard_count in (int(value) for value in shards.split(',')):
+        config = dict(current_app.config, THREAT_TRACKER_BACKEND=backend, THREAT_TRACKER_SHARDS=shard_count)
+        if backend == 'shared':
+            config['THREAT_TRACKER_SHARED_PATH'] += '.benchmark'
+        result = benchmark_tracker(
+            create_tracker_backend(config),
+            threads=threads, users=users, operations=operations
+        )
+        results.append(result)
+
+    click.echo(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+@threats_cli.command('replay')
+@click.option('--source', type=click.Choice(['audit', 'synthetic']), default='audit',
+              help='Джерело подій: аудит-лог або синтетична траса')
+@click.option('--since', type=click.DateTime(), default=None, help='Початок вікна аудит-логу (UTC)')
+@click.option('--until', type=click.DateTime(), default=None, help='Кінець вікна аудит-логу (UTC)')
+@click.option('--hours', type=int, default=24, help='Вікно аудит-логу, якщо не задано --since')
+@click.option('--limit', type=int, default=500000, help='Максимум записів аудит-логу')
+@click.option('--rules', 'rules_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSON-файл правил для перевірки (за замовчуванням — робочі правила)')
+@click.option('--users', type=int, default=200, help='Синтетична траса: користувачів')
+@click.option('--duration', type=int, default=3600, help='Синтетична траса: тривалість, секунд')
+@click.option('--attackers', type=int, default=10, help='Синтетична траса: кількість атак')
+@click.option('--seed', type=int, default=42, help='Синтетична траса: seed генератора')
+def replay_threats_command(source, since, until, hours, limit, rules_path, users, duration, attackers, seed):
+    """Відтворює історичні або синтетичні події через правила виявлення (без запису в БД)."""
+    from datetime import datetime, timedelta
+    from app.services.threat_rules import ThreatRuleEngine
+    from app.services.threat_replay import ThreatReplayEngine
+    from app.services.threat_service import ThreatService
+
+    if rules_path:
+        try:
+            rule_engine = ThreatRuleEngine(ThreatRuleEngine.load_file(rules_path))
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    else:
+        rule_engine = ThreatService.get_rule_engine()
+
+    replay = ThreatReplayEngine(rule_engine, current_app.config.get('THREAT_COOLDOWN_SECONDS', {}))
+
+    if source == 'synthetic':
+        events = ThreatReplayEngine.generate_synthetic(users=users, duration=duration,
+                                                       attackers=attackers, seed=seed)
+        report = replay.run(events, labelled=True)
+        report['skipped'] = {}
+    else:
+        until = until or datetime.utcnow()
+        since = since or until - timedelta(hours=hours)
+        events, skipped = ThreatReplayEngine.load_audit_events(since, until, limit)
+        report = replay.run(events, history=ThreatReplayEngine.load_threat_history(since, until))
+        report['skipped'] = skipped
+        report['window'] = {'since': since.isoformat(), 'until': until.isoformat()}
+
+    report['source'] = source
+    report['rules_file'] = rules_path
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+@threats_cli.command('score-risk')
+@click.option('--benchmark', 'benchmark_users', type=int, default=None,
+              help='Виміряти завантаження, оцінку та запис для N випадкових користувачів '
+                   '(тимчасова БД у пам\'яті)')
+def score_risk_command(benchmark_users):
+    """Перераховує risk_score усіх користувачів одним векторизованим проходом."""
+    from app.services.risk_scorer import RiskScorer
+
+    scorer = RiskScorer()
+    if benchmark_users:
+        result = scorer.benchmark(users=benchmark_users)
+    else:
+        result = scorer.run()
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+@files_cli.command('check-plans')
+@click.option('--verbose', is_flag=True, help='Показати плани всіх запитів')
+def check_query_plans_command(verbose):
+    """Перевіряє EXPLAIN QUERY PLAN гарячих запитів; ненульовий код при регресії."""
+    from app.services.query_plan_checker import QueryPlanChecker
+
+    try:
+        report = QueryPlanChecker().check()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    if not verbose:
+        report.pop('plans')
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if report['failures']:
+        raise click.ClickException(f"Регресія планів запитів: {len(report['failures'])}")
+
+
+def register_commands(app: Flask):
+    """Реєструє CLI команди додатку"""
+    app.cli.add_command(audit_cli)
+    app.cli.add_command(threats_cli)
+    app.cli.add_command(files_cli)
@@ -36,19 +36,238 @@ class Config:
     CLOUDWATCH_LOG_GROUP = os.environ.get('CLOUDWATCH_LOG_GROUP', '/shieldcloud/audit')
     CLOUDWATCH_LOG_STREAM = 'events'
 
+    # Архівування аудит-логу
+    AUDIT_HOT_RETENTION_DAYS = int(os.environ.get('AUDIT_HOT_RETENTION_DAYS', 30))
+    AUDIT_ARCHIVE_PREFIX = os.environ.get('AUDIT_ARCHIVE_PREFIX', 'audit-archive')
+    AUDIT_ARCHIVE_DELETE_CHUNK = 500  # рядків за одну транзакцію видалення
+    AUDIT_ARCHIVE_DELETE_PAUSE_MS = 20  # пауза між транзакціями для інших записувачів
+    AUDIT_ARCHIVE_SEGMENT_CACHE_SIZE = 8  # розпакованих сегментів у пам'яті
+
+    # Політики запису шумних аудит-подій (дії з AuditService.LOSSLESS_ACTIONS
+    # завжди записуються повністю):
+    #   keep      — записувати кожну подію
+    #   sample    — записувати кожну rate-ту подію
+    #   aggregate — перші keep_first подій у вікні записуються, решта
+    #               згортається в рядок-лічильник (count, first_seen, last_seen)
+    AUDIT_EVENT_POLICIES = {
+        'TOKEN_REFRESH': {
+            'mode': 'aggregate', 'window_seconds': 300, 'keep_first': 1,
+            'key': ('user_id',)
+        },
+        'FILE_DOWNLOADED': {
+            'mode': 'sample', 'rate': 10, 'match': {'is_public': True}
+        },
+        'LOGIN_FAILED': {
+            'mode': 'aggregate', 'window_seconds': 60, 'keep_first': 20,
+            'key': ('ip_address',), 'statuses': ('denied',)
+        },
+        'RATE_LIMITED': {
+            'mode': 'aggregate', 'window_seconds': 60, 'keep_first': 1,
+            'key': ('resource_id',), 'statuses': ('denied',)
+        },
+        'LOGIN_THROTTLED': {
+            'mode': 'aggregate', 'window_seconds': 60, 'keep_first': 1,
+            'key': ('ip_address',), 'statuses': ('denied',)
+        },
+    }
+    # Як часто фонова задача записує рядки-лічильники закритих вікон, секунд
+    AUDIT_AGGREGATE_FLUSH_INTERVAL = int(os.environ.get('AUDIT_AGGREGATE_FLUSH_INTERVAL', 5))
+
     # Безпека
     BCRYPT_SALT_ROUNDS = 12
+    # bcrypt у виділеному пулі (thread — потоки, bcrypt відпускає GIL;
+    # process — процеси forkserver, лише під gunicorn).
+    # BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT — максимум одночасних операцій на воркер
+    # gunicorn; має бути менше за --threads, інакше вхід займе всі потоки
+    BCRYPT_EXECUTOR = os.environ.get('BCRYPT_EXECUTOR', 'thread')
+    BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+    BCRYPT_QUEUE_LIMIT = int(os.environ.get('BCRYPT_QUEUE_LIMIT', 1))
+    BCRYPT_TIMEOUT_SECONDS = 5
+    # Фіктивний bcrypt для неіснуючих імен: однаковий час відповіді ціною CPU
+    LOGIN_UNKNOWN_USER_BCRYPT = os.environ.get('LOGIN_UNKNOWN_USER_BCRYPT', 'false').lower() == 'true'
+
+    # Bloom-фільтр імен користувачів: вхід з точно неіснуючим іменем — без БД;
+    # реєстрації з інших воркерів підтягуються не частіше ніж раз на SYNC_SECONDS
+    USERNAME_FILTER_ENABLED = os.environ.get('USERNAME_FILTER_ENABLED', 'true').lower() == 'true'
+    USERNAME_FILTER_SYNC_SECONDS = 2
+    USERNAME_FILTER_REBUILD_SECONDS = 3600
+    USERNAME_FILTER_CAPACITY = 100000
+    USERNAME_FILTER_ERROR_RATE = 0.01
     MAX_FAILED_LOGIN_ATTEMPTS = 5
     ACCOUNT_LOCK_DURATION_MINUTES = 30
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50 МБ
 
-    # Rate Limiting
-    RATE_LIMIT_AUTHENTICATED = 60  # запитів за хвилину
-    RATE_LIMIT_ANONYMOUS = 20
+    # Кеш знімків користувачів для JWT/RBAC (0 — вимкнено); зміни в інших
+    # воркерах стають видимими не пізніше ніж через TTL
+    USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 30))
+    USER_CACHE_MAX_SIZE = 10000
+
+    # Відкликання JWT: таблиця token_revocations + Bloom-фільтр у кожному воркері;
+    # відкликання з іншого воркера діє не пізніше ніж через SYNC_SECONDS
+    TOKEN_REVOCATION_SYNC_SECONDS = float(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 2))
+    TOKEN_REVOCATION_REBUILD_SECONDS = 3600
+    # Видалення прострочених відкликань — фонова задача процесу
+    TOKEN_REVOCATION_PURGE_SECONDS = 3600
+    TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+    TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+    # Rate Limiting (token bucket: місткість — ліміт, поповнення — ліміт/60 за секунду)
+    # Ключ кошика — user id з JWT (лише перевірка підпису, без БД) або IP клієнта.
+    # Ліміт для автентифікованих вищий за поріг правила rapid_requests
+    # (100 запитів/хв), інакше limiter відсікав би запити раніше, ніж
+    # спрацює виявлення загрози
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_AUTHENTICATED = int(os.environ.get('RATE_LIMIT_AUTHENTICATED', 120))  # запитів за хвилину
+    RATE_LIMIT_ANONYMOUS = int(os.environ.get('RATE_LIMIT_ANONYMOUS', 20))
+    # Вартість запиту в токенах за endpoint (за замовчуванням 1)
+    RATE_LIMIT_COSTS = {
+        'auth.login': 5,       # bcrypt
+        'auth.register': 5,    # bcrypt
+        'files.upload_file': 5,
+        'files.verify_all_files': 10,
+    }
+    RATE_LIMIT_SHARDS = 16
+    RATE_LIMIT_MAX_KEYS_PER_SHARD = 10000
 
     # Threat Detection
+    # Згасання threat_score обчислюється при читанні (без періодичних оновлень):
+    # 'linear' — DECAY_AMOUNT за кожні DECAY_INTERVAL_MINUTES,
+    # 'exponential' — половина за HALF_LIFE_MINUTES
+    THREAT_SCORE_DECAY_MODE = os.environ.get('THREAT_SCORE_DECAY_MODE', 'linear')
     THREAT_SCORE_DECAY_INTERVAL_MINUTES = 10
     THREAT_SCORE_DECAY_AMOUNT = 1
+    THREAT_SCORE_HALF_LIFE_MINUTES = 60
     THREAT_SCORE_WARNING_THRESHOLD = 50
     THREAT_SCORE_RATE_LIMIT_THRESHOLD = 80
     THREAT_SCORE_BLOCK_THRESHOLD = 100
+
+    # Пакетна оцінка ризику (flask threats score-risk): вікна подій
+    # {назва: (секунд, вага)}, ваги ознак, додаткові ваги типів загроз
+    # та масштаб нормалізації risk = 100 * (1 - exp(-raw / SCALE))
+    RISK_SCORE_WINDOWS = {
+        '1h': (3600, 1.0),
+        '24h': (86400, 0.5),
+        '7d': (7 * 86400, 0.1),
+    }
+    RISK_SCORE_WEIGHTS = {
+        'severity_critical': 40,
+        'severity_high': 15,
+        'severity_medium': 5,
+        'severity_low': 1,
+        'failed_logins': 3,
+        'threat_score': 0.5,
+        'distinct_ips': 4,  # за кожен IP понад перший
+        'downloads': 0.2,
+        'download_mb': 0.05,
+    }
+    RISK_SCORE_TYPE_WEIGHTS = {
+        'INTEGRITY_VIOLATION': 20,
+        'PRIVILEGE_ESCALATION': 20,
+    }
+    RISK_SCORE_SCALE = 100
+    # Інтервал фонового перерахунку в кожному процесі, секунд (0 — лише CLI/cron)
+    RISK_SCORE_INTERVAL_SECONDS = int(os.environ.get('RISK_SCORE_INTERVAL_SECONDS', 900))
+
+    # Правила виявлення загроз: metric ('requests', 'failed_logins', 'downloads',
+    # 'deletes'), window (с), threshold, op ('>' | '>='), threat_type,
+    # cooldown (с, необов'язково), description ({value}, {window}).
+    # THREAT_RULES_FILE — JSON з правилами, перечитується при зміні файлу.
+    THREAT_RULES = [
+        {'name': 'brute_force', 'metric': 'failed_logins', 'window': 600, 'threshold': 5, 'op': '>=',
+         'threat_type': 'BRUTE_FORCE',
+         'description': 'Виявлено {value} невдалих спроб входу за останні 10 хвилин'},
+        {'name': 'rapid_requests', 'metric': 'requests', 'window': 60, 'threshold': 100, 'op': '>',
+         'threat_type': 'RAPID_REQUESTS',
+         'description': 'Виявлено {value} запитів за останню хвилину'},
+        {'name': 'mass_download', 'metric': 'downloads', 'window': 300, 'threshold': 20, 'op': '>',
+         'threat_type': 'MASS_DOWNLOAD',
+         'description': 'Виявлено {value} скачувань за останні 5 хвилин'},
+        {'name': 'mass_delete', 'metric': 'deletes', 'window': 300, 'threshold': 10, 'op': '>',
+         'threat_type': 'MASS_DELETE',
+         'description': 'Виявлено {value} видалень за останні 5 хвилин'},
+    ]
+    THREAT_RULES_FILE = os.environ.get('THREAT_RULES_FILE')
+    THREAT_RULES_RELOAD_SECONDS = 5
+
+    # Cooldown повторних виявлень (секунд без повторів, після яких подія закривається).
+    # Повтори в межах вікна лише збільшують лічильник відкритої події.
+    # Типи без запису (напр. INTEGRITY_VIOLATION) створюють подію щоразу.
+    THREAT_COOLDOWN_SECONDS = {
+        'BRUTE_FORCE': 600,
+        'RAPID_REQUESTS': 300,
+        'MASS_DOWNLOAD': 300,
+        'MASS_DELETE': 300,
+        'FOREIGN_IP_ACCESS': 300,
+    }
+    # Ескалація відкритої події: кожні repeats_per_level повторів — наступний
+    # рівень (+score * score_factor, severity на крок вище), не більше max_level
+    THREAT_ESCALATION_POLICIES = {
+        'default': {'repeats_per_level': 100, 'score_factor': 0.5, 'max_level': 3, 'raise_severity': True},
+        'BRUTE_FORCE': {'repeats_per_level': 10},
+        'MASS_DELETE': {'repeats_per_level': 20},
+    }
+    # Як часто лічильник повторів відкритої події записується в БД
+    THREAT_REPEAT_FLUSH_SECONDS = 30
+
+    # Невдалі входи за IP-джерелом: Count-Min для кількості невдач та
+    # HyperLogLog (для IP з >= TRACK_MIN_FAILURES невдач, не більше MAX_TRACKED_IPS)
+    # для розрізнених username і наявних користувачів; вікно з ротацією
+    THREAT_SKETCH_WINDOW_SECONDS = 600
+    THREAT_SKETCH_CMS_WIDTH = 16384
+    THREAT_SKETCH_CMS_DEPTH = 4
+    THREAT_SKETCH_HLL_PRECISION = 8  # 256 регістрів, похибка ~6.5%
+    THREAT_SKETCH_TRACK_MIN_FAILURES = 3
+    THREAT_SKETCH_MAX_TRACKED_IPS = 4096
+    THREAT_SKETCH_RULES = {
+        'CREDENTIAL_STUFFING': {'failures': 20, 'distinct_users': 5},
+        'ACCOUNT_SCANNING': {'distinct_usernames': 15, 'max_known_ratio': 0.5},
+    }
+
+    # Кількість довірених зворотних проксі перед додатком. 0 — IP клієнта лише
+    # з адреси з'єднання (X-Forwarded-For ігнорується: його може підробити
+    # будь-хто); N — N-та адреса з кінця X-Forwarded-For, як ProxyFix(x_for=N).
+    # Вмикати, лише якщо додаток доступний тільки через ці проксі
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    # WSGI-фільтр до Flask: deny-list мереж (403) та тимчасові бани IP (429).
+    # Deny-list — CIDR через кому в THREAT_IP_DENY_LIST та/або файл (по мережі
+    # на рядок, '#' — коментар). Бан IP ставиться при створенні події
+    # загрози з типом з THREAT_IP_BAN_SECONDS; THREAT_IP_BAN_EXEMPT — мережі без
+    # автоматичних банів (локальні адреси, зокрема демонстрація атак)
+    THREAT_IP_DENY_LIST = [network.strip() for network in
+                           os.environ.get('THREAT_IP_DENY_LIST', '').split(',') if network.strip()]
+    THREAT_IP_DENY_LIST_FILE = os.environ.get('THREAT_IP_DENY_LIST_FILE')
+    THREAT_IP_BAN_SECONDS = {
+        'CREDENTIAL_STUFFING': 900,
+        'ACCOUNT_SCANNING': 600,
+    }
+    THREAT_IP_BAN_EXEMPT = [network.strip() for network in
+                            os.environ.get('THREAT_IP_BAN_EXEMPT', '127.0.0.0/8,::1/128').split(',')
+                            if network.strip()]
+    THREAT_IP_BAN_SYNC_SECONDS = 5
+    THREAT_IP_BAN_MAX = 100000
+
+    # Запис подій загроз поза запитом: 'background' (пакети у фоновому потоці)
+    # або 'sync' (одразу, для CLI та налагодження)
+    THREAT_PERSIST_MODE = os.environ.get('THREAT_PERSIST_MODE', 'background')
+    THREAT_PERSIST_BATCH_SIZE = 200
+    THREAT_PERSIST_FLUSH_INTERVAL_MS = 500
+    THREAT_PERSIST_QUEUE_SIZE = 10000
+    # Повтори пакету при помилці запису (пауза подвоюється), потім — поодинці
+    THREAT_PERSIST_RETRIES = 3
+    THREAT_PERSIST_RETRY_BACKOFF_MS = 200
+    # Звірка автоблокувань у пам'яті процесу з is_blocked у БД, секунд
+    THREAT_BLOCK_SYNC_SECONDS = 5
+
+    # Незвичний час доступу (UNUSUAL_TIME_ACCESS): профіль за замовчуванням та
+    # профілі за username. Профіль: {'timezone': 'Europe/Kyiv',
+    # 'working_hours': [8, 20]} або {'timezone': ..., 'unusual_hours': [2, 3, 4]}
+    UNUSUAL_TIME_DEFAULT_PROFILE = {'timezone': 'UTC', 'unusual_hours': [2, 3, 4]}
+    UNUSUAL_TIME_PROFILES = {}
+
+    # Бекенд трекера активності: 'memory' (в межах процесу) або
+    # 'shared' (mmap-файл, спільний для всіх воркерів на хості)
+    THREAT_TRACKER_BACKEND = os.environ.get('THREAT_TRACKER_BACKEND', 'memory')
+    THREAT_TRACKER_SHARDS = 16
+    THREAT_TRACKER_SHARED_PATH = os.environ.get('THREAT_TRACKER_SHARED_PATH', 'instance/threat_tracker.bin')
+    THREAT_TRACKER_SHARED_SLOTS = int(os.environ.get('THREAT_TRACKER_SHARED_SLOTS', 4096))
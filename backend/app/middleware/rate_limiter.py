@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Middleware обмеження частоти запитів (token bucket)
+"""
+import math
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket на ключ (user:<id> або ip:<адреса>).
+
+    Кошик місткістю capacity поповнюється зі швидкістю rate токенів/с;
+    запит вартістю cost проходить, якщо в кошику є cost токенів. Стан —
+    два числа на ключ у шардованому словнику (окреме блокування на шард).
+    Кошики, що встигли повністю наповнитись, не відрізняються від відсутніх
+    і видаляються при перевищенні max_keys у шарді.
+
+    Стан локальний для процесу: при N воркерах фактичний ліміт до N разів
+    вищий, що прийнятно для захисту від флуду.
+    """
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10000):
+        self.shards = max(1, shards)
+        self.max_keys_per_shard = max_keys_per_shard
+        # Шард: ключ -> [токени, момент останнього оновлення]
+        self._buckets: List[Dict[str, list]] = [{} for _ in range(self.shards)]
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+
+    def _shard(self, key: str) -> int:
+        return zlib.crc32(key.encode('utf-8')) % self.shards
+
+    def consume(self, key: str, capacity: float, rate: float, cost: float = 1,
+                now: float = None) -> Tuple[bool, float, float]:
+        """
+        Списує cost токенів з кошика ключа.
+
+        Returns:
+            (allowed, remaining, retry_after) — retry_after у секундах,
+            0 якщо запит дозволено
+        """
+        now = time.monotonic() if now is None else now
+        index = self._shard(key)
+        buckets = self._buckets[index]
+
+        with self._locks[index]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self.max_keys_per_shard:
+                    self._evict(buckets, capacity, rate, now)
+                bucket = [capacity, now]
+                buckets[key] = bucket
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, bucket[0], 0.0
+
+            # Запит дорожчий за місткість не пройде ніколи — чекаємо повний кошик
+            missing = min(cost, capacity) - bucket[0]
+            return False, bucket[0], missing / rate
+
+    @staticmethod
+    def _evict(buckets: Dict[str, list], capacity: float, rate: float, now: float):
+        """Видаляє наповнені кошики; якщо таких немає — найстаріші"""
+        full = [key for key, (tokens, updated) in buckets.items()
+                if tokens + (now - updated) * rate >= capacity]
+        for key in full:
+            del buckets[key]
+
+        if not full:
+            oldest = sorted(buckets, key=lambda key: buckets[key][1])[:max(1, len(buckets) // 10)]
+            for key in oldest:
+                del buckets[key]
+
+    def reset(self):
+        for index in range(self.shards):
+            with self._locks[index]:
+                self._buckets[index].clear()
+
+    def get_stats(self) -> dict:
+        return {
+            'shards': self.shards,
+            'keys': sum(len(buckets) for buckets in self._buckets)
+        }
+
+
+def setup_rate_limiting(app: Flask):
+    """
+    Налаштовує обмеження частоти через before_request хук.
+    Реєструється першим — до setup_request_context, — тож запит понад ліміт
+    відхиляється до перевірки відкликання токена, завантаження користувача та
+    будь-яких звернень до БД.
+    """
+    from flask import request, g, jsonify
+    from app.utils.helpers import get_client_ip
+
+    limiter = TokenBucketRateLimiter(
+        shards=app.config.get('RATE_LIMIT_SHARDS', 16),
+        max_keys_per_shard=app.config.get('RATE_LIMIT_MAX_KEYS_PER_SHARD', 10000)
+    )
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def enforce_rate_limit():
+        """Списує токени за запит; 429 без звернення до БД"""
+        config = app.config
+        if not config.get('RATE_LIMIT_ENABLED', True):
+            return
+
+        if request.method == 'OPTIONS' or request.path == '/health' \
+                or request.path.startswith('/static'):
+            return
+
+        # IP обчислюється один раз і кешується в g для решти хуків
+        ip_address = get_client_ip()
+        user_id = _get_token_identity()
+
+        if user_id:
+            key = f'user:{user_id}'
+            capacity = config.get('RATE_LIMIT_AUTHENTICATED', 120)
+        else:
+            key = f'ip:{ip_address}'
+            capacity = config.get('RATE_LIMIT_ANONYMOUS', 20)
+
+        # Ліміти задано на хвилину: місткість — ліміт, поповнення — ліміт/60 за с
+        rate = capacity / 60.0
+        cost = config.get('RATE_LIMIT_COSTS', {}).get(request.endpoint, 1)
+
+        allowed, remaining, retry_after = limiter.consume(key, capacity, rate, cost)
+        g.rate_limit = (capacity, remaining, rate)
+
+        if allowed:
+            return
+
+        retry_after = max(1, math.ceil(retry_after))
+        _log_rate_limited(key, user_id, cost, capacity)
+
+        response = jsonify({
+            'error': 'Забагато запитів',
+            'message': f'Ліміт запитів вичерпано, повторіть через {retry_after} с',
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @app.after_request
+    def add_rate_limit_headers(response):
+        """Додає заголовки RateLimit-Limit/Remaining/Reset"""
+        state = getattr(g, 'rate_limit', None)
+        if state is not None:
+            capacity, remaining, rate = state
+            response.headers['RateLimit-Limit'] = str(capacity)
+            response.headers['RateLimit-Remaining'] = str(int(remaining))
+            response.headers['RateLimit-Reset'] = str(math.ceil((capacity - remaining) / rate))
+        return response
+
+
+def _get_token_identity() -> Optional[str]:
+    """
+    Ідентичність з JWT: лише перевірка підпису та терміну дії, без
+    відкликання, user_lookup_loader і запитів до БД. Підроблений або
+    прострочений токен рахується за IP. Декодування спільне з етапом
+    контексту запиту (decode_request_jwt) — токен перевіряється один раз.
+    """
+    from app.middleware.request_context import decode_request_jwt
+
+    claims = decode_request_jwt()
+    return claims.get('sub') if claims else None
+
+
+def _log_rate_limited(key: str, user_id: Optional[str], cost: float, capacity: float):
+    """
+    Аудит відмови. RATE_LIMITED агрегується політикою AUDIT_EVENT_POLICIES
+    за ключем кошика, тож флуд дає кілька рядків на вікно, а не рядок на запит.
+    """
+    from flask import current_app, request
+    from app.services.audit_service import AuditService
+
+    try:
+        AuditService().log(
+            action='RATE_LIMITED',
+            status='denied',
+            resource_type='rate_limit',
+            resource_id=key,
+            details={
+                'user_id': user_id,
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'cost': cost,
+                'limit': capacity
+            }
+        )
+    except Exception as e:
+        current_app.logger.error(f"Помилка аудиту RATE_LIMITED: {e}")
@@ -4,7 +4,10 @@ Middleware для контролю доступу на основі ролей (
 """
 from functools import wraps
 from flask import jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt, current_user
+from flask_jwt_extended import get_jwt, current_user
+
+from app.middleware.request_context import ensure_jwt
+from app.services.access_policy import AccessPolicy
 
 
 def require_role(*allowed_roles):
@@ -23,12 +26,15 @@ def require_role(*allowed_roles):
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            # Перевіряємо JWT
-            verify_jwt_in_request()
+            # Перевіряємо JWT (повторно не декодується, якщо вже перевірено)
+            ensure_jwt()
 
-            # Отримуємо дані з токена
-            claims = get_jwt()
-            user_role = claims.get('role', 'guest')
+            # Роль зі знімка користувача (актуальна після зміни ролі),
+            # з токена — лише якщо знімка немає
+            if current_user:
+                user_role = current_user.role
+            else:
+                user_role = get_jwt().get('role', 'guest')
 
             # Перевіряємо роль
             if user_role not in allowed_roles:
@@ -78,32 +84,10 @@ def check_permission(user, action: str) -> bool:
 
 
 class RBACChecker:
-    """Клас для перевірки прав доступу"""
+    """Клас для перевірки прав доступу (рішення — зі скомпільованої AccessPolicy)"""
 
     # Матриця прав доступу
-    PERMISSIONS = {
-        'admin': {
-            'files': ['create', 'read', 'read_all', 'update', 'delete', 'delete_all'],
-            'users': ['read', 'create', 'update', 'delete', 'change_role', 'block'],
-            'audit': ['read', 'export'],
-            'threats': ['read', 'resolve'],
-            'integrity': ['check', 'check_all']
-        },
-        'user': {
-            'files': ['create', 'read', 'update', 'delete'],
-            'users': [],
-            'audit': [],
-            'threats': [],
-            'integrity': ['check']
-        },
-        'guest': {
-            'files': ['read'],  # Тільки публічні
-            'users': [],
-            'audit': [],
-            'threats': [],
-            'integrity': []
-        }
-    }
+    PERMISSIONS = AccessPolicy.PERMISSIONS
 
     @classmethod
     def can(cls, role: str, resource: str, action: str) -> bool:
@@ -118,17 +102,14 @@ class RBACChecker:
         Returns:
             True якщо дозволено
         """
-        role_permissions = cls.PERMISSIONS.get(role, {})
-        resource_permissions = role_permissions.get(resource, [])
-        return action in resource_permissions
+        return AccessPolicy.can(role, resource, action)
 
     @classmethod
     def get_allowed_actions(cls, role: str, resource: str) -> list:
         """
         Повертає список дозволених дій для ролі над ресурсом.
         """
-        role_permissions = cls.PERMISSIONS.get(role, {})
-        return role_permissions.get(resource, [])
+        return AccessPolicy.allowed_actions(role, resource)
 
     @classmethod
     def get_permission_matrix(cls) -> dict:
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Контекст запиту: JWT, ідентичність та IP клієнта — один раз на запит
+"""
+from functools import wraps
+from typing import Optional
+
+from flask import Flask, current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from flask_jwt_extended.exceptions import NoAuthorizationError
+from flask_jwt_extended.internal_utils import has_user_lookup, user_lookup, verify_token_not_blocklisted
+from flask_jwt_extended.view_decorators import _decode_jwt_from_request
+
+
+def setup_request_context(app: Flask):
+    """
+    Реєструє before_request етап (одразу після rate limiter), який:
+        - обчислює IP клієнта (g.client_ip);
+        - перевіряє JWT токена будь-якого типу: підпис і термін — спільним з
+          rate limiter декодуванням (decode_request_jwt), далі відкликання та
+          user_lookup — і зберігає результат у стандартних атрибутах
+          flask_jwt_extended (get_jwt(), current_user) та в g.identity / g.role.
+
+    Далі виявлення загроз, jwt_required і require_role цього
+    модуля та аудит беруть значення з g замість повторного декодування
+    токена й розбору заголовків. Недійсний токен не перериває етап: помилку
+    повертає jwt_required повторною перевіркою, як і раніше.
+    """
+
+    @app.before_request
+    def resolve_request_context():
+        if request.method == 'OPTIONS' or request.path.startswith('/static'):
+            return
+        resolve_context()
+
+
+def resolve_context():
+    """Заповнює g.client_ip, g.identity та g.role (ідемпотентно)"""
+    # Прив'язка до об'єкта запиту: контекст додатку (і g) може бути спільним
+    # для кількох запитів
+    current_request = request._get_current_object()
+    if g.get('request_context_request') is current_request:
+        return
+    g.request_context_request = current_request
+
+    from app.utils.helpers import get_client_ip
+    get_client_ip()
+
+    g.identity = None
+    g.role = None
+    g.jwt_verified = False
+
+    decode_request_jwt()
+    if g.jwt_decoded is None:
+        if not g.jwt_present:
+            # Як verify_jwt_in_request(optional=True) без токена
+            g._jwt_extended_jwt = {}
+            g._jwt_extended_jwt_header = {}
+            g._jwt_extended_jwt_user = {'loaded_user': None}
+            g._jwt_extended_jwt_location = None
+        return
+
+    claims, header, location = g.jwt_decoded
+    try:
+        verify_token_not_blocklisted(header, claims)
+        loaded_user = None
+        if has_user_lookup():
+            user = user_lookup(header, claims)
+            if user is None:
+                return
+            loaded_user = {'loaded_user': user}
+    except Exception:
+        # Відкликаний токен або видалений користувач
+        return
+
+    # Ті самі атрибути, що зберігає verify_jwt_in_request
+    g._jwt_extended_jwt_user = loaded_user
+    g._jwt_extended_jwt_header = header
+    g._jwt_extended_jwt = claims
+    g._jwt_extended_jwt_location = location
+
+    g.jwt_verified = True
+    g.identity = claims.get('sub')
+    g.role = claims.get('role')
+
+
+def decode_request_jwt() -> Optional[dict]:
+    """
+    Декодує JWT запиту один раз: підпис, термін дії та власні перевірки
+    claims — без відкликання, user_lookup і звернень до БД. Результат
+    кешується в g (g.jwt_decoded, g.jwt_present): rate limiter бере з нього
+    ключ кошика, resolve_context — завершує перевірку без повторного
+    декодування.
+
+    Returns:
+        claims або None (токена немає чи він недійсний)
+    """
+    current_request = request._get_current_object()
+    if g.get('jwt_decoded_request') is not current_request:
+        g.jwt_decoded_request = current_request
+        g.jwt_decoded = None
+        g.jwt_present = True
+        try:
+            g.jwt_decoded = _decode_jwt_from_request(
+                None, False, verify_type=False, skip_revocation_check=True
+            )
+        except NoAuthorizationError:
+            g.jwt_present = False
+        except Exception:
+            # Прострочений, підроблений або некоректний токен
+            pass
+
+    return g.jwt_decoded[0] if g.jwt_decoded else None
+
+
+def get_request_identity() -> Optional[str]:
+    """user id з перевіреного JWT поточного запиту або None"""
+    resolve_context()
+    return g.identity
+
+
+def ensure_jwt(optional: bool = False, fresh: bool = False, refresh: bool = False):
+    """
+    verify_jwt_in_request без повторної перевірки: якщо етап контексту вже
+    перевірив токен потрібного типу, нічого не робить. В інших випадках (немає
+    токена, недійсний, інший тип, потрібен fresh) викликає verify_jwt_in_request
+    з тими самими параметрами — відповіді про помилки не змінюються.
+    """
+    resolve_context()
+    expected_type = 'refresh' if refresh else 'access'
+    if fresh or not g.jwt_verified or get_jwt().get('type') != expected_type:
+        verify_jwt_in_request(optional=optional, fresh=fresh, refresh=refresh)
+
+
+def jwt_required(optional: bool = False, fresh: bool = False, refresh: bool = False):
+    """Замінник flask_jwt_extended.jwt_required на основі ensure_jwt"""
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            ensure_jwt(optional=optional, fresh=fresh, refresh=refresh)
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+
+        return decorator
+
+    return wrapper
@@ -6,32 +6,70 @@ import json
 from datetime import datetime
 from flask import Flask, Request
 
+from app.services.ip_blocklist import IpBlocklist
+from app.utils.helpers import get_environ_client_ip
+
 
 class ThreatDetectorMiddleware:
     """
-    WSGI Middleware для аналізу всіх запитів на підозрілу активність.
+    WSGI Middleware — швидкий фільтр до маршрутизації Flask.
+
+    IP клієнта перевіряється за deny-list мереж (радикс-дерево CIDR, 403) та
+    тимчасовими банами за подіями загроз (429 з Retry-After). Відмова
+    формується тут же: без контексту запиту, JWT, хуків і запитів до БД.
+    Бани з БД синхронізує фонова задача (IpBlocklist.sync), а не запит.
     """
 
+    MESSAGES = {
+        403: ('403 FORBIDDEN', 'Доступ заборонено', 'Доступ з цієї мережі заблоковано'),
+        429: ('429 TOO MANY REQUESTS', 'Забагато запитів', 'IP тимчасово заблоковано через підозрілу активність')
+    }
+
     def __init__(self, app, flask_app: Flask):
         self.app = app
         self.flask_app = flask_app
+        self.trusted_proxies = flask_app.config.get('TRUSTED_PROXIES', 0)
+        IpBlocklist.init_app(flask_app)
 
     def __call__(self, environ, start_response):
         """Обробка кожного запиту"""
-        # Пропускаємо запит через основний додаток
-        # Аналіз відбувається в before_request хуках
+        if environ.get('REQUEST_METHOD') != 'OPTIONS':
+            decision = IpBlocklist.check(get_environ_client_ip(environ, self.trusted_proxies))
+            if decision is not None:
+                status, _, retry_after = decision
+                return self._reject(start_response, status, retry_after)
 
+        # Аналіз дозволених запитів — у before_request хуках
         return self.app(environ, start_response)
 
+    def _reject(self, start_response, status: int, retry_after: int):
+        status_line, error, message = self.MESSAGES[status]
+        body = json.dumps({'error': error, 'message': message}, ensure_ascii=False).encode('utf-8')
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body)))
+        ]
+        if retry_after:
+            headers.append(('Retry-After', str(retry_after)))
+        start_response(status_line, headers)
+        return [body]
+
 
 def setup_threat_detection(app: Flask):
     """
     Налаштовує виявлення загроз через before_request хук.
     Викликається при ініціалізації додатку.
     """
-    from flask import request, g
-    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+    from flask import request, jsonify
+    from app.middleware.request_context import get_request_identity
     from app.services.threat_service import ThreatService
+    from app.utils.helpers import get_client_ip
+    from app.services.threat_persister import ThreatPersister
+
+    ThreatPersister.init_app(app)
+
+    # Фільтр deny-list / банів IP — до Flask
+    app.wsgi_app = ThreatDetectorMiddleware(app.wsgi_app, app)
 
     @app.before_request
     def detect_threats():
@@ -44,25 +82,22 @@ def setup_threat_detection(app: Flask):
         if request.method == 'OPTIONS':
             return
 
-        ip_address = _get_client_ip()
-
-        # Отримуємо user_id якщо є JWT
-        user_id = None
-        try:
-            verify_jwt_in_request(optional=True)
-            user_id = get_jwt_identity()
-        except Exception:
-            pass
+        # IP та user_id — з контексту запиту (JWT уже перевірено один раз)
+        ip_address = get_client_ip()
+        user_id = get_request_identity()
 
         if user_id:
-            threat_service = ThreatService()
+            # Автоблокування, ще не записане в БД, діє одразу
+            if ThreatPersister.is_blocked(user_id):
+                return jsonify({
+                    'error': 'Акаунт деактивовано',
+                    'message': 'Ваш акаунт заблоковано або видалено'
+                }), 403
 
-            # Відстежуємо запит
-            ThreatService.track_request(user_id, ip_address, request.path)
+            threat_service = ThreatService()
 
-            # Перевіряємо на швидкі запити
-            threat = threat_service.check_rapid_requests(user_id, ip_address)
-            if threat:
+            # Відстежуємо запит і перевіряємо правила метрики 'requests'
+            for threat in threat_service.record_event(user_id, 'requests', ip_address):
                 _log_threat(threat)
 
             # Перевіряємо на незвичний час
@@ -70,9 +105,6 @@ def setup_threat_detection(app: Flask):
             if threat:
                 _log_threat(threat)
 
-        # Зберігаємо IP в g для подальшого використання
-        g.client_ip = ip_address
-
     @app.after_request
     def log_response(response):
         """Логуємо відповідь для аналізу"""
@@ -80,15 +112,6 @@ def setup_threat_detection(app: Flask):
         return response
 
 
-def _get_client_ip() -> str:
-    """Отримує IP-адресу клієнта"""
-    from flask import request
-
-    if request.headers.get('X-Forwarded-For'):
-        return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    return request.remote_addr or '0.0.0.0'
-
-
 def _log_threat(threat):
     """Логує виявлену загрозу"""
     from flask import current_app
@@ -6,5 +6,9 @@ from app.models.user import User
 from app.models.file_meta import FileMetadata
 from app.models.audit_log import AuditLog
 from app.models.threat_event import ThreatEvent
+from app.models.audit_archive import AuditArchiveSegment
+from app.models.token_revocation import TokenRevocation
+from app.models.file_grant import FileGrant
 
-__all__ = ['User', 'FileMetadata', 'AuditLog', 'ThreatEvent']
+__all__ = ['User', 'FileMetadata', 'AuditLog', 'ThreatEvent', 'AuditArchiveSegment',
+           'TokenRevocation', 'FileGrant']
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Модель каталогу архівних сегментів аудит-логу
+"""
+import uuid
+from datetime import datetime
+from app import db
+
+
+class AuditArchiveSegment(db.Model):
+    """
+    Запис про сегмент аудит-логу, винесений в об'єктне сховище.
+
+    Кожен сегмент — це gzip NDJSON з рядками однієї денної партиції
+    та маленький JSON-маніфест поруч із ним.
+    """
+
+    __tablename__ = 'audit_archive_segments'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    partition_date = db.Column(db.Date, nullable=False, index=True)
+    part = db.Column(db.Integer, nullable=False, default=1)
+    s3_key = db.Column(db.String(500), nullable=False, unique=True)
+    manifest_key = db.Column(db.String(500), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    min_timestamp = db.Column(db.DateTime, nullable=True)
+    max_timestamp = db.Column(db.DateTime, nullable=True)
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    sha256 = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # pending — сегмент завантажено, рядки ще видаляються з SQLite
+    # complete — рядки повністю видалено, сегмент є єдиним джерелом
+    VALID_STATUSES = ('pending', 'complete')
+
+    def to_dict(self) -> dict:
+        """Серіалізація сегмента в словник"""
+        return {
+            'id': self.id,
+            'partition_date': self.partition_date.isoformat() if self.partition_date else None,
+            'part': self.part,
+            's3_key': self.s3_key,
+            'manifest_key': self.manifest_key,
+            'row_count': self.row_count,
+            'min_timestamp': self.min_timestamp.isoformat() if self.min_timestamp else None,
+            'max_timestamp': self.max_timestamp.isoformat() if self.max_timestamp else None,
+            'size_bytes': self.size_bytes,
+            'sha256': self.sha256,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<AuditArchiveSegment {self.partition_date} part {self.part} ({self.status})>'
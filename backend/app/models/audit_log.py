@@ -25,6 +25,20 @@ class AuditLog(db.Model):
     status = db.Column(db.String(20), nullable=False)
     details = db.Column(db.Text, nullable=True)  # JSON string
 
+    # Тіньові колонки для гарячих ключів details (заповнюються при записі)
+    detail_filename = db.Column(db.String(255), nullable=True, index=True)
+    detail_threat_type = db.Column(db.String(50), nullable=True, index=True)
+    detail_threat_id = db.Column(db.String(36), nullable=True, index=True)
+    detail_error = db.Column(db.String(500), nullable=True, index=True)
+
+    # Ключ details -> (тіньова колонка, максимальна довжина)
+    HOT_DETAIL_FIELDS = {
+        'filename': ('detail_filename', 255),
+        'threat_type': ('detail_threat_type', 50),
+        'threat_id': ('detail_threat_id', 36),
+        'error': ('detail_error', 500)
+    }
+
     # Типи дій
     ACTIONS = {
         # Автентифікація
@@ -41,6 +55,8 @@ class AuditLog(db.Model):
         'FILE_DOWNLOADED': 'Скачування файлу',
         'FILE_DELETED': 'Видалення файлу',
         'FILE_VISIBILITY_CHANGED': 'Зміна видимості файлу',
+        'FILE_SHARED': 'Надання доступу до файлу',
+        'FILE_UNSHARED': 'Відкликання доступу до файлу',
 
         # Цілісність
         'INTEGRITY_CHECK': 'Перевірка цілісності',
@@ -55,28 +71,102 @@ class AuditLog(db.Model):
         # Безпека
         'THREAT_DETECTED': 'Виявлено загрозу',
         'THREAT_RESOLVED': 'Загрозу вирішено',
-        'RATE_LIMITED': 'Обмеження запитів'
+        'THREAT_RULES_RELOADED': 'Перезавантаження правил виявлення',
+        'RATE_LIMITED': 'Обмеження запитів',
+        'LOGIN_THROTTLED': 'Вхід відхилено через перевантаження'
     }
 
     # Статуси
     VALID_STATUSES = ('success', 'denied', 'error')
 
     def set_details(self, details_dict: dict):
-        """Зберігає деталі як JSON"""
+        """Зберігає деталі як JSON та заповнює тіньові колонки"""
         self.details = json.dumps(details_dict, ensure_ascii=False)
+        self._details_cache = details_dict
+        self.apply_hot_details(details_dict)
+
+    def apply_hot_details(self, details_dict: dict):
+        """Копіює гарячі ключі details у тіньові колонки"""
+        for key, (column, max_length) in self.HOT_DETAIL_FIELDS.items():
+            value = details_dict.get(key) if details_dict else None
+            setattr(self, column, str(value)[:max_length] if value is not None else None)
+
+    @classmethod
+    def backfill_hot_details(cls, batch_size: int = 1000) -> int:
+        """
+        Заповнює тіньові колонки з details для записів, створених до їх появи
+        (одноразово, після додавання колонок). Пакетами за id.
+
+        Returns:
+            Кількість оновлених записів
+        """
+        columns = [column for column, _ in cls.HOT_DETAIL_FIELDS.values()]
+        statement = cls.__table__.update().where(cls.__table__.c.id == db.bindparam('row_id')).values(
+            {column: db.bindparam(column) for column in columns}
+        )
+
+        updated = 0
+        last_id = ''
+        while True:
+            rows = db.session.query(cls.id, cls.details).filter(
+                cls.id > last_id, cls.details.isnot(None)
+            ).order_by(cls.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            params = []
+            for row in rows:
+                try:
+                    details = json.loads(row.details)
+                except (TypeError, ValueError):
+                    continue
+                if not isinstance(details, dict):
+                    continue
+                values = {}
+                for key, (column, max_length) in cls.HOT_DETAIL_FIELDS.items():
+                    value = details.get(key)
+                    values[column] = str(value)[:max_length] if value is not None else None
+                if any(value is not None for value in values.values()):
+                    params.append(dict(values, row_id=row.id))
+
+            if params:
+                db.session.execute(statement, params)
+                db.session.commit()
+                updated += len(params)
+        return updated
 
     def get_details(self) -> dict:
-        """Отримує деталі з JSON"""
+        """Отримує деталі з JSON (розбір кешується на екземплярі)"""
+        cached = getattr(self, '_details_cache', None)
+        if cached is not None:
+            return cached
         if self.details:
             try:
-                return json.loads(self.details)
+                self._details_cache = json.loads(self.details)
+                return self._details_cache
             except json.JSONDecodeError:
                 return {}
         return {}
 
-    def to_dict(self) -> dict:
-        """Серіалізація аудит-запису в словник"""
-        return {
+    def get_summary(self) -> dict:
+        """Гарячі ключі details з тіньових колонок (без розбору JSON)"""
+        summary = {}
+        for key, (column, _) in self.HOT_DETAIL_FIELDS.items():
+            value = getattr(self, column)
+            if value is not None:
+                summary[key] = value
+        return summary
+
+    def to_dict(self, include_details: bool = True) -> dict:
+        """
+        Серіалізація аудит-запису в словник.
+
+        Для списків include_details=False: замість розбору JSON повертається
+        summary з тіньових колонок, а повні details — окремим запитом
+        (якщо details вже розібрані на екземплярі, вони все одно додаються).
+        """
+        data = {
             'id': self.id,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'user_id': self.user_id,
@@ -88,8 +178,11 @@ class AuditLog(db.Model):
             'ip_address': self.ip_address,
             'user_agent': self.user_agent,
             'status': self.status,
-            'details': self.get_details()
+            'summary': self.get_summary()
         }
+        if include_details or getattr(self, '_details_cache', None) is not None:
+            data['details'] = self.get_details()
+        return data
 
     def __repr__(self):
         return f'<AuditLog {self.action} by {self.username} at {self.timestamp}>'
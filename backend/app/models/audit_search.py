@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Повнотекстовий індекс аудит-логу (SQLite FTS5)
+"""
+import json
+import re
+from typing import Optional
+
+from flask import Flask
+
+from app import db
+
+
+class AuditSearchIndex:
+    """
+    FTS5 індекс над username, action, ip_address, resource_id та
+    сплющеним JSON з details.
+
+    Індекс синхронізується тригерами на audit_logs, тому працює для будь-якого
+    шляху запису (ORM, масове видалення під час архівування тощо).
+    Рядки FTS прив'язані до rowid audit_logs; після VACUUM потрібен rebuild().
+    """
+
+    TABLE = 'audit_logs_fts'
+    COLUMNS = ('username', 'action', 'ip_address', 'resource_id', 'details')
+
+    # Символи, що вважаються частиною токена: IP, email, імена файлів, ACTION_NAME
+    TOKEN_CHARS = "._-@:"
+    TOKEN_PATTERN = re.compile(r"[\w._\-@:]+", re.UNICODE)
+
+    # Сплющення details: "ключ значення" для всіх скалярних вузлів JSON
+    _FLATTEN_SQL = (
+        "CASE WHEN {row}.details IS NULL THEN NULL "
+        "WHEN json_valid({row}.details) THEN ("
+        "SELECT group_concat(coalesce(key, '') || ' ' || coalesce(value, ''), ' ') "
+        "FROM json_tree({row}.details) WHERE type NOT IN ('object', 'array')) "
+        "ELSE {row}.details END"
+    )
+
+    _available: Optional[bool] = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Чи активний FTS індекс для поточної БД"""
+        return bool(cls._available)
+
+    @classmethod
+    def setup(cls, app: Flask):
+        """
+        Створює FTS5 таблицю та тригери (ідемпотентно).
+        Для не-SQLite БД або без FTS5 індекс вимкнено, пошук падає назад на LIKE.
+        """
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            cls._available = False
+            return
+
+        columns = ', '.join(cls.COLUMNS)
+        new_values = ', '.join(f'new.{c}' for c in cls.COLUMNS[:-1])
+        flatten_new = cls._FLATTEN_SQL.format(row='new')
+
+        try:
+            with engine.begin() as conn:
+                exists = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (cls.TABLE,)
+                ).first()
+
+                conn.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls.TABLE} USING fts5("
+                    f"{columns}, tokenize = \"unicode61 tokenchars '{cls.TOKEN_CHARS}'\")"
+                )
+                conn.exec_driver_sql(
+                    f"CREATE TRIGGER IF NOT EXISTS {cls.TABLE}_ai AFTER INSERT ON audit_logs BEGIN "
+                    f"INSERT INTO {cls.TABLE}(rowid, {columns}) "
+                    f"VALUES (new.rowid, {new_values}, {flatten_new}); END"
+                )
+                conn.exec_driver_sql(
+                    f"CREATE TRIGGER IF NOT EXISTS {cls.TABLE}_ad AFTER DELETE ON audit_logs BEGIN "
+                    f"DELETE FROM {cls.TABLE} WHERE rowid = old.rowid; END"
+                )
+                conn.exec_driver_sql(
+                    f"CREATE TRIGGER IF NOT EXISTS {cls.TABLE}_au AFTER UPDATE ON audit_logs BEGIN "
+                    f"DELETE FROM {cls.TABLE} WHERE rowid = old.rowid; "
+                    f"INSERT INTO {cls.TABLE}(rowid, {columns}) "
+                    f"VALUES (new.rowid, {new_values}, {flatten_new}); END"
+                )
+
+            cls._available = True
+
+            if not exists:
+                cls.rebuild()
+
+        except Exception as e:
+            app.logger.warning(f"FTS5 індекс аудит-логу недоступний, пошук через LIKE: {e}")
+            cls._available = False
+
+    @classmethod
+    def rebuild(cls):
+        """Повністю перебудовує індекс з audit_logs"""
+        columns = ', '.join(cls.COLUMNS)
+        source_values = ', '.join(f'audit_logs.{c}' for c in cls.COLUMNS[:-1])
+        flatten = cls._FLATTEN_SQL.format(row='audit_logs')
+
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {cls.TABLE}")
+            conn.exec_driver_sql(
+                f"INSERT INTO {cls.TABLE}(rowid, {columns}) "
+                f"SELECT audit_logs.rowid, {source_values}, {flatten} FROM audit_logs"
+            )
+
+    @classmethod
+    def tokenize(cls, text: str) -> list:
+        """Розбиває текст на токени так само, як FTS токенізатор"""
+        return [token.lower() for token in cls.TOKEN_PATTERN.findall(text or '')]
+
+    @classmethod
+    def build_match(cls, search: str, column: str = None) -> Optional[str]:
+        """
+        Перетворює довільний рядок користувача на безпечний FTS5 вираз:
+        кожен токен стає префіксною фразою, токени з'єднуються через AND.
+        """
+        terms = [
+            '"' + token.replace('"', '""') + '"*'
+            for token in cls.tokenize(search)
+        ]
+        if not terms:
+            return None
+
+        expression = ' '.join(terms)
+        if column:
+            return f'{column} : ({expression})'
+        return expression
+
+    @classmethod
+    def filter_clause(cls, search: str, column: str = None):
+        """SQL умова для AuditLog.query.filter(): rowid IN (FTS MATCH)"""
+        match = cls.build_match(search, column)
+        if match is None:
+            return db.true()
+
+        return db.text(
+            f"audit_logs.rowid IN (SELECT rowid FROM {cls.TABLE} WHERE {cls.TABLE} MATCH :fts_{column or 'all'})"
+        ).bindparams(**{f"fts_{column or 'all'}": match})
+
+    @classmethod
+    def flatten_details(cls, details: str) -> str:
+        """Сплющує JSON details у текст так само, як тригер індексу"""
+        if not details:
+            return ''
+        try:
+            value = json.loads(details)
+        except json.JSONDecodeError:
+            return details
+
+        parts = []
+
+        def walk(node, key=''):
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    walk(v, k)
+            elif isinstance(node, list):
+                for i, v in enumerate(node):
+                    walk(v, str(i))
+            else:
+                parts.append(f'{key} {"" if node is None else node}')
+
+        walk(value)
+        return ' '.join(parts)
+
+    @classmethod
+    def matches(cls, search: str, text: str) -> bool:
+        """
+        Перевірка відповідності в Python (для архівних записів):
+        кожен токен запиту має бути префіксом якогось токена тексту.
+        """
+        terms = cls.tokenize(search)
+        if not terms:
+            return True
+        tokens = cls.tokenize(text)
+        return all(any(token.startswith(term) for token in tokens) for term in terms)
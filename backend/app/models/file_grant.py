@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Модель грантів доступу до файлів
+"""
+from datetime import datetime
+from app import db
+
+
+class FileGrant(db.Model):
+    """
+    Хто бачить файл — один рядок на (grantee_id, file_id):
+        - permission='owner' — власник (grantee_id = FileMetadata.user_id);
+        - permission='read', grantee_id='*' — публічний файл;
+        - permission='read', grantee_id=<user id> — файл, яким поділились.
+
+    Рядки власника й публічності підтримуються AccessPolicy за подіями
+    FileMetadata, тож «файли, які я бачу» — один пошук по унікальному індексу
+    (grantee_id, file_id) замість OR по власнику та is_public.
+    """
+
+    __tablename__ = 'file_grants'
+    __table_args__ = (
+        db.UniqueConstraint('grantee_id', 'file_id', name='uq_file_grants_grantee_file'),
+    )
+
+    # Значення grantee_id для публічних файлів
+    PUBLIC = '*'
+
+    VALID_PERMISSIONS = ('owner', 'read')
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    file_id = db.Column(db.String(36), db.ForeignKey('file_metadata.id'), nullable=False, index=True)
+    grantee_id = db.Column(db.String(36), nullable=False)
+    permission = db.Column(db.String(10), nullable=False, default='read')
+    granted_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FileGrant {self.permission} {self.file_id} -> {self.grantee_id}>'
@@ -6,11 +6,40 @@ import uuid
 from datetime import datetime
 from app import db
 
+# Умова часткових індексів: лише не видалені файли
+LIVE_ROWS = db.text('deleted_at IS NULL')
+
+# Індекси попередніх версій схеми, що видаляються при старті
+OBSOLETE_INDEXES = ('ix_file_metadata_stats',)
+
 
 class FileMetadata(db.Model):
     """Модель для зберігання метаданих зашифрованих файлів"""
 
     __tablename__ = 'file_metadata'
+    __table_args__ = (
+        # Усі індекси нижче — часткові, лише по живих рядках (deleted_at IS NULL).
+        # Індекс з deleted_at першою колонкою планувальник SQLite вважає
+        # селективним і обирає замість упорядкованого обходу, тому такого немає.
+        #
+        # Покриваючий індекс для агрегованої статистики (COUNT/SUM без читання
+        # рядків); deleted_at в кінці — щоб індекс покривав і умову WHERE
+        db.Index('ix_file_metadata_live_stats', 'user_id', 'is_public',
+                 'integrity_status', 'file_size', 'deleted_at',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        # Список файлів: сортування (StorageService.SORT_COLUMNS) та вибірки
+        # «свої» / «публічні» в порядку created_at
+        db.Index('ix_file_metadata_live_created', 'created_at',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_file_metadata_live_name', 'original_name',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_file_metadata_live_size', 'file_size',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_file_metadata_live_user_created', 'user_id', 'created_at',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_file_metadata_live_public_created', 'is_public', 'created_at',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
@@ -38,23 +67,13 @@ class FileMetadata(db.Model):
 
     def is_accessible_by(self, user) -> bool:
         """Перевіряє, чи має користувач доступ до файлу"""
-        if user is None:
-            return self.is_public
-        if user.role == 'admin':
-            return True
-        if self.user_id == user.id:
-            return True
-        if self.is_public:
-            return True
-        return False
+        from app.services.access_policy import AccessPolicy
+        return AccessPolicy.can_access_file(user, self, 'read')
 
     def can_delete(self, user) -> bool:
         """Перевіряє, чи може користувач видалити файл"""
-        if user is None:
-            return False
-        if user.role == 'admin':
-            return True
-        return self.user_id == user.id
+        from app.services.access_policy import AccessPolicy
+        return AccessPolicy.can_access_file(user, self, 'delete')
 
     def to_dict(self, include_owner: bool = False) -> dict:
         """Серіалізація файлу в словник"""
@@ -26,6 +26,11 @@ class ThreatEvent(db.Model):
     resolution_notes = db.Column(db.Text, nullable=True)
     resolved_at = db.Column(db.DateTime, nullable=True)
 
+    # Агрегація повторних виявлень у вікні cooldown
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+    last_seen_at = db.Column(db.DateTime, nullable=True, index=True)
+    escalation_level = db.Column(db.Integer, nullable=False, default=0)
+
     # Зв'язок для адміністратора, що вирішив загрозу
     resolver = db.relationship('User', foreign_keys=[resolved_by],
                                backref='resolved_threats')
@@ -76,6 +81,16 @@ class ThreatEvent(db.Model):
             'description': 'Масове видалення файлів',
             'score': 25,
             'severity': 'high'
+        },
+        'CREDENTIAL_STUFFING': {
+            'description': 'Перебір облікових даних по багатьох акаунтах з однієї IP',
+            'score': 30,
+            'severity': 'high'
+        },
+        'ACCOUNT_SCANNING': {
+            'description': 'Перебір імен користувачів з однієї IP',
+            'score': 15,
+            'severity': 'medium'
         }
     }
 
@@ -108,7 +123,10 @@ class ThreatEvent(db.Model):
             'is_resolved': self.is_resolved,
             'resolution': self.resolution,
             'resolution_notes': self.resolution_notes,
-            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'occurrences': self.occurrences,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None,
+            'escalation_level': self.escalation_level
         }
 
         if include_user and self.user:
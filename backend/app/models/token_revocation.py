@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Модель відкликання JWT
+"""
+from datetime import datetime
+from app import db
+
+
+class TokenRevocation(db.Model):
+    """
+    Відкликання токенів:
+        - jti задано — відкликано один токен;
+        - jti порожній — відкликано всі токени user_id, видані не пізніше
+          revoked_before (зміна ролі, блокування, видалення).
+
+    expires_at — момент, після якого відкликані токени прострочені самі
+    по собі; такі рядки видаляються при перебудові фільтра.
+    """
+
+    __tablename__ = 'token_revocations'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(36), nullable=True, unique=True)
+    user_id = db.Column(db.String(36), nullable=True, index=True)
+    token_type = db.Column(db.String(10), nullable=True)
+    revoked_before = db.Column(db.DateTime, nullable=True)
+    reason = db.Column(db.String(30), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        target = self.jti or f'user:{self.user_id}'
+        return f'<TokenRevocation {target} until {self.expires_at}>'
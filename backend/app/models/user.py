@@ -2,8 +2,16 @@
 """
 Модель користувача
 """
+import math
+import sqlite3
 import uuid
 from datetime import datetime
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
 from app import db
 
 
@@ -11,6 +19,11 @@ class User(db.Model):
     """Модель користувача системи"""
 
     __tablename__ = 'users'
+    __table_args__ = (
+        # Покриваючий індекс для агрегованої статистики користувачів
+        db.Index('ix_users_stats', 'deleted_at', 'role', 'is_blocked',
+                 'threat_score', 'last_login_at'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     username = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -20,10 +33,16 @@ class User(db.Model):
     is_blocked = db.Column(db.Boolean, default=False)
     blocked_until = db.Column(db.DateTime, nullable=True)
     failed_logins = db.Column(db.Integer, default=0)
+    # threat_score — значення на момент threat_score_updated_at;
+    # поточне значення з урахуванням згасання — current_threat_score
     threat_score = db.Column(db.Integer, default=0)
+    threat_score_updated_at = db.Column(db.DateTime, nullable=True)
+    # Пакетна оцінка ризику (RiskScorer), 0..100
+    risk_score = db.Column(db.Float, nullable=True, index=True)
+    risk_scored_at = db.Column(db.DateTime, nullable=True)
     last_login_at = db.Column(db.DateTime, nullable=True)
     last_login_ip = db.Column(db.String(45), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     deleted_at = db.Column(db.DateTime, nullable=True)
 
     # Зв'язки
@@ -55,22 +74,71 @@ class User(db.Model):
             return False
         return True
 
+    @staticmethod
+    def decay_threat_score(score: int, updated_at: Optional[datetime], now: datetime = None) -> int:
+        """
+        Обчислює згаслий threat_score без запису в БД.
+
+        THREAT_SCORE_DECAY_MODE:
+            'linear'      — мінус THREAT_SCORE_DECAY_AMOUNT за кожні
+                            THREAT_SCORE_DECAY_INTERVAL_MINUTES
+            'exponential' — половина за THREAT_SCORE_HALF_LIFE_MINUTES
+        """
+        if not score or updated_at is None:
+            return score or 0
+
+        config = current_app.config
+        elapsed = max(0.0, ((now or datetime.utcnow()) - updated_at).total_seconds())
+
+        if config.get('THREAT_SCORE_DECAY_MODE', 'linear') == 'exponential':
+            half_life = config.get('THREAT_SCORE_HALF_LIFE_MINUTES', 60) * 60
+            return int(score * 0.5 ** (elapsed / half_life))
+
+        interval = config.get('THREAT_SCORE_DECAY_INTERVAL_MINUTES', 10) * 60
+        amount = config.get('THREAT_SCORE_DECAY_AMOUNT', 1)
+        return max(0, score - int(elapsed // interval) * amount)
+
+    @classmethod
+    def decayed_threat_score_expr(cls, now: datetime = None):
+        """
+        SQL-вираз для decay_threat_score (SQLite: julianday, pow), щоб
+        сортувати та фільтрувати за поточним значенням у БД.
+        """
+        config = current_app.config
+        elapsed = db.func.max(0.0, db.func.coalesce(
+            (db.func.julianday(now or datetime.utcnow()) - db.func.julianday(cls.threat_score_updated_at)) * 86400,
+            0.0
+        ))
+
+        if config.get('THREAT_SCORE_DECAY_MODE', 'linear') == 'exponential':
+            half_life = config.get('THREAT_SCORE_HALF_LIFE_MINUTES', 60) * 60
+            return db.cast(cls.threat_score * db.func.pow(0.5, elapsed / half_life), db.Integer)
+
+        interval = config.get('THREAT_SCORE_DECAY_INTERVAL_MINUTES', 10) * 60
+        amount = config.get('THREAT_SCORE_DECAY_AMOUNT', 1)
+        return db.func.max(0, cls.threat_score - db.cast(elapsed / interval, db.Integer) * amount)
+
+    @property
+    def current_threat_score(self) -> int:
+        """Поточний threat_score з урахуванням згасання"""
+        return self.decay_threat_score(self.threat_score, self.threat_score_updated_at)
+
+    def add_threat_score(self, amount: int, now: datetime = None) -> int:
+        """Додає бали до згаслого значення та фіксує момент оновлення"""
+        now = now or datetime.utcnow()
+        self.threat_score = self.decay_threat_score(self.threat_score, self.threat_score_updated_at, now) + amount
+        self.threat_score_updated_at = now
+        return self.threat_score
+
+    def reset_threat_score(self):
+        """Скидає threat_score"""
+        self.threat_score = 0
+        self.threat_score_updated_at = datetime.utcnow()
+
     def can_access(self, action: str) -> bool:
-        """Перевіряє, чи має користувач право на дію"""
-        permissions = {
-            'admin': [
-                'upload_file', 'download_own_file', 'download_any_file',
-                'delete_own_file', 'delete_any_file', 'view_public_file',
-                'verify_integrity', 'view_audit', 'view_threats',
-                'manage_users', 'change_roles', 'block_accounts'
-            ],
-            'user': [
-                'upload_file', 'download_own_file', 'delete_own_file',
-                'view_public_file', 'verify_integrity'
-            ],
-            'guest': ['view_public_file']
-        }
-        return action in permissions.get(self.role, [])
+        """Перевіряє, чи має користувач право на дію (AccessPolicy.ACTION_ALIASES)"""
+        from app.services.access_policy import AccessPolicy
+        return AccessPolicy.can_action(self.role, action)
 
     def to_dict(self, include_sensitive: bool = False) -> dict:
         """Серіалізація користувача в словник"""
@@ -80,7 +148,8 @@ class User(db.Model):
             'email': self.email,
             'role': self.role,
             'is_blocked': self.is_blocked,
-            'threat_score': self.threat_score,
+            'threat_score': self.current_threat_score,
+            'risk_score': self.risk_score,
             'last_login_at': self.last_login_at.isoformat() if self.last_login_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -92,3 +161,14 @@ class User(db.Model):
 
     def __repr__(self):
         return f'<User {self.username} ({self.role})>'
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_pow(dbapi_connection, _connection_record):
+    """pow() для decayed_threat_score_expr, якщо SQLite зібрано без математичних функцій"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    try:
+        dbapi_connection.execute('SELECT pow(2, 1)')
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function('pow', 2, math.pow, deterministic=True)
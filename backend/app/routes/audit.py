@@ -5,10 +5,12 @@ API маршрути для аудит-логів
 from datetime import datetime
 from flask import Blueprint, request, jsonify, Response
 
-from flask_jwt_extended import jwt_required, current_user
+from flask_jwt_extended import current_user
 
+from app.models import AuditLog
 from app.services.audit_service import AuditService
 from app.middleware.rbac import require_role
+from app.middleware.request_context import jwt_required
 from app.utils.helpers import parse_datetime
 
 audit_bp = Blueprint('audit', __name__)
@@ -25,7 +27,10 @@ def get_audit_logs():
         page: int (default 1)
         per_page: int (default 100, max 500)
         action: string (тип дії)
-        username: string (пошук за іменем)
+        username: string (пошук за іменем, префіксний)
+        q: string (повнотекстовий пошук по username, action, IP, resource_id, details)
+        filename, threat_type, threat_id, error: string (точний збіг з ключем details)
+        details: bool (default false — у списку лише summary без розбору JSON)
         status: 'success' | 'denied' | 'error'
         resource_type: string
         from: datetime ISO string
@@ -43,6 +48,13 @@ def get_audit_logs():
     username = request.args.get('username')
     status = request.args.get('status')
     resource_type = request.args.get('resource_type')
+    search = request.args.get('q')
+    include_details = request.args.get('details', 'false').lower() == 'true'
+    detail_filters = {
+        key: request.args.get(key)
+        for key in AuditLog.HOT_DETAIL_FIELDS
+        if request.args.get(key)
+    }
     from_date = parse_datetime(request.args.get('from'))
     to_date = parse_datetime(request.args.get('to'))
 
@@ -56,13 +68,15 @@ def get_audit_logs():
         status=status,
         resource_type=resource_type,
         from_date=from_date,
-        to_date=to_date
+        to_date=to_date,
+        search=search,
+        detail_filters=detail_filters
     )
 
     total_pages = (total + per_page - 1) // per_page
 
     return jsonify({
-        'logs': [log.to_dict() for log in logs],
+        'logs': [log.to_dict(include_details=include_details) for log in logs],
         'pagination': {
             'page': page,
             'per_page': per_page,
@@ -189,8 +203,28 @@ def get_action_types():
             }
         }
     """
-    from app.models import AuditLog
-
     return jsonify({
         'actions': AuditLog.ACTIONS
     }), 200
+
+
+@audit_bp.route('/<log_id>', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_audit_log(log_id):
+    """
+    Отримання одного аудит-запису з повними details.
+
+    Returns:
+        {
+            "log": {...}
+        }
+    """
+    log = AuditLog.query.get(log_id)
+
+    if not log:
+        return jsonify({'error': 'Запис не знайдено'}), 404
+
+    return jsonify({
+        'log': log.to_dict()
+    }), 200
@@ -4,19 +4,39 @@ API маршрути автентифікації
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
-    jwt_required,
+    get_jwt,
     get_jwt_identity,
+    decode_token,
     current_user
 )
 
+from app.middleware.request_context import jwt_required
 from app.services.auth_service import AuthService
+from app.services.password_hasher import PasswordHasherBusy
 from app.services.audit_service import AuditService
 from app.services.threat_service import ThreatService
+from app.services.token_revocation import TokenRevocationStore
 from app.utils.helpers import get_client_ip
 
 auth_bp = Blueprint('auth', __name__)
 
 
+def _hasher_busy_response(error: PasswordHasherBusy, username: str):
+    """
+    503 з Retry-After, коли пул bcrypt перевантажено. LOGIN_THROTTLED
+    агрегується за IP політикою AUDIT_EVENT_POLICIES.
+    """
+    AuditService().log(
+        action='LOGIN_THROTTLED',
+        status='denied',
+        resource_type='session',
+        details={'username': username, 'endpoint': request.endpoint}
+    )
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """
@@ -51,7 +71,10 @@ def register():
     auth_service = AuthService()
     audit_service = AuditService()
 
-    user, error = auth_service.register_user(username, email, password)
+    try:
+        user, error = auth_service.register_user(username, email, password)
+    except PasswordHasherBusy as busy:
+        return _hasher_busy_response(busy, username)
 
     if error:
         audit_service.log(
@@ -114,7 +137,10 @@ def login():
     threat_service = ThreatService()
     ip_address = get_client_ip()
 
-    user, error = auth_service.authenticate(username, password, ip_address)
+    try:
+        user, error = auth_service.authenticate(username, password, ip_address)
+    except PasswordHasherBusy as busy:
+        return _hasher_busy_response(busy, username)
 
     if error:
         # Логуємо невдалу спробу
@@ -124,20 +150,27 @@ def login():
             details={'username': username, 'reason': error}
         )
 
-        # Перевіряємо на brute force
-        from app.models import User
-        target_user = User.query.filter_by(username=username).first()
+        # Перевіряємо на brute force (акаунт уже знайдено в authenticate)
+        target_user = user
         if target_user:
-            ThreatService.track_failed_login(target_user.id, ip_address)
-            threat = threat_service.check_brute_force(target_user.id, ip_address)
-            if threat:
+            for threat in threat_service.record_event(target_user.id, 'failed_logins', ip_address):
                 audit_service.log(
                     action='THREAT_DETECTED',
                     status='success',
                     user=target_user,
-                    details={'threat_type': 'BRUTE_FORCE', 'threat_id': threat.id}
+                    details={'threat_type': threat.threat_type, 'threat_id': threat.id}
                 )
 
+        # Перебір з однієї IP по багатьох (зокрема неіснуючих) акаунтах
+        for threat in threat_service.record_failed_login_source(
+            ip_address, username, target_user.id if target_user else None
+        ):
+            audit_service.log(
+                action='THREAT_DETECTED',
+                status='success',
+                details={'threat_type': threat.threat_type, 'threat_id': threat.id}
+            )
+
         # Визначаємо код помилки
         if 'заблоковано' in error.lower():
             return jsonify({'error': error}), 423  # Locked
@@ -202,12 +235,28 @@ def refresh():
 @jwt_required()
 def logout():
     """
-    Вихід із системи.
+    Вихід із системи: поточний access токен відкликається до кінця строку дії.
 
-    В реальному проекті тут би додавали токен до чорного списку в Redis.
+    Body (опційно):
+        {
+            "refresh_token": "string"   — відкликається разом з access токеном
+        }
     """
     audit_service = AuditService()
 
+    TokenRevocationStore.revoke_token(get_jwt(), reason='logout')
+
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refresh_token')
+    if refresh_token:
+        try:
+            payload = decode_token(refresh_token)
+        except Exception:
+            return jsonify({'error': 'Невірний refresh токен'}), 400
+        if payload.get('type') != 'refresh' or payload.get('sub') != get_jwt_identity():
+            return jsonify({'error': 'Невірний refresh токен'}), 400
+        TokenRevocationStore.revoke_token(payload, reason='logout')
+
     audit_service.log(
         action='LOGOUT',
         status='success',
@@ -229,9 +278,10 @@ def get_current_user():
             "user": {...}
         }
     """
-    if not current_user:
+    user = current_user.load() if current_user else None
+    if not user:
         return jsonify({'error': 'Користувача не знайдено'}), 401
 
     return jsonify({
-        'user': current_user.to_dict()
+        'user': user.to_dict()
     }), 200
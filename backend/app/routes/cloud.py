@@ -3,9 +3,10 @@
 API маршрути для управління хмарними провайдерами
 """
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, current_user
+from flask_jwt_extended import current_user
 
 from app.middleware.rbac import require_role
+from app.middleware.request_context import jwt_required
 from app.services.cloud_providers import cloud_manager
 from app.services.audit_service import AuditService
 
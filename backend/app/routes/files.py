@@ -4,15 +4,17 @@ API маршрути для роботи з файлами
 """
 import base64
 from flask import Blueprint, request, jsonify, send_file, Response
-from flask_jwt_extended import jwt_required, current_user
+from flask_jwt_extended import current_user
 from io import BytesIO
 
-from app.models import FileMetadata
+from app.models import FileMetadata, User
 from app.services.storage_service import StorageService
 from app.services.integrity_service import IntegrityService
+from app.services.access_policy import AccessPolicy
 from app.services.audit_service import AuditService
 from app.services.threat_service import ThreatService
 from app.middleware.rbac import require_role
+from app.middleware.request_context import jwt_required
 from app.utils.helpers import get_client_ip, sanitize_filename
 
 files_bp = Blueprint('files', __name__)
@@ -27,9 +29,10 @@ def list_files():
     Query params:
         page: int (default 1)
         per_page: int (default 20, max 100)
-        sort: string (default 'created_at')
+        sort: 'created_at' | 'original_name' | 'file_size' (default 'created_at')
         order: 'asc' | 'desc' (default 'desc')
         search: string (пошук за назвою)
+        scope: 'visible' | 'own' | 'public' | 'shared' (default 'visible')
 
     Returns:
         {
@@ -47,6 +50,17 @@ def list_files():
     sort_by = request.args.get('sort', 'created_at')
     order = request.args.get('order', 'desc')
     search = request.args.get('search', None)
+    scope = request.args.get('scope', 'visible')
+
+    if sort_by not in StorageService.SORT_COLUMNS:
+        return jsonify({
+            'error': f'Невірне поле сортування. Допустимі: {", ".join(StorageService.SORT_COLUMNS)}'
+        }), 400
+
+    if scope not in StorageService.LIST_SCOPES:
+        return jsonify({
+            'error': f'Невірна вибірка. Допустимі: {", ".join(StorageService.LIST_SCOPES)}'
+        }), 400
 
     storage_service = StorageService()
     files, total = storage_service.get_file_list(
@@ -55,7 +69,8 @@ def list_files():
         per_page=per_page,
         sort_by=sort_by,
         order=order,
-        search=search
+        search=search,
+        scope=scope
     )
 
     total_pages = (total + per_page - 1) // per_page
@@ -205,15 +220,13 @@ def download_file(file_id):
 
     # Відстежуємо скачування
     if current_user:
-        ThreatService.track_download(current_user.id)
         threat_service = ThreatService()
-        threat = threat_service.check_mass_download(current_user.id, get_client_ip())
-        if threat:
+        for threat in threat_service.record_event(current_user.id, 'downloads', get_client_ip()):
             audit_service.log(
                 action='THREAT_DETECTED',
                 status='success',
                 user=current_user,
-                details={'threat_type': 'MASS_DOWNLOAD', 'threat_id': threat.id}
+                details={'threat_type': threat.threat_type, 'threat_id': threat.id}
             )
 
     audit_service.log(
@@ -222,7 +235,10 @@ def download_file(file_id):
         user=current_user,
         resource_type='file',
         resource_id=file_id,
-        details={'filename': file_meta.original_name}
+        details={
+            'filename': file_meta.original_name,
+            'is_public': file_meta.is_public
+        }
     )
 
     # Відправляємо файл
@@ -267,15 +283,13 @@ def delete_file(file_id):
     audit_service = AuditService()
 
     # Відстежуємо видалення
-    ThreatService.track_delete(current_user.id)
     threat_service = ThreatService()
-    threat = threat_service.check_mass_delete(current_user.id, get_client_ip())
-    if threat:
+    for threat in threat_service.record_event(current_user.id, 'deletes', get_client_ip()):
         audit_service.log(
             action='THREAT_DETECTED',
             status='success',
             user=current_user,
-            details={'threat_type': 'MASS_DELETE', 'threat_id': threat.id}
+            details={'threat_type': threat.threat_type, 'threat_id': threat.id}
         )
 
     success, error = storage_service.delete_file(file_meta)
@@ -330,7 +344,7 @@ def change_visibility(file_id):
         return jsonify({'error': 'Файл не знайдено'}), 404
 
     # Тільки власник або admin
-    if file_meta.user_id != current_user.id and current_user.role != 'admin':
+    if not AccessPolicy.can_access_file(current_user, file_meta, 'update'):
         return jsonify({'error': 'Немає прав на зміну'}), 403
 
     old_visibility = file_meta.is_public
@@ -357,6 +371,114 @@ def change_visibility(file_id):
     }), 200
 
 
+def _get_shareable_file(file_id):
+    """(file_meta, None) або (None, відповідь з помилкою) для керування доступом"""
+    file_meta = FileMetadata.query.filter_by(
+        id=file_id,
+        deleted_at=None
+    ).first()
+
+    if not file_meta:
+        return None, (jsonify({'error': 'Файл не знайдено'}), 404)
+
+    # Тільки власник або admin
+    if not AccessPolicy.can_access_file(current_user, file_meta, 'share'):
+        return None, (jsonify({'error': 'Немає прав на керування доступом'}), 403)
+
+    return file_meta, None
+
+
+@files_bp.route('/<file_id>/shares', methods=['GET'])
+@jwt_required()
+@require_role('admin', 'user')
+def list_file_shares(file_id):
+    """
+    Користувачі, з якими поділились файлом.
+
+    Returns:
+        {
+            "shares": [{"user_id": "...", "username": "...", "shared_at": "..."}]
+        }
+    """
+    file_meta, error_response = _get_shareable_file(file_id)
+    if error_response:
+        return error_response
+
+    return jsonify({'shares': StorageService().get_file_shares(file_meta)}), 200
+
+
+@files_bp.route('/<file_id>/shares', methods=['POST'])
+@jwt_required()
+@require_role('admin', 'user')
+def share_file(file_id):
+    """
+    Надання доступу на читання файлу іншому користувачу.
+
+    Body:
+        {
+            "username": string
+        }
+    """
+    data = request.get_json()
+    if not data or not data.get('username'):
+        return jsonify({'error': 'Вкажіть username'}), 400
+
+    file_meta, error_response = _get_shareable_file(file_id)
+    if error_response:
+        return error_response
+
+    grantee = User.query.filter_by(username=data['username'], deleted_at=None).first()
+    if not grantee:
+        return jsonify({'error': 'Користувача не знайдено'}), 404
+
+    success, error = StorageService().share_file(file_meta, grantee, current_user)
+    if not success:
+        return jsonify({'error': error}), 400
+
+    AuditService().log(
+        action='FILE_SHARED',
+        status='success',
+        user=current_user,
+        resource_type='file',
+        resource_id=file_id,
+        details={
+            'filename': file_meta.original_name,
+            'target_user': grantee.username
+        }
+    )
+
+    return jsonify({'message': 'Доступ надано'}), 201
+
+
+@files_bp.route('/<file_id>/shares/<user_id>', methods=['DELETE'])
+@jwt_required()
+@require_role('admin', 'user')
+def unshare_file(file_id, user_id):
+    """
+    Відкликання доступу користувача до файлу.
+    """
+    file_meta, error_response = _get_shareable_file(file_id)
+    if error_response:
+        return error_response
+
+    if not StorageService().unshare_file(file_meta, user_id):
+        return jsonify({'error': 'Доступ не знайдено'}), 404
+
+    AuditService().log(
+        action='FILE_UNSHARED',
+        status='success',
+        user=current_user,
+        resource_type='file',
+        resource_id=file_id,
+        details={
+            'filename': file_meta.original_name,
+            'target_user_id': user_id
+        }
+    )
+
+    return jsonify({'message': 'Доступ відкликано'}), 200
+
+
 @files_bp.route('/<file_id>/verify', methods=['POST'])
 @jwt_required()
 @require_role('admin', 'user')
@@ -489,9 +611,38 @@ def get_storage_stats():
     storage_service = StorageService()
 
     # Admin бачить всю статистику, інші — тільки свою
-    if current_user.role == 'admin':
+    if AccessPolicy.can(current_user.role, 'files', 'read_all'):
         stats = storage_service.get_storage_stats()
     else:
         stats = storage_service.get_storage_stats(user=current_user)
 
     return jsonify(stats), 200
+
+
+@files_bp.route('/stats/users', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_user_storage_totals():
+    """
+    Отримання підсумків сховища по користувачах.
+
+    Query params:
+        limit: int (default 50, max 500)
+        user_id: string (опційно, підсумок одного користувача)
+
+    Returns:
+        {
+            "users": [
+                {"user_id": "...", "username": "...", "total_files": int,
+                 "total_size": int, "public_files": int},
+                ...
+            ]
+        }
+    """
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    user_id = request.args.get('user_id')
+
+    storage_service = StorageService()
+    totals = storage_service.get_user_storage_totals(limit=limit, user_id=user_id)
+
+    return jsonify({'users': totals}), 200
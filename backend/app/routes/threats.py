@@ -3,12 +3,13 @@
 API маршрути для моніторингу загроз
 """
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, current_user
+from flask_jwt_extended import current_user
 
 from app.models import ThreatEvent
 from app.services.threat_service import ThreatService
 from app.services.audit_service import AuditService
 from app.middleware.rbac import require_role
+from app.middleware.request_context import jwt_required
 from app.utils.helpers import parse_datetime
 
 threats_bp = Blueprint('threats', __name__)
@@ -222,3 +223,55 @@ def get_resolutions():
     return jsonify({
         'resolutions': list(ThreatEvent.RESOLUTIONS)
     }), 200
+
+
+@threats_bp.route('/rules', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_threat_rules():
+    """
+    Отримання активних правил виявлення загроз.
+
+    Returns:
+        {
+            "rules": [
+                {"name": "...", "metric": "...", "window": int, "threshold": int,
+                 "op": ">=", "threat_type": "...", "cooldown": int | null, "description": "..."},
+                ...
+            ]
+        }
+    """
+    engine = ThreatService.get_rule_engine()
+
+    return jsonify({
+        'rules': [rule.to_dict() for rule in engine.rules]
+    }), 200
+
+
+@threats_bp.route('/rules/reload', methods=['POST'])
+@jwt_required()
+@require_role('admin')
+def reload_threat_rules():
+    """
+    Примусове перезавантаження правил (з THREAT_RULES_FILE або конфігурації).
+
+    Returns:
+        {
+            "rules": [...]
+        }
+    """
+    try:
+        engine = ThreatService.reload_rules()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    AuditService().log(
+        action='THREAT_RULES_RELOADED',
+        status='success',
+        user=current_user,
+        details={'rules': len(engine.rules)}
+    )
+
+    return jsonify({
+        'rules': [rule.to_dict() for rule in engine.rules]
+    }), 200
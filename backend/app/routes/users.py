@@ -2,16 +2,19 @@
 """
 API маршрути для управління користувачами
 """
-from datetime import datetime
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, current_user
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import current_user
 
 from app import db
 from app.models import User
 from app.services.auth_service import AuthService
 from app.services.audit_service import AuditService
 from app.services.threat_service import ThreatService
+from app.services.threat_persister import ThreatPersister
+from app.services.token_revocation import TokenRevocationStore
 from app.middleware.rbac import require_role, RBACChecker
+from app.middleware.request_context import jwt_required
 from app.utils.helpers import get_client_ip
 
 users_bp = Blueprint('users', __name__)
@@ -287,6 +290,7 @@ def delete_user(user_id):
 
     user.deleted_at = datetime.utcnow()
     db.session.commit()
+    TokenRevocationStore.revoke_user(user.id, 'deleted')
 
     audit_service.log(
         action='USER_DELETED',
@@ -334,25 +338,45 @@ def get_permissions_matrix():
 def get_users_stats():
     """
     Отримання статистики користувачів.
+
+    Один GROUP BY role запит з умовними SUM по індексу ix_users_stats.
     """
-    users = User.query.filter(User.deleted_at.is_(None)).all()
+    threshold = current_app.config.get('THREAT_SCORE_WARNING_THRESHOLD', 50)
+    since = datetime.utcnow() - timedelta(hours=24)
+
+    rows = db.session.query(
+        User.role,
+        db.func.count(User.id),
+        db.func.sum(db.case((User.is_blocked == True, 1), else_=0)),
+        db.func.sum(db.case((User.last_login_at > since, 1), else_=0))
+    ).filter(
+        User.deleted_at.is_(None)
+    ).group_by(User.role).all()
+
+    # Збережений threat_score — верхня межа згаслого, тому індекс звужує
+    # кандидатів, а згасання рахується в тому ж запиті
+    high_threat_score = db.session.query(db.func.count(User.id)).filter(
+        User.deleted_at.is_(None),
+        User.threat_score >= threshold,
+        User.decayed_threat_score_expr() >= threshold
+    ).scalar()
 
     stats = {
-        'total': len(users),
-        'by_role': {
-            'admin': sum(1 for u in users if u.role == 'admin'),
-            'user': sum(1 for u in users if u.role == 'user'),
-            'guest': sum(1 for u in users if u.role == 'guest')
-        },
-        'blocked': sum(1 for u in users if u.is_blocked),
-        'active_24h': sum(
-            1 for u in users
-            if u.last_login_at and
-            (datetime.utcnow() - u.last_login_at).total_seconds() < 86400
-        ),
-        'high_threat_score': sum(1 for u in users if u.threat_score >= 50)
+        'total': 0,
+        'by_role': {role: 0 for role in User.VALID_ROLES},
+        'blocked': 0,
+        'active_24h': 0,
+        'high_threat_score': 0
     }
 
+    for role, count, blocked, active in rows:
+        stats['total'] += count
+        stats['by_role'][role] = stats['by_role'].get(role, 0) + count
+        stats['blocked'] += blocked or 0
+        stats['active_24h'] += active or 0
+
+    stats['high_threat_score'] = high_threat_score
+
     return jsonify(stats), 200
 
 
@@ -384,13 +408,14 @@ def demo_reset():
 
         # Скидання Threat Score
         if user.threat_score > 0:
-            user.threat_score = 0
+            user.reset_threat_score()
             reset_count += 1
 
         # Скидання лічильника невдалих входів
         user.failed_login_attempts = 0
 
     db.session.commit()
+    ThreatPersister.unblock()
 
     return jsonify({
         'message': 'Демо-режим скинуто! Всі акаунти розблоковано.',
@@ -405,20 +430,36 @@ def demo_status():
     Статус демо-режиму (скільки заблоковано, threat scores).
     Доступний без аутентифікації.
     """
-    users = User.query.filter(User.deleted_at.is_(None)).all()
+    threshold = current_app.config.get('THREAT_SCORE_WARNING_THRESHOLD', 50)
+
+    total_users = db.session.query(db.func.count(User.id)).filter(
+        User.deleted_at.is_(None)
+    ).scalar()
+
+    # Вибираємо лише потрібні колонки і лише відфільтровані рядки,
+    # threat_score — зі згасанням, обчисленим у БД
+    flagged = db.session.query(
+        User.username,
+        User.decayed_threat_score_expr(),
+        User.is_blocked
+    ).filter(
+        User.deleted_at.is_(None),
+        db.or_(User.is_blocked == True, User.threat_score >= threshold)
+    ).all()
 
     blocked_users = [
-        {'username': u.username, 'threat_score': u.threat_score}
-        for u in users if u.is_blocked
+        {'username': username, 'threat_score': threat_score}
+        for username, threat_score, is_blocked in flagged if is_blocked
     ]
 
     high_threat_users = [
-        {'username': u.username, 'threat_score': u.threat_score}
-        for u in users if u.threat_score >= 50 and not u.is_blocked
+        {'username': username, 'threat_score': threat_score}
+        for username, threat_score, is_blocked in flagged
+        if not is_blocked and threat_score >= threshold
     ]
 
     return jsonify({
-        'total_users': len(users),
+        'total_users': total_users,
         'blocked_count': len(blocked_users),
         'blocked_users': blocked_users,
         'high_threat_users': high_threat_users
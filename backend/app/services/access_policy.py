@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Єдина політика доступу: скомпільована матриця ролей та гранти файлів
+"""
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+from app.models import FileGrant, FileMetadata
+
+
+class AccessPolicy:
+    """
+    Матриця PERMISSIONS компілюється один раз: кожна пара (ресурс, дія)
+    отримує біт, кожна роль — маску, а всі рішення (роль, ресурс, дія)
+    зберігаються в словнику. Перевірка — один пошук у словнику замість
+    перебору списків.
+
+    Рішення щодо конкретного файлу (can_access_file) спершу беруть рішення
+    ролі: дія над будь-яким файлом (*_all), далі власник, публічність і лише
+    потім — грант у file_grants (запит по унікальному індексу).
+    """
+
+    # Матриця прав доступу
+    PERMISSIONS = {
+        'admin': {
+            'files': ['create', 'read', 'read_all', 'update', 'update_all',
+                      'delete', 'delete_all', 'share'],
+            'users': ['read', 'create', 'update', 'delete', 'change_role', 'block'],
+            'audit': ['read', 'export'],
+            'threats': ['read', 'resolve'],
+            'integrity': ['check', 'check_all']
+        },
+        'user': {
+            'files': ['create', 'read', 'update', 'delete', 'share'],
+            'users': [],
+            'audit': [],
+            'threats': [],
+            'integrity': ['check']
+        },
+        'guest': {
+            'files': ['read'],  # Публічні та ті, якими поділились
+            'users': [],
+            'audit': [],
+            'threats': [],
+            'integrity': []
+        }
+    }
+
+    # Назви дій User.can_access -> (ресурс, дія)
+    ACTION_ALIASES = {
+        'upload_file': ('files', 'create'),
+        'download_own_file': ('files', 'read'),
+        'download_any_file': ('files', 'read_all'),
+        'delete_own_file': ('files', 'delete'),
+        'delete_any_file': ('files', 'delete_all'),
+        'view_public_file': ('files', 'read'),
+        'verify_integrity': ('integrity', 'check'),
+        'view_audit': ('audit', 'read'),
+        'view_threats': ('threats', 'read'),
+        'manage_users': ('users', 'update'),
+        'change_roles': ('users', 'change_role'),
+        'block_accounts': ('users', 'block')
+    }
+
+    # Дія над файлом -> дія над будь-яким файлом
+    FILE_ANY_ACTIONS = {
+        'read': 'read_all',
+        'update': 'update_all',
+        'delete': 'delete_all',
+        'share': 'update_all'
+    }
+
+    _bits: Dict[Tuple[str, str], int] = {}
+    _role_masks: Dict[str, int] = {}
+    _decisions: Optional[Dict[Tuple[str, str, str], bool]] = None
+    _listeners_installed = False
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Компілює матрицю, підписується на зміни файлів і вирівнює гранти"""
+        cls.compile()
+        if not cls._listeners_installed:
+            event.listen(FileMetadata, 'after_insert', cls._after_insert)
+            event.listen(FileMetadata, 'after_update', cls._after_update)
+            cls._listeners_installed = True
+        with app.app_context():
+            cls.sync_grants()
+
+    @classmethod
+    def compile(cls) -> Dict[Tuple[str, str, str], bool]:
+        bits = {}
+        masks = {}
+        for role, resources in cls.PERMISSIONS.items():
+            mask = 0
+            for resource, actions in resources.items():
+                for action in actions:
+                    bit = bits.setdefault((resource, action), 1 << len(bits))
+                    mask |= bit
+            masks[role] = mask
+
+        decisions = {
+            (role, resource, action): bool(mask & bit)
+            for role, mask in masks.items()
+            for (resource, action), bit in bits.items()
+        }
+        cls._bits = bits
+        cls._role_masks = masks
+        cls._decisions = decisions
+        return decisions
+
+    @classmethod
+    def can(cls, role: str, resource: str, action: str) -> bool:
+        """Чи може роль виконати дію над ресурсом"""
+        decisions = cls._decisions
+        if decisions is None:
+            decisions = cls.compile()
+        return decisions.get((role, resource, action), False)
+
+    @classmethod
+    def can_action(cls, role: str, action: str) -> bool:
+        """Перевірка за назвою дії з ACTION_ALIASES"""
+        target = cls.ACTION_ALIASES.get(action)
+        if target is None:
+            return False
+        return cls.can(role, *target)
+
+    @classmethod
+    def allowed_actions(cls, role: str, resource: str) -> list:
+        if cls._decisions is None:
+            cls.compile()
+        mask = cls._role_masks.get(role, 0)
+        return [
+            action for (bit_resource, action), bit in cls._bits.items()
+            if bit_resource == resource and mask & bit
+        ]
+
+    # ------------------------------------------------------------------
+    # Файли
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def can_access_file(cls, user, file_meta: FileMetadata, action: str = 'read') -> bool:
+        """
+        Args:
+            user: User, UserSnapshot або None (анонімний доступ — лише читання
+                публічних файлів)
+            action: 'read' | 'update' | 'delete' | 'share'
+        """
+        if user is None:
+            return action == 'read' and bool(file_meta.is_public)
+
+        role = user.role
+        if cls.can(role, 'files', cls.FILE_ANY_ACTIONS.get(action, '')):
+            return True
+        if not cls.can(role, 'files', action):
+            return False
+        if file_meta.user_id == user.id:
+            return True
+        if action != 'read':
+            return False
+        if file_meta.is_public:
+            return True
+        return cls.has_grant(file_meta.id, user.id)
+
+    @staticmethod
+    def has_grant(file_id: str, user_id: str) -> bool:
+        return db.session.query(FileGrant.id).filter(
+            FileGrant.grantee_id == user_id,
+            FileGrant.file_id == file_id
+        ).first() is not None
+
+    @classmethod
+    def visible_files_clause(cls, user):
+        """
+        Умова «файли, які бачить user» для FileMetadata або None, якщо роль
+        бачить усі файли. Власні, публічні та спільні файли — один пошук
+        по індексу (grantee_id, file_id).
+        """
+        if cls.can(user.role, 'files', 'read_all'):
+            return None
+        if not cls.can(user.role, 'files', 'read'):
+            return db.false()
+        return FileMetadata.id.in_(
+            db.select(FileGrant.file_id).where(
+                FileGrant.grantee_id.in_([user.id, FileGrant.PUBLIC])
+            )
+        )
+
+    # ------------------------------------------------------------------
+    # Гранти власника та публічності
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def sync_grants(cls):
+        """
+        Вирівнює гранти власника та публічності з file_metadata (файли,
+        створені до появи таблиці або змінені в обхід ORM). Потребує
+        контексту додатку.
+        """
+        grants = FileGrant.__table__
+        now = datetime.utcnow()
+
+        def missing(grantee):
+            return ~db.exists().where(
+                grants.c.file_id == FileMetadata.id,
+                grants.c.grantee_id == grantee
+            )
+
+        db.session.execute(grants.insert().from_select(
+            ['file_id', 'grantee_id', 'permission', 'created_at'],
+            db.select(FileMetadata.id, FileMetadata.user_id, db.literal('owner'), db.literal(now))
+            .where(missing(FileMetadata.user_id))
+        ))
+        db.session.execute(grants.insert().from_select(
+            ['file_id', 'grantee_id', 'permission', 'created_at'],
+            db.select(FileMetadata.id, db.literal(FileGrant.PUBLIC), db.literal('read'), db.literal(now))
+            .where(FileMetadata.is_public == True, missing(FileGrant.PUBLIC))
+        ))
+        db.session.execute(grants.delete().where(
+            grants.c.grantee_id == FileGrant.PUBLIC,
+            grants.c.file_id.in_(
+                db.select(FileMetadata.id).where(
+                    db.or_(FileMetadata.is_public.is_(None), FileMetadata.is_public == False)
+                )
+            )
+        ))
+        db.session.commit()
+
+    @classmethod
+    def _after_insert(cls, mapper, connection, target: FileMetadata):
+        rows = [{'file_id': target.id, 'grantee_id': target.user_id, 'permission': 'owner'}]
+        if target.is_public:
+            rows.append({'file_id': target.id, 'grantee_id': FileGrant.PUBLIC, 'permission': 'read'})
+        connection.execute(FileGrant.__table__.insert(), rows)
+
+    @classmethod
+    def _after_update(cls, mapper, connection, target: FileMetadata):
+        if not db.inspect(target).attrs.is_public.history.has_changes():
+            return
+        grants = FileGrant.__table__
+        connection.execute(grants.delete().where(
+            grants.c.file_id == target.id,
+            grants.c.grantee_id == FileGrant.PUBLIC
+        ))
+        if target.is_public:
+            connection.execute(grants.insert(), [
+                {'file_id': target.id, 'grantee_id': FileGrant.PUBLIC, 'permission': 'read'}
+            ])
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Ковзні вікна активності користувачів на кільцевих буферах
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from typing import Optional, List, Tuple, Any, Callable
+
+
+def monotonic_seconds() -> int:
+    """Монотонний час у цілих секундах (не залежить від змін системного годинника)"""
+    return int(time.monotonic())
+
+
+class SlidingWindowCounter:
+    """
+    Лічильник подій у ковзному вікні з фіксованою кількістю кошиків.
+
+    Кожен кошик покриває bucket_seconds секунд; кошик перевикористовується,
+    коли його номер епохи застаріває. Запис — O(1), запит вікна — O(кошиків),
+    пам'ять — 2 масиви фіксованої довжини незалежно від частоти подій.
+    """
+
+    __slots__ = ('bucket_seconds', 'size', 'counts', 'epochs')
+
+    def __init__(self, window_seconds: int, bucket_seconds: int = 1):
+        self.bucket_seconds = bucket_seconds
+        self.size = max(1, -(-window_seconds // bucket_seconds))
+        self.counts = array('I', [0]) * self.size
+        self.epochs = array('q', [-1]) * self.size
+
+    def add(self, now: int, amount: int = 1):
+        """Додає подію в кошик поточної секунди"""
+        epoch = now // self.bucket_seconds
+        slot = epoch % self.size
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            self.counts[slot] = 0
+        self.counts[slot] += amount
+
+    def count(self, now: int, window_seconds: Optional[int] = None) -> int:
+        """Кількість подій за останні window_seconds (за замовчуванням — усе вікно)"""
+        epoch = now // self.bucket_seconds
+        if window_seconds is None:
+            span = self.size
+        else:
+            span = min(self.size, max(1, -(-window_seconds // self.bucket_seconds)))
+        oldest = epoch - span
+
+        total = 0
+        for slot in range(self.size):
+            if self.epochs[slot] > oldest:
+                total += self.counts[slot]
+        return total
+
+    def last_epoch(self) -> int:
+        """Номер останнього непорожнього кошика (-1, якщо подій не було)"""
+        return max(self.epochs)
+
+
+class UserActivity:
+    """
+    Активність одного користувача: лічильники запитів, невдалих входів,
+    скачувань і видалень та останній IP.
+    """
+
+    __slots__ = ('requests', 'failed_logins', 'downloads', 'deletes', 'last_ip', 'last_seen')
+
+    # (вікно, розмір кошика) у секундах
+    REQUESTS_WINDOW = (60, 1)
+    FAILED_LOGINS_WINDOW = (600, 10)
+    DOWNLOADS_WINDOW = (300, 10)
+    DELETES_WINDOW = (300, 10)
+
+    def __init__(self):
+        self.requests = SlidingWindowCounter(*self.REQUESTS_WINDOW)
+        self.failed_logins = SlidingWindowCounter(*self.FAILED_LOGINS_WINDOW)
+        self.downloads = SlidingWindowCounter(*self.DOWNLOADS_WINDOW)
+        self.deletes = SlidingWindowCounter(*self.DELETES_WINDOW)
+        self.last_ip = None
+        self.last_seen = 0
+
+    def is_idle(self, now: int) -> bool:
+        """Чи всі вікна вже порожні (запис можна видалити)"""
+        return now - self.last_seen > self.FAILED_LOGINS_WINDOW[0]
+
+
+class ActivityTrackerBackend(ABC):
+    """
+    Абстрактний бекенд трекера активності.
+
+    Операції для execute() (виконуються атомарно, одним «round trip»):
+        ('request', ip_address)          -> попередній IP, якщо змінився, інакше None
+        ('add', counter, amount)         -> None
+        ('count', counter, window)       -> int
+        ('incr_count', counter, window)  -> int (додати 1 і одразу порахувати вікно)
+    """
+
+    BACKEND_TYPE = "abstract"
+
+    @abstractmethod
+    def execute(self, user_id: str, operations: List[Tuple]) -> List[Any]:
+        """Виконує пакет операцій над одним користувачем атомарно"""
+        pass
+
+    @abstractmethod
+    def count(self, user_id: str, counter: str, window_seconds: int = None) -> int:
+        """Кількість подій у вікні лічильника"""
+        pass
+
+    @abstractmethod
+    def last_ip(self, user_id: str) -> Optional[str]:
+        """Останній IP користувача"""
+        pass
+
+    @abstractmethod
+    def lock_stats(self) -> dict:
+        """Статистика блокувань та розміру"""
+        pass
+
+    @abstractmethod
+    def reset(self):
+        """Очищає всі дані та статистику"""
+        pass
+
+    def track_request(self, user_id: str, ip_address: str) -> Optional[str]:
+        """Реєструє запит. Повертає попередній IP, якщо він змінився."""
+        return self.execute(user_id, [('request', ip_address)])[0]
+
+    def add(self, user_id: str, counter: str, amount: int = 1):
+        """Додає подію до лічильника"""
+        self.execute(user_id, [('add', counter, amount)])
+
+    def incr_count(self, user_id: str, counter: str, window_seconds: int = None) -> int:
+        """Атомарно додає подію та повертає кількість у вікні"""
+        return self.execute(user_id, [('incr_count', counter, window_seconds)])[0]
+
+
+class _Shard:
+    """Шард трекера: власний словник активностей, м'ютекс та статистика очікування"""
+
+    __slots__ = ('activities', 'lock', 'acquisitions', 'contended', 'wait_total', 'wait_max', 'last_eviction')
+
+    def __init__(self):
+        self.activities = {}
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.last_eviction = 0
+
+
+class ShardedActivityTracker(ActivityTrackerBackend):
+    """
+    Трекер активності в пам'яті процесу, розбитий на шарди за хешем user_id.
+
+    Запис бере лише м'ютекс свого шарду, тому потоки, що обслуговують різних
+    користувачів, майже не конкурують. Читання (count/last_ip) виконується без
+    блокування: окремі операції над array та dict атомарні під GIL, а
+    одночасне перевикористання кошика дає похибку не більше одного кошика.
+    """
+
+    BACKEND_TYPE = "memory"
+    EVICTION_INTERVAL_SECONDS = 60
+
+    def __init__(self, shards: int = 16, clock: Callable[[], int] = monotonic_seconds):
+        """clock — джерело часу в цілих секундах (віртуальний годинник для відтворення)"""
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._clock = clock
+
+    def _shard(self, user_id: str) -> _Shard:
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    def _acquire(self, shard: _Shard):
+        """Захоплює м'ютекс шарду з вимірюванням часу очікування"""
+        if shard.lock.acquire(blocking=False):
+            shard.acquisitions += 1
+            return
+
+        started = time.perf_counter()
+        shard.lock.acquire()
+        waited = time.perf_counter() - started
+
+        shard.acquisitions += 1
+        shard.contended += 1
+        shard.wait_total += waited
+        if waited > shard.wait_max:
+            shard.wait_max = waited
+
+    def _get_activity(self, shard: _Shard, user_id: str, now: int) -> UserActivity:
+        """Повертає (або створює) запис активності. Викликається під м'ютексом шарду."""
+        activity = shard.activities.get(user_id)
+        if activity is None:
+            activity = shard.activities[user_id] = UserActivity()
+        activity.last_seen = now
+        return activity
+
+    def _evict_idle(self, shard: _Shard, now: int):
+        """Видаляє неактивні записи шарду. Викликається під м'ютексом шарду."""
+        if now - shard.last_eviction < self.EVICTION_INTERVAL_SECONDS:
+            return
+        shard.last_eviction = now
+        idle = [uid for uid, activity in shard.activities.items() if activity.is_idle(now)]
+        for uid in idle:
+            del shard.activities[uid]
+
+    def execute(self, user_id: str, operations: List[Tuple]) -> List[Any]:
+        """Виконує пакет операцій під одним захопленням м'ютексу шарду"""
+        now = self._clock()
+        shard = self._shard(user_id)
+        results = []
+
+        self._acquire(shard)
+        try:
+            activity = self._get_activity(shard, user_id, now)
+
+            for operation in operations:
+                kind = operation[0]
+                if kind == 'request':
+                    ip_address = operation[1]
+                    activity.requests.add(now)
+                    previous_ip = activity.last_ip
+                    activity.last_ip = ip_address
+                    results.append(previous_ip if previous_ip and previous_ip != ip_address else None)
+                elif kind == 'add':
+                    getattr(activity, operation[1]).add(now, operation[2])
+                    results.append(None)
+                elif kind == 'count':
+                    results.append(getattr(activity, operation[1]).count(now, operation[2]))
+                elif kind == 'incr_count':
+                    counter = getattr(activity, operation[1])
+                    counter.add(now)
+                    results.append(counter.count(now, operation[2]))
+                else:
+                    raise ValueError(f"Невідома операція трекера: {kind}")
+
+            self._evict_idle(shard, now)
+        finally:
+            shard.lock.release()
+
+        return results
+
+    def count(self, user_id: str, counter: str, window_seconds: int = None) -> int:
+        """Кількість подій у вікні лічильника (без блокування)"""
+        activity = self._shard(user_id).activities.get(user_id)
+        if activity is None:
+            return 0
+        return getattr(activity, counter).count(self._clock(), window_seconds)
+
+    def last_ip(self, user_id: str) -> Optional[str]:
+        """Останній IP користувача (без блокування)"""
+        activity = self._shard(user_id).activities.get(user_id)
+        return activity.last_ip if activity else None
+
+    def lock_stats(self) -> dict:
+        """Статистика захоплень м'ютексів по всіх шардах"""
+        acquisitions = sum(s.acquisitions for s in self._shards)
+        contended = sum(s.contended for s in self._shards)
+        wait_total = sum(s.wait_total for s in self._shards)
+        return {
+            'backend': self.BACKEND_TYPE,
+            'shards': len(self._shards),
+            'tracked_users': sum(len(s.activities) for s in self._shards),
+            'acquisitions': acquisitions,
+            'contended': contended,
+            'contention_ratio': round(contended / acquisitions, 4) if acquisitions else 0.0,
+            'wait_total_ms': round(wait_total * 1000, 3),
+            'wait_max_ms': round(max(s.wait_max for s in self._shards) * 1000, 3),
+            'wait_avg_us': round(wait_total / contended * 1e6, 3) if contended else 0.0
+        }
+
+    def reset(self):
+        """Очищає всі дані та статистику"""
+        for index in range(len(self._shards)):
+            self._shards[index] = _Shard()
+
+
+def create_tracker_backend(config: dict) -> ActivityTrackerBackend:
+    """
+    Створює бекенд трекера за конфігурацією:
+        THREAT_TRACKER_BACKEND = 'memory' | 'shared'
+    """
+    backend_type = config.get('THREAT_TRACKER_BACKEND', 'memory')
+
+    if backend_type == 'memory':
+        return ShardedActivityTracker(shards=config.get('THREAT_TRACKER_SHARDS', 16))
+
+    if backend_type == 'shared':
+        from app.services.shared_activity_tracker import SharedMemoryActivityTracker
+        return SharedMemoryActivityTracker(
+            path=config['THREAT_TRACKER_SHARED_PATH'],
+            slots=config.get('THREAT_TRACKER_SHARED_SLOTS', 4096),
+            stripes=config.get('THREAT_TRACKER_SHARDS', 16)
+        )
+
+    raise ValueError(f"Невідомий бекенд трекера: {backend_type}")
+
+
+def benchmark_tracker(tracker: ActivityTrackerBackend, threads: int = 8, users: int = 1000,
+                      operations: int = 20000) -> dict:
+    """
+    Багатопотоковий бенчмарк трекера: кожен потік виконує operations пар
+    track_request + count для випадкових користувачів.
+
+    Returns:
+        {'threads', 'operations', 'elapsed_s', 'ops_per_second', 'lock': {...}}
+    """
+    import random
+
+    tracker.reset()
+    user_ids = [f'user-{i}' for i in range(users)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(operations):
+            user_id = user_ids[rng.randrange(users)]
+            tracker.track_request(user_id, '10.0.0.1')
+            tracker.count(user_id, 'requests', 60)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * operations
+    return {
+        'threads': threads,
+        'operations': total,
+        'elapsed_s': round(elapsed, 3),
+        'ops_per_second': round(total / elapsed),
+        'lock': tracker.lock_stats()
+    }
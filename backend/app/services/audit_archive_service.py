@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Сервіс архівування аудит-логу в об'єктне сховище
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from io import BytesIO
+from typing import Optional, List, Iterator
+
+import boto3
+from botocore.exceptions import ClientError
+from flask import current_app
+
+from app import db
+from app.models import AuditLog, AuditArchiveSegment
+from app.models.audit_search import AuditSearchIndex
+
+
+class AuditArchiveService:
+    """
+    Переносить закриті денні партиції audit_logs у gzip NDJSON сегменти
+    в S3 bucket та читає їх назад для запитів за старі періоди.
+    """
+
+    # Колонки, що зберігаються в сегменті
+    COLUMNS = (
+        'id', 'timestamp', 'user_id', 'username', 'action', 'resource_type',
+        'resource_id', 'ip_address', 'user_agent', 'status', 'details'
+    )
+
+    # Кеш розпакованих сегментів (сегменти незмінні після запису)
+    _segment_cache: 'OrderedDict[str, List[dict]]' = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self):
+        self._s3_client = None
+
+    @property
+    def s3_client(self):
+        """Lazy initialization S3 клієнта"""
+        if self._s3_client is None:
+            self._s3_client = boto3.client(
+                's3',
+                endpoint_url=current_app.config['AWS_ENDPOINT_URL'],
+                aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
+                aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
+                region_name=current_app.config['AWS_DEFAULT_REGION']
+            )
+        return self._s3_client
+
+    @property
+    def bucket_name(self) -> str:
+        return current_app.config['S3_BUCKET_NAME']
+
+    @property
+    def prefix(self) -> str:
+        return current_app.config.get('AUDIT_ARCHIVE_PREFIX', 'audit-archive').rstrip('/')
+
+    def hot_cutoff(self, now: datetime = None) -> datetime:
+        """Початок гарячого вікна: все раніше цієї дати підлягає архівуванню"""
+        now = now or datetime.utcnow()
+        retention_days = current_app.config.get('AUDIT_HOT_RETENTION_DAYS', 30)
+        return datetime.combine((now - timedelta(days=retention_days)).date(), datetime.min.time())
+
+    # ------------------------------------------------------------------
+    # Архівування
+    # ------------------------------------------------------------------
+
+    def archive_closed_partitions(self, now: datetime = None, max_partitions: int = None) -> dict:
+        """
+        Архівує всі денні партиції, старші за гаряче вікно.
+
+        Спочатку добиває незавершені (pending) сегменти попереднього запуску,
+        потім обробляє партиції від найстарішої. Сегмент, який не вдалося
+        завершити, лишається pending і зупиняє запуск — інакше його рядки
+        заархівувались би повторно.
+
+        Returns:
+            {'segments': [...], 'rows_archived': int, 'rows_deleted': int,
+             'pending': int}
+        """
+        result = {'segments': [], 'rows_archived': 0, 'rows_deleted': 0, 'pending': 0}
+
+        for segment in AuditArchiveSegment.query.filter_by(status='pending').all():
+            result['rows_deleted'] += self._finish_segment(segment)
+            if segment.status != 'complete':
+                result['pending'] += 1
+        if result['pending']:
+            return result
+
+        cutoff = self.hot_cutoff(now)
+        processed = 0
+
+        while max_partitions is None or processed < max_partitions:
+            oldest = db.session.query(db.func.min(AuditLog.timestamp)).filter(
+                AuditLog.timestamp < cutoff
+            ).scalar()
+            if oldest is None:
+                break
+
+            segment = self.archive_partition(oldest.date())
+            if segment is None:
+                break
+
+            result['segments'].append(segment.to_dict())
+            result['rows_archived'] += segment.row_count
+            result['rows_deleted'] += self._finish_segment(segment)
+            if segment.status != 'complete':
+                result['pending'] += 1
+                break
+            processed += 1
+
+        return result
+
+    def archive_partition(self, partition_date: date) -> Optional[AuditArchiveSegment]:
+        """
+        Записує рядки однієї денної партиції в сегмент та маніфест.
+        Рядки з SQLite ще не видаляються — див. _finish_segment.
+        """
+        start = datetime.combine(partition_date, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        query = AuditLog.query.filter(
+            AuditLog.timestamp >= start,
+            AuditLog.timestamp < end
+        ).order_by(AuditLog.timestamp.asc())
+
+        buffer = BytesIO()
+        row_count = 0
+        min_ts = max_ts = None
+        by_action = {}
+
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+            for log in query.yield_per(current_app.config.get('AUDIT_ARCHIVE_DELETE_CHUNK', 500)):
+                gz.write(json.dumps(self._serialize(log), ensure_ascii=False).encode('utf-8'))
+                gz.write(b'\n')
+                row_count += 1
+                min_ts = min_ts or log.timestamp
+                max_ts = log.timestamp
+                by_action[log.action] = by_action.get(log.action, 0) + 1
+
+        if row_count == 0:
+            return None
+
+        body = buffer.getvalue()
+        sha256 = hashlib.sha256(body).hexdigest()
+
+        part = (db.session.query(db.func.max(AuditArchiveSegment.part)).filter(
+            AuditArchiveSegment.partition_date == partition_date
+        ).scalar() or 0) + 1
+
+        base_key = f"{self.prefix}/{partition_date:%Y/%m/%d}/part-{part:04d}"
+        segment_key = f"{base_key}.ndjson.gz"
+        manifest_key = f"{base_key}.manifest.json"
+
+        manifest = {
+            'partition_date': partition_date.isoformat(),
+            'part': part,
+            'segment_key': segment_key,
+            'format': 'ndjson+gzip',
+            'columns': list(self.COLUMNS),
+            'row_count': row_count,
+            'min_timestamp': min_ts.isoformat(),
+            'max_timestamp': max_ts.isoformat(),
+            'size_bytes': len(body),
+            'sha256': sha256,
+            'by_action': by_action,
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=segment_key,
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
+        )
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=manifest_key,
+            Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+        segment = AuditArchiveSegment(
+            partition_date=partition_date,
+            part=part,
+            s3_key=segment_key,
+            manifest_key=manifest_key,
+            row_count=row_count,
+            min_timestamp=min_ts,
+            max_timestamp=max_ts,
+            size_bytes=len(body),
+            sha256=sha256,
+            status='pending'
+        )
+        db.session.add(segment)
+        db.session.commit()
+
+        return segment
+
+    def _finish_segment(self, segment: AuditArchiveSegment) -> int:
+        """
+        Видаляє з SQLite рядки, що потрапили в сегмент, обмеженими порціями.
+        Кожна порція — окрема коротка транзакція, тому записувачі не блокуються.
+
+        Сегмент позначається complete, лише якщо його прочитано повністю і
+        жодного з його рядків не лишилось у гарячій таблиці; інакше він
+        лишається pending (рядки не дублюються в get_logs) до наступного запуску.
+        """
+        chunk_size = current_app.config.get('AUDIT_ARCHIVE_DELETE_CHUNK', 500)
+        pause = current_app.config.get('AUDIT_ARCHIVE_DELETE_PAUSE_MS', 20) / 1000.0
+
+        ids = [record['id'] for record in self._load_segment(segment.s3_key)]
+        if len(ids) != segment.row_count:
+            current_app.logger.error(
+                f"Сегмент {segment.s3_key} прочитано не повністю ({len(ids)} з {segment.row_count}), "
+                f"рядки не видалено"
+            )
+            return 0
+
+        deleted = 0
+
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            deleted += AuditLog.query.filter(
+                AuditLog.id.in_(chunk)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            if pause and i + chunk_size < len(ids):
+                time.sleep(pause)
+
+        remaining = sum(
+            AuditLog.query.filter(AuditLog.id.in_(ids[i:i + chunk_size])).count()
+            for i in range(0, len(ids), chunk_size)
+        )
+        if remaining:
+            current_app.logger.error(f"Сегмент {segment.s3_key}: у audit_logs лишилось {remaining} рядків")
+            return deleted
+
+        segment.status = 'complete'
+        db.session.commit()
+
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Читання
+    # ------------------------------------------------------------------
+
+    def find_segments(self, from_date: datetime, to_date: datetime = None) -> List[AuditArchiveSegment]:
+        """Повертає завершені сегменти, що перетинаються з діапазоном дат"""
+        query = AuditArchiveSegment.query.filter(
+            AuditArchiveSegment.status == 'complete',
+            AuditArchiveSegment.max_timestamp >= from_date
+        )
+        if to_date:
+            query = query.filter(AuditArchiveSegment.min_timestamp <= to_date)
+
+        return query.order_by(
+            AuditArchiveSegment.partition_date.asc(),
+            AuditArchiveSegment.part.asc()
+        ).all()
+
+    def iter_logs(
+        self,
+        from_date: datetime,
+        to_date: datetime = None,
+        action: str = None,
+        username: str = None,
+        status: str = None,
+        resource_type: str = None,
+        search: str = None,
+        detail_filters: dict = None
+    ) -> Iterator[AuditLog]:
+        """
+        Ітерує архівні записи за діапазоном дат з тими ж фільтрами, що й get_logs.
+        Повертає transient AuditLog об'єкти (не додані до сесії).
+        """
+        for segment in self.find_segments(from_date, to_date):
+            for record in self._load_segment(segment.s3_key):
+                timestamp = datetime.fromisoformat(record['timestamp'])
+                if timestamp < from_date or (to_date and timestamp > to_date):
+                    continue
+                if action and record['action'] != action:
+                    continue
+                if status and record['status'] != status:
+                    continue
+                if resource_type and record['resource_type'] != resource_type:
+                    continue
+                if username and username.lower() not in (record['username'] or '').lower():
+                    continue
+                if search and not AuditSearchIndex.matches(search, self._search_text(record)):
+                    continue
+
+                log = self._deserialize(record, timestamp)
+                if detail_filters and any(
+                    getattr(log, AuditLog.HOT_DETAIL_FIELDS[key][0]) != value
+                    for key, value in detail_filters.items()
+                ):
+                    continue
+
+                yield log
+
+    def _load_segment(self, key: str) -> List[dict]:
+        """Завантажує та розпаковує сегмент (з LRU-кешем)"""
+        with self._cache_lock:
+            cached = self._segment_cache.get(key)
+            if cached is not None:
+                self._segment_cache.move_to_end(key)
+                return cached
+
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            body = gzip.decompress(response['Body'].read())
+        except ClientError as e:
+            current_app.logger.error(f"Не вдалося прочитати архівний сегмент {key}: {e}")
+            return []
+
+        records = [json.loads(line) for line in body.splitlines() if line]
+
+        with self._cache_lock:
+            self._segment_cache[key] = records
+            max_size = current_app.config.get('AUDIT_ARCHIVE_SEGMENT_CACHE_SIZE', 8)
+            while len(self._segment_cache) > max_size:
+                self._segment_cache.popitem(last=False)
+
+        return records
+
+    def _search_text(self, record: dict) -> str:
+        """Текст запису для повнотекстового пошуку (як у FTS індексі)"""
+        return ' '.join([
+            record['username'] or '',
+            record['action'] or '',
+            record['ip_address'] or '',
+            record['resource_id'] or '',
+            AuditSearchIndex.flatten_details(record['details'])
+        ])
+
+    def _serialize(self, log: AuditLog) -> dict:
+        """Перетворює AuditLog на запис сегмента"""
+        record = {column: getattr(log, column) for column in self.COLUMNS}
+        record['timestamp'] = log.timestamp.isoformat()
+        return record
+
+    def _deserialize(self, record: dict, timestamp: datetime) -> AuditLog:
+        """Відновлює transient AuditLog із запису сегмента"""
+        values = {column: record.get(column) for column in self.COLUMNS}
+        values['timestamp'] = timestamp
+        log = AuditLog(**values)
+        log.apply_hot_details(log.get_details())
+        return log
+
+    def get_archive_stats(self) -> dict:
+        """Статистика архіву"""
+        row = db.session.query(
+            db.func.count(AuditArchiveSegment.id),
+            db.func.coalesce(db.func.sum(AuditArchiveSegment.row_count), 0),
+            db.func.coalesce(db.func.sum(AuditArchiveSegment.size_bytes), 0),
+            db.func.min(AuditArchiveSegment.min_timestamp),
+            db.func.max(AuditArchiveSegment.max_timestamp)
+        ).filter(AuditArchiveSegment.status == 'complete').one()
+
+        return {
+            'segments': row[0],
+            'rows': int(row[1]),
+            'size_bytes': int(row[2]),
+            'oldest': row[3].isoformat() if row[3] else None,
+            'newest': row[4].isoformat() if row[4] else None,
+            'hot_cutoff': self.hot_cutoff().isoformat()
+        }
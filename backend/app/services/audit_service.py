@@ -2,27 +2,63 @@
 """
 Сервіс аудит-логування
 """
+import heapq
 import json
+import threading
 import time
+import uuid
 from datetime import datetime, timedelta
+from itertools import islice
 from typing import Optional, List, Tuple
 from io import StringIO
 import csv
 
 import boto3
 from botocore.exceptions import ClientError
-from flask import current_app, request
+from flask import Flask, current_app, request
 
 from app import db
 from app.models import AuditLog, User
+from app.models.audit_search import AuditSearchIndex
+from app.utils.helpers import get_client_ip
 
 
 class AuditService:
     """Сервіс для запису та отримання аудит-логів"""
 
+    # Дії, що завжди записуються без втрат, незалежно від AUDIT_EVENT_POLICIES
+    LOSSLESS_ACTIONS = frozenset({
+        'LOGIN_SUCCESS', 'ACCOUNT_LOCKED', 'ACCOUNT_UNLOCKED', 'USER_REGISTERED',
+        'FILE_UPLOADED', 'FILE_DELETED', 'FILE_VISIBILITY_CHANGED',
+        'FILE_SHARED', 'FILE_UNSHARED',
+        'INTEGRITY_CHECK', 'BULK_INTEGRITY_CHECK',
+        'USER_ROLE_CHANGED', 'USER_BLOCKED', 'USER_UNBLOCKED', 'USER_DELETED',
+        'THREAT_DETECTED', 'THREAT_RESOLVED', 'AUDIT_EXPORT'
+    })
+
+    # Стан семплювання та агрегації (спільний для всіх екземплярів процесу)
+    _sample_counters = {}
+    _aggregates = {}
+    _policy_lock = threading.Lock()
+    _last_sweep = 0.0
+
     def __init__(self):
         self._cloudwatch_client = None
 
+    @classmethod
+    def init_app(cls, app: Flask):
+        """
+        Закриті вікна агрегації скидаються фоновою задачею (навіть коли
+        нових подій немає), відкриті — при завершенні процесу.
+        """
+        from app.services.maintenance import MaintenanceScheduler
+        MaintenanceScheduler.register(
+            'audit-aggregates',
+            app.config.get('AUDIT_AGGREGATE_FLUSH_INTERVAL', 5),
+            lambda: cls()._flush_expired_aggregates(),
+            on_exit=lambda: cls().flush_aggregates()
+        )
+
     @property
     def cloudwatch_client(self):
         """Lazy initialization CloudWatch клієнта"""
@@ -36,12 +72,6 @@ class AuditService:
             )
         return self._cloudwatch_client
 
-    def _get_client_ip(self) -> str:
-        """Отримує IP-адресу клієнта"""
-        if request.headers.get('X-Forwarded-For'):
-            return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-        return request.remote_addr or '0.0.0.0'
-
     def _get_user_agent(self) -> str:
         """Отримує User-Agent"""
         return request.headers.get('User-Agent', '')[:500]
@@ -54,10 +84,14 @@ class AuditService:
         resource_type: str = None,
         resource_id: str = None,
         details: dict = None
-    ) -> AuditLog:
+    ) -> Optional[AuditLog]:
         """
         Записує подію в аудит-лог.
 
+        До шумних дій застосовується політика з AUDIT_EVENT_POLICIES:
+        keep (записати), sample (кожна N-та) або aggregate (перші keep_first
+        подій у вікні записуються, решта згортається в один рядок-лічильник).
+
         Args:
             action: Тип дії (LOGIN_SUCCESS, FILE_UPLOADED, etc.)
             status: 'success', 'denied', 'error'
@@ -67,15 +101,27 @@ class AuditService:
             details: Додаткові дані
 
         Returns:
-            Створений запис AuditLog
+            Створений запис AuditLog або None, якщо подію відсіяно політикою
         """
+        ip_address = get_client_ip()
+
+        policy = self._get_policy(action, status, details)
+        if policy:
+            keep, extra = self._apply_policy(policy, action, status, user, ip_address,
+                                             resource_type, resource_id)
+            if not keep:
+                self._flush_expired_aggregates()
+                return None
+            if extra:
+                details = {**(details or {}), **extra}
+
         audit_log = AuditLog(
             user_id=user.id if user else None,
             username=user.username if user else None,
             action=action,
             resource_type=resource_type,
             resource_id=resource_id,
-            ip_address=self._get_client_ip(),
+            ip_address=ip_address,
             user_agent=self._get_user_agent(),
             status=status
         )
@@ -89,8 +135,164 @@ class AuditService:
         # Асинхронний запис у CloudWatch
         self._send_to_cloudwatch(audit_log)
 
+        self._flush_expired_aggregates()
+
         return audit_log
 
+    def _get_policy(self, action: str, status: str, details: dict = None) -> Optional[dict]:
+        """Повертає політику для події або None (запис без втрат)"""
+        if action in self.LOSSLESS_ACTIONS:
+            return None
+
+        policy = current_app.config.get('AUDIT_EVENT_POLICIES', {}).get(action)
+        if not policy or policy.get('mode', 'keep') == 'keep':
+            return None
+
+        if status not in policy.get('statuses', ('success',)):
+            return None
+
+        for key, expected in policy.get('match', {}).items():
+            if (details or {}).get(key) != expected:
+                return None
+
+        return policy
+
+    def _apply_policy(
+        self,
+        policy: dict,
+        action: str,
+        status: str,
+        user: Optional[User],
+        ip_address: str,
+        resource_type: str,
+        resource_id: str
+    ) -> Tuple[bool, Optional[dict]]:
+        """
+        Застосовує політику семплювання/агрегації.
+
+        Returns:
+            (keep, extra_details)
+        """
+        mode = policy['mode']
+
+        if mode == 'sample':
+            rate = max(1, int(policy.get('rate', 1)))
+            with self._policy_lock:
+                seen = self._sample_counters.get(action, 0)
+                self._sample_counters[action] = seen + 1
+            if seen % rate:
+                return False, None
+            return True, {'sample_rate': rate}
+
+        if mode == 'aggregate':
+            key_values = {
+                'user_id': user.id if user else None,
+                'ip_address': ip_address,
+                'resource_id': resource_id
+            }
+            key = (action, status) + tuple(
+                key_values.get(field) for field in policy.get('key', ('user_id', 'ip_address'))
+            )
+            now = time.monotonic()
+            window = policy.get('window_seconds', 60)
+
+            expired = None
+            with self._policy_lock:
+                bucket = self._aggregates.get(key)
+                if bucket is not None and now >= bucket['window_end']:
+                    expired = self._aggregates.pop(key)
+                    bucket = None
+                if bucket is None:
+                    bucket = {
+                        'window_end': now + window,
+                        'window_seconds': window,
+                        'seen': 0,
+                        'suppressed': 0,
+                        'first_seen': None,
+                        'last_seen': None,
+                        'action': action,
+                        'status': status,
+                        'user_id': user.id if user else None,
+                        'username': user.username if user else None,
+                        'ip_address': ip_address,
+                        'resource_type': resource_type,
+                        'resource_id': resource_id
+                    }
+                    self._aggregates[key] = bucket
+
+                bucket['seen'] += 1
+                keep = bucket['seen'] <= policy.get('keep_first', 1)
+                if not keep:
+                    timestamp = datetime.utcnow()
+                    bucket['suppressed'] += 1
+                    bucket['first_seen'] = bucket['first_seen'] or timestamp
+                    bucket['last_seen'] = timestamp
+
+            if expired:
+                self._write_aggregate(expired)
+
+            return keep, None
+
+        return True, None
+
+    def _flush_expired_aggregates(self, force: bool = False):
+        """
+        Записує рядки-лічильники для закритих вікон агрегації.
+        Перевірка виконується не частіше ніж раз на секунду.
+        """
+        now = time.monotonic()
+        if not force and now - AuditService._last_sweep < 1.0:
+            return
+
+        with self._policy_lock:
+            AuditService._last_sweep = now
+            expired_keys = [
+                key for key, bucket in self._aggregates.items()
+                if force or now >= bucket['window_end']
+            ]
+            expired = [self._aggregates.pop(key) for key in expired_keys]
+
+        for bucket in expired:
+            self._write_aggregate(bucket)
+
+    def flush_aggregates(self):
+        """Примусово записує всі накопичені лічильники"""
+        self._flush_expired_aggregates(force=True)
+
+    def _write_aggregate(self, bucket: dict):
+        """
+        Записує один рядок-лічильник для згорнутих подій — окремим
+        з'єднанням, не зачіпаючи сесію запиту, що викликав скидання.
+        """
+        if not bucket['suppressed']:
+            return
+
+        audit_log = AuditLog(
+            id=str(uuid.uuid4()),
+            timestamp=bucket['last_seen'],
+            user_id=bucket['user_id'],
+            username=bucket['username'],
+            action=bucket['action'],
+            resource_type=bucket['resource_type'],
+            resource_id=bucket['resource_id'],
+            ip_address=bucket['ip_address'],
+            user_agent=None,
+            status=bucket['status']
+        )
+        audit_log.set_details({
+            'aggregated': True,
+            'count': bucket['suppressed'],
+            'first_seen': bucket['first_seen'].isoformat(),
+            'last_seen': bucket['last_seen'].isoformat(),
+            'window_seconds': bucket['window_seconds']
+        })
+
+        values = {column.name: getattr(audit_log, column.name) for column in AuditLog.__table__.columns}
+        with db.engine.begin() as connection:
+            connection.execute(AuditLog.__table__.insert(), values)
+
+        self._send_to_cloudwatch(audit_log)
+
     def _send_to_cloudwatch(self, audit_log: AuditLog):
         """Відправляє лог у CloudWatch"""
         try:
@@ -123,11 +325,23 @@ class AuditService:
         from_date: datetime = None,
         to_date: datetime = None,
         sort_by: str = 'timestamp',
-        order: str = 'desc'
+        order: str = 'desc',
+        search: str = None,
+        detail_filters: dict = None
     ) -> Tuple[List[AuditLog], int]:
         """
         Отримує аудит-логи з фільтрами та пагінацією.
 
+        username — пошук підрядка в імені користувача (ILIKE).
+        search — повнотекстовий пошук (префіксний, AND по токенах) по username,
+        action, ip_address, resource_id та вмісту details через FTS5 індекс.
+        detail_filters — точні фільтри по гарячих ключах details
+        ({'filename': ..., 'threat_type': ..., 'threat_id': ..., 'error': ...}),
+        що виконуються по індексованих тіньових колонках.
+
+        Якщо from_date сягає за межі гарячого вікна, до результату
+        прозоро додаються записи з архівних сегментів.
+
         Returns:
             (logs, total_count)
         """
@@ -137,7 +351,18 @@ class AuditService:
         if action:
             query = query.filter(AuditLog.action == action)
         if username:
+            # Підрядок, як і раніше (FTS знаходить лише префікси токенів)
             query = query.filter(AuditLog.username.ilike(f'%{username}%'))
+        if search:
+            if AuditSearchIndex.is_available():
+                query = query.filter(AuditSearchIndex.filter_clause(search))
+            else:
+                query = query.filter(db.or_(
+                    AuditLog.username.ilike(f'%{search}%'),
+                    AuditLog.ip_address.ilike(f'%{search}%'),
+                    AuditLog.resource_id.ilike(f'%{search}%'),
+                    AuditLog.details.ilike(f'%{search}%')
+                ))
         if status:
             query = query.filter(AuditLog.status == status)
         if resource_type:
@@ -147,6 +372,14 @@ class AuditService:
         if to_date:
             query = query.filter(AuditLog.timestamp <= to_date)
 
+        detail_filters = {
+            key: value for key, value in (detail_filters or {}).items()
+            if value and key in AuditLog.HOT_DETAIL_FIELDS
+        }
+        for key, value in detail_filters.items():
+            column = getattr(AuditLog, AuditLog.HOT_DETAIL_FIELDS[key][0])
+            query = query.filter(column == value)
+
         # Сортування
         sort_column = getattr(AuditLog, sort_by, AuditLog.timestamp)
         if order == 'desc':
@@ -154,11 +387,51 @@ class AuditService:
         else:
             query = query.order_by(sort_column.asc())
 
+        offset = (page - 1) * per_page
+        archived = self._get_archived_logs(
+            from_date, to_date,
+            action=action, username=username, status=status,
+            resource_type=resource_type, search=search,
+            detail_filters=detail_filters
+        )
+
         # Пагінація
         total = query.count()
-        logs = query.offset((page - 1) * per_page).limit(per_page).all()
 
-        return logs, total
+        if not archived:
+            logs = query.offset(offset).limit(per_page).all()
+            return logs, total
+
+        # Злиття гарячих та архівних записів у спільному порядку сортування
+        sort_attr = sort_column.key
+        reverse = order == 'desc'
+
+        def sort_key(log):
+            value = getattr(log, sort_attr)
+            return (value is not None, value)
+
+        archived.sort(key=sort_key, reverse=reverse)
+        hot = query.limit(offset + per_page).all()
+        merged = heapq.merge(hot, archived, key=sort_key, reverse=reverse)
+        logs = list(islice(merged, offset, offset + per_page))
+
+        return logs, total + len(archived)
+
+    def _get_archived_logs(self, from_date: datetime = None, to_date: datetime = None, **filters) -> List[AuditLog]:
+        """
+        Повертає архівні записи, якщо діапазон дат сягає за гаряче вікно.
+        Без from_date архів не читається, щоб запит за замовчуванням лишався дешевим.
+        """
+        if not from_date:
+            return []
+
+        from app.services.audit_archive_service import AuditArchiveService
+
+        archive_service = AuditArchiveService()
+        if from_date >= archive_service.hot_cutoff():
+            return []
+
+        return list(archive_service.iter_logs(from_date, to_date, **filters))
 
     def export_to_csv(
         self,
@@ -167,6 +440,7 @@ class AuditService:
     ) -> str:
         """
         Експортує логи в CSV формат.
+        Архівні партиції включаються, якщо from_date сягає за гаряче вікно.
 
         Returns:
             CSV string
@@ -180,6 +454,11 @@ class AuditService:
 
         logs = query.all()
 
+        archived = self._get_archived_logs(from_date, to_date)
+        if archived:
+            archived.sort(key=lambda log: log.timestamp, reverse=True)
+            logs = list(heapq.merge(logs, archived, key=lambda log: log.timestamp, reverse=True))
+
         output = StringIO()
         writer = csv.writer(output)
 
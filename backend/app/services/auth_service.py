@@ -6,28 +6,32 @@ import re
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 
-import bcrypt
 from flask import current_app
 from flask_jwt_extended import create_access_token, create_refresh_token
 
 from app import db
 from app.models import User
+from app.services.password_hasher import PasswordHasher
+from app.services.username_filter import UsernameFilter
+from app.services.token_revocation import TokenRevocationStore
 
 
 class AuthService:
     """Сервіс для роботи з автентифікацією та авторизацією"""
 
     def hash_password(self, password: str) -> str:
-        """Хешує пароль за допомогою bcrypt"""
-        salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_SALT_ROUNDS', 12))
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        """
+        Хешує пароль за допомогою bcrypt у пулі PasswordHasher.
+        PasswordHasherBusy — якщо пул перевантажено.
+        """
+        return PasswordHasher.hash(password)
 
     def verify_password(self, password: str, password_hash: str) -> bool:
-        """Перевіряє пароль"""
-        try:
-            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
-        except Exception:
-            return False
+        """
+        Перевіряє пароль у пулі PasswordHasher.
+        PasswordHasherBusy — якщо пул перевантажено.
+        """
+        return PasswordHasher.verify(password, password_hash)
 
     def validate_password(self, password: str) -> Tuple[bool, Optional[str]]:
         """
@@ -88,12 +92,17 @@ class AuthService:
     def authenticate(self, username: str, password: str, ip_address: str) -> Tuple[Optional[User], Optional[str]]:
         """
         Автентифікує користувача.
-        Повертає (user, None) або (None, повідомлення_помилки)
+        Повертає (user, None) або (user, повідомлення_помилки) — при помилці
+        user — знайдений акаунт (для обліку загроз) або None, якщо його немає
         """
+        # Неіснуюче ім'я (типово для перебору облікових даних) — без запиту до БД
+        if not UsernameFilter.might_exist(username):
+            return None, self._unknown_user(password)
+
         user = User.query.filter_by(username=username, deleted_at=None).first()
 
         if not user:
-            return None, "Невірне ім'я користувача або пароль"
+            return None, self._unknown_user(password)
 
         # Перевірка блокування
         if user.is_blocked:
@@ -108,9 +117,11 @@ class AuthService:
                 if user.blocked_until:
                     delta = user.blocked_until - datetime.utcnow()
                     remaining = f" Спробуйте через {delta.seconds // 60} хвилин."
-                return None, f"Акаунт тимчасово заблоковано.{remaining}"
+                return user, f"Акаунт тимчасово заблоковано.{remaining}"
 
-        # Перевірка пароля
+        # Перевірка пароля — лише після дешевих перевірок вище (rate limit
+        # виконано ще до маршруту); PasswordHasherBusy не рахується як
+        # невдала спроба
         if not self.verify_password(password, user.password_hash):
             user.failed_logins += 1
             max_attempts = current_app.config.get('MAX_FAILED_LOGIN_ATTEMPTS', 5)
@@ -120,10 +131,10 @@ class AuthService:
                 user.is_blocked = True
                 user.blocked_until = datetime.utcnow() + timedelta(minutes=lock_duration)
                 db.session.commit()
-                return None, f"Акаунт заблоковано на {lock_duration} хвилин через занадто багато невдалих спроб"
+                return user, f"Акаунт заблоковано на {lock_duration} хвилин через занадто багато невдалих спроб"
 
             db.session.commit()
-            return None, "Невірне ім'я користувача або пароль"
+            return user, "Невірне ім'я користувача або пароль"
 
         # Успішна автентифікація
         user.failed_logins = 0
@@ -133,6 +144,16 @@ class AuthService:
 
         return user, None
 
+    def _unknown_user(self, password: str) -> str:
+        """
+        Відповідь для неіснуючого користувача. З LOGIN_UNKNOWN_USER_BCRYPT
+        виконується фіктивна перевірка bcrypt, щоб час відповіді не
+        відрізнявся від невірного пароля.
+        """
+        if current_app.config.get('LOGIN_UNKNOWN_USER_BCRYPT', False):
+            PasswordHasher.verify_dummy(password)
+        return "Невірне ім'я користувача або пароль"
+
     def generate_tokens(self, user: User) -> dict:
         """Генерує JWT токени для користувача"""
         additional_claims = {
@@ -177,6 +198,9 @@ class AuthService:
         user.role = new_role
         db.session.commit()
 
+        # Токени зі старою роллю в claims більше не приймаються
+        TokenRevocationStore.revoke_user(user.id, 'role_changed')
+
         return True, None
 
     def block_user(self, user: User, duration_minutes: int = None) -> bool:
@@ -187,12 +211,16 @@ class AuthService:
         else:
             user.blocked_until = None  # Безстрокове блокування
         db.session.commit()
+        TokenRevocationStore.revoke_user(user.id, 'blocked')
         return True
 
     def unblock_user(self, user: User) -> bool:
         """Розблоковує користувача"""
+        from app.services.threat_persister import ThreatPersister
+
         user.is_blocked = False
         user.blocked_until = None
         user.failed_logins = 0
         db.session.commit()
+        ThreatPersister.unblock(user.id)
         return True
@@ -141,12 +141,19 @@ class IntegrityService:
         return results
 
     def get_integrity_stats(self) -> dict:
-        """Отримує статистику цілісності"""
-        files = FileMetadata.query.filter(FileMetadata.deleted_at.is_(None)).all()
-
-        return {
-            'total': len(files),
-            'unchecked': sum(1 for f in files if f.integrity_status == 'unchecked'),
-            'verified': sum(1 for f in files if f.integrity_status == 'verified'),
-            'compromised': sum(1 for f in files if f.integrity_status == 'compromised')
-        }
+        """Отримує статистику цілісності (один GROUP BY запит)"""
+        rows = db.session.query(
+            FileMetadata.integrity_status,
+            db.func.count(FileMetadata.id)
+        ).filter(
+            FileMetadata.deleted_at.is_(None)
+        ).group_by(FileMetadata.integrity_status).all()
+
+        stats = {status: 0 for status in FileMetadata.VALID_INTEGRITY_STATUSES}
+        total = 0
+        for status, count in rows:
+            total += count
+            if status in stats:
+                stats[status] += count
+
+        return {'total': total, **stats}
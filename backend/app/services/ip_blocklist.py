@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Deny-list мереж (радикс-дерево CIDR) та тимчасові бани IP
+"""
+import ipaddress
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import Flask
+
+
+class CidrRadixTree:
+    """
+    Бінарне радикс-дерево префіксів для IPv4 та IPv6.
+
+    Вузол — список [нащадок 0, нащадок 1, мережа або None]. Пошук проходить
+    біти адреси від старшого й зупиняється на першому (найкоротшому)
+    префіксі, що містить адресу: O(довжина префікса), без перебору мереж.
+    """
+
+    __slots__ = ('_roots', 'size')
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: str):
+        net = ipaddress.ip_network(network.strip(), strict=False)
+        node = self._roots[net.version]
+        value = int(net.network_address)
+        bits = net.max_prefixlen
+        for position in range(net.prefixlen):
+            bit = (value >> (bits - 1 - position)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[2] is None:
+            self.size += 1
+        node[2] = str(net)
+
+    def match(self, address) -> Optional[str]:
+        """Мережа, що містить адресу (ipaddress.IPv4Address/IPv6Address), або None"""
+        node = self._roots[address.version]
+        if node[2] is not None:
+            return node[2]
+        value = int(address)
+        bits = address.max_prefixlen
+        for position in range(bits):
+            node = node[(value >> (bits - 1 - position)) & 1]
+            if node is None:
+                return None
+            if node[2] is not None:
+                return node[2]
+        return None
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class IpBlocklist:
+    """
+    Рішення для WSGI-фільтра ThreatDetectorMiddleware — лише з пам'яті процесу:
+        - статичний deny-list (THREAT_IP_DENY_LIST, THREAT_IP_DENY_LIST_FILE) -> 403;
+        - тимчасові бани IP за подіями загроз (THREAT_IP_BAN_SECONDS за типом) -> 429.
+
+    Бани, створені в цьому процесі, діють одразу. Бани з інших воркерів
+    підтягуються з threat_events фоновою задачею (MaintenanceScheduler) кожні
+    THREAT_IP_BAN_SYNC_SECONDS (події, вирішені як false_positive, бан не дають). Мережі з
+    THREAT_IP_BAN_EXEMPT не потрапляють під автоматичні бани.
+    """
+
+    _deny: Optional[CidrRadixTree] = None
+    _exempt: Optional[CidrRadixTree] = None
+    # ip -> (момент завершення за time.time(), тип загрози)
+    _local_bans: Dict[str, Tuple[float, str]] = {}
+    _synced_bans: Dict[str, Tuple[float, str]] = {}
+    _ban_seconds: Dict[str, int] = {}
+    _max_bans = 100000
+    _lock = threading.Lock()
+    _stats = {'denied': 0, 'banned_rejects': 0, 'bans': 0, 'syncs': 0}
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Компілює deny-list та виключення з конфігурації"""
+        config = app.config
+        networks = list(config.get('THREAT_IP_DENY_LIST', []))
+        path = config.get('THREAT_IP_DENY_LIST_FILE')
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as handle:
+                    networks += [line.split('#', 1)[0] for line in handle]
+            except OSError as e:
+                app.logger.error(f"Не вдалося прочитати THREAT_IP_DENY_LIST_FILE: {e}")
+
+        cls._deny = cls._compile(app, [network for network in networks if network.strip()])
+        cls._exempt = cls._compile(app, config.get('THREAT_IP_BAN_EXEMPT', []))
+        cls._ban_seconds = dict(config.get('THREAT_IP_BAN_SECONDS', {}))
+        cls._max_bans = config.get('THREAT_IP_BAN_MAX', 100000)
+
+        from app.services.maintenance import MaintenanceScheduler
+        MaintenanceScheduler.register('ip-bans', config.get('THREAT_IP_BAN_SYNC_SECONDS', 5), cls.sync)
+
+    @staticmethod
+    def _compile(app: Flask, networks: Iterable[str]) -> CidrRadixTree:
+        tree = CidrRadixTree()
+        for network in networks:
+            try:
+                tree.add(network)
+            except ValueError:
+                app.logger.error(f"Невірна мережа в deny-list: {network!r}")
+        return tree
+
+    @staticmethod
+    def parse(ip: str):
+        """ipaddress-об'єкт або None для нерозбірного значення"""
+        try:
+            return ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+    @classmethod
+    def check(cls, ip: str) -> Optional[Tuple[int, str, int]]:
+        """
+        Returns:
+            None — пропустити; інакше (HTTP статус, причина, Retry-After секунд)
+        """
+        address = cls.parse(ip)
+        if address is None:
+            return None
+
+        if cls._deny is not None:
+            network = cls._deny.match(address)
+            if network is not None:
+                cls._stats['denied'] += 1
+                return 403, network, 0
+
+        ban = max(cls._local_bans.get(ip, (0.0, None)), cls._synced_bans.get(ip, (0.0, None)))
+        if ban[1] is not None:
+            remaining = ban[0] - time.time()
+            if remaining > 0:
+                cls._stats['banned_rejects'] += 1
+                return 429, ban[1], int(remaining) + 1
+
+        return None
+
+    @classmethod
+    def ban_for_threat(cls, threat_type: str, ip: str):
+        """Тимчасовий бан IP, якщо для типу загрози задано THREAT_IP_BAN_SECONDS"""
+        seconds = cls._ban_seconds.get(threat_type)
+        if not seconds or not ip:
+            return
+        address = cls.parse(ip)
+        if address is None or (cls._exempt is not None and cls._exempt.match(address)):
+            return
+
+        expires = time.time() + seconds
+        with cls._lock:
+            current = cls._local_bans.get(ip)
+            if current is None and len(cls._local_bans) >= cls._max_bans:
+                cls._purge_expired(cls._local_bans)
+                if len(cls._local_bans) >= cls._max_bans:
+                    return
+            if current is None or current[0] < expires:
+                cls._local_bans[ip] = (expires, threat_type)
+            cls._stats['bans'] += 1
+
+    @classmethod
+    def unban(cls, ip: str):
+        with cls._lock:
+            cls._local_bans.pop(ip, None)
+            cls._synced_bans.pop(ip, None)
+
+    @classmethod
+    def sync(cls):
+        """
+        Перераховує бани з threat_events за найдовший строк бану.
+        Потребує контексту додатку.
+        """
+        from app import db
+        from app.models import ThreatEvent
+
+        if not cls._ban_seconds:
+            return
+
+        longest = max(cls._ban_seconds.values())
+        now = datetime.utcnow()
+        rows = db.session.query(
+            ThreatEvent.ip_address, ThreatEvent.threat_type, db.func.max(ThreatEvent.timestamp)
+        ).filter(
+            ThreatEvent.threat_type.in_(list(cls._ban_seconds)),
+            ThreatEvent.timestamp >= now - timedelta(seconds=longest),
+            db.or_(ThreatEvent.resolution.is_(None), ThreatEvent.resolution != 'false_positive')
+        ).group_by(ThreatEvent.ip_address, ThreatEvent.threat_type).all()
+
+        wall_now = time.time()
+        synced = {}
+        for ip, threat_type, last_seen in rows:
+            address = cls.parse(ip)
+            if address is None or cls._exempt.match(address):
+                continue
+            expires = wall_now + cls._ban_seconds[threat_type] - (now - last_seen).total_seconds()
+            if expires > wall_now and (ip not in synced or synced[ip][0] < expires):
+                synced[ip] = (expires, threat_type)
+
+        with cls._lock:
+            cls._synced_bans = synced
+            cls._purge_expired(cls._local_bans)
+            cls._stats['syncs'] += 1
+
+    @staticmethod
+    def _purge_expired(bans: dict):
+        now = time.time()
+        for ip in [ip for ip, (expires, _) in bans.items() if expires <= now]:
+            del bans[ip]
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['deny_networks'] = len(cls._deny) if cls._deny is not None else 0
+        stats['active_bans'] = len(cls._local_bans) + len(cls._synced_bans)
+        return stats
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Фонові періодичні задачі процесу
+"""
+import atexit
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from flask import Flask
+
+from app import db
+
+
+class MaintenanceScheduler:
+    """
+    Один фоновий потік на процес, що виконує зареєстровані задачі з їхнім
+    інтервалом (скидання агрегатів аудиту, синхронізація списків тощо) —
+    щоб така робота не виконувалась у потоці запиту.
+
+    Потік стартує з першим запитом у процесі (і заново — після fork у
+    воркері gunicorn); CLI-команди його не запускають. on_exit задачі
+    виконується при завершенні процесу.
+    """
+
+    _app: Optional[Flask] = None
+    _tasks: Dict[str, dict] = {}
+    _thread: Optional[threading.Thread] = None
+    _thread_pid: Optional[int] = None
+    _stop = threading.Event()
+    _lock = threading.Lock()
+
+    # Найкоротший крок циклу потоку, с
+    TICK_SECONDS = 1.0
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        cls._app = app
+        app.before_request(cls.ensure_started)
+        atexit.register(cls.shutdown)
+
+    @classmethod
+    def register(cls, name: str, interval: float, func: Callable[[], None],
+                 on_exit: Optional[Callable[[], None]] = None):
+        """
+        Реєструє задачу. interval <= 0 вимикає періодичний запуск
+        (on_exit при цьому зберігається).
+        """
+        with cls._lock:
+            cls._tasks[name] = {
+                'interval': interval,
+                'func': func,
+                'on_exit': on_exit,
+                'next_run': time.monotonic() + interval,
+                'runs': 0,
+                'errors': 0,
+                'last_duration_ms': None
+            }
+
+    @classmethod
+    def ensure_started(cls):
+        """before_request: запускає потік, якщо його немає в цьому процесі"""
+        if cls._thread_pid == os.getpid():
+            return
+
+        with cls._lock:
+            if cls._thread_pid == os.getpid() or cls._app is None:
+                return
+            cls._stop = threading.Event()
+            cls._thread = threading.Thread(target=cls._run, name='maintenance', daemon=True)
+            cls._thread_pid = os.getpid()
+            cls._thread.start()
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        with cls._lock:
+            return {
+                name: {key: task[key] for key in ('interval', 'runs', 'errors', 'last_duration_ms')}
+                for name, task in cls._tasks.items()
+            }
+
+    @classmethod
+    def _run(cls):
+        stop = cls._stop
+        while not stop.wait(cls.TICK_SECONDS):
+            now = time.monotonic()
+            with cls._lock:
+                due = [
+                    (name, task) for name, task in cls._tasks.items()
+                    if task['interval'] > 0 and now >= task['next_run']
+                ]
+            for name, task in due:
+                cls._execute(name, task['func'], task)
+                task['next_run'] = time.monotonic() + task['interval']
+
+    @classmethod
+    def _execute(cls, name: str, func: Callable[[], None], task: dict):
+        started = time.perf_counter()
+        with cls._app.app_context():
+            try:
+                func()
+            except Exception as e:
+                db.session.rollback()
+                task['errors'] += 1
+                cls._app.logger.error(f"Помилка фонової задачі {name}: {e}")
+            finally:
+                db.session.remove()
+        task['runs'] += 1
+        task['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    @classmethod
+    def shutdown(cls):
+        """Зупиняє потік і виконує on_exit задач"""
+        cls._stop.set()
+        if cls._thread is not None and cls._thread_pid == os.getpid():
+            cls._thread.join(timeout=5)
+        if cls._app is None:
+            return
+        for name, task in list(cls._tasks.items()):
+            if task['on_exit']:
+                cls._execute(name, task['on_exit'], task)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Обмежений виконавець bcrypt поза потоками запитів
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app
+
+
+class PasswordHasherBusy(Exception):
+    """Усі слоти bcrypt зайняті або результат не отримано вчасно"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    bcrypt (~250 мс CPU на 12 раундах) виконується в обмеженому пулі потоків
+    (BCRYPT_EXECUTOR='thread', за замовчуванням: bcrypt відпускає GIL на час
+    обчислення) або процесів ('process', forkserver — лише під gunicorn:
+    воркери пулу імпортують __main__ заново).
+
+    Допуск обмежений: одночасно в роботі та в черзі не більше
+    BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT операцій на процес. Понад це виклик
+    одразу завершується PasswordHasherBusy — потік запиту не чекає, а решта
+    потоків gunicorn лишається вільною для інших endpoint-ів. Слот
+    звільняється лише після завершення операції (а не після тайм-ауту
+    очікування), тож завислі обчислення теж враховуються.
+    """
+
+    _executor = None
+    _executor_pid = None
+    _dummy_hash = None
+    _slots = None
+    _lock = threading.Lock()
+    _stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'timeouts': 0, 'in_flight': 0}
+
+    @classmethod
+    def hash(cls, password: str) -> str:
+        # Сіль генерується тут: у пул передаються лише функції bcrypt, тож
+        # воркери не імпортують пакет додатку
+        salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_SALT_ROUNDS', 12))
+        result = cls._run(bcrypt.hashpw, password.encode('utf-8'), salt)
+        cls._stats['hashed'] += 1
+        return result.decode('utf-8')
+
+    @classmethod
+    def hash_sync(cls, password: str) -> str:
+        """
+        Хешування в поточному потоці, поза пулом і допуском — для старту
+        додатку та CLI (початкові користувачі), де пул ще не потрібен.
+        """
+        salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_SALT_ROUNDS', 12))
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @classmethod
+    def verify(cls, password: str, password_hash: str) -> bool:
+        try:
+            result = cls._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError:
+            # Пошкоджений хеш
+            return False
+        cls._stats['verified'] += 1
+        return result
+
+    @classmethod
+    def verify_dummy(cls, password: str) -> bool:
+        """
+        Перевірка з тією ж вартістю, що й для наявного користувача — щоб час
+        відповіді не видавав неіснуючі імена. Завжди False.
+        """
+        if cls._dummy_hash is None:
+            cls._dummy_hash = cls.hash(os.urandom(16).hex())
+        cls.verify(password, cls._dummy_hash)
+        return False
+
+    @classmethod
+    def _run(cls, fn, *args):
+        cls._ensure_executor()
+        if not cls._slots.acquire(blocking=False):
+            cls._stats['rejected'] += 1
+            raise PasswordHasherBusy("Сервер перевантажено, спробуйте пізніше")
+
+        with cls._lock:
+            cls._stats['in_flight'] += 1
+        try:
+            future = cls._executor.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            cls._release(None)
+            cls._reset_executor()
+            raise PasswordHasherBusy("Сервіс перевірки паролів недоступний")
+        future.add_done_callback(cls._release)
+
+        try:
+            return future.result(timeout=current_app.config.get('BCRYPT_TIMEOUT_SECONDS', 5))
+        except FutureTimeoutError:
+            future.cancel()
+            cls._stats['timeouts'] += 1
+            raise PasswordHasherBusy("Перевірка пароля триває надто довго, спробуйте пізніше")
+        except BrokenProcessPool:
+            cls._reset_executor()
+            raise PasswordHasherBusy("Сервіс перевірки паролів недоступний")
+
+    @classmethod
+    def _release(cls, _future: Future = None):
+        with cls._lock:
+            cls._stats['in_flight'] -= 1
+        cls._slots.release()
+
+    @classmethod
+    def _capacity(cls) -> int:
+        config = current_app.config
+        return config.get('BCRYPT_WORKERS', 2) + config.get('BCRYPT_QUEUE_LIMIT', 1)
+
+    @classmethod
+    def _ensure_executor(cls):
+        """Створює пул (і заново після fork у воркері gunicorn)"""
+        if cls._executor is not None and cls._executor_pid == os.getpid():
+            return
+
+        with cls._lock:
+            if cls._executor is not None and cls._executor_pid == os.getpid():
+                return
+            config = current_app.config
+            workers = config.get('BCRYPT_WORKERS', 2)
+
+            if config.get('BCRYPT_EXECUTOR', 'thread') == 'process':
+                cls._executor = ProcessPoolExecutor(max_workers=workers, mp_context=cls._mp_context())
+            else:
+                cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            if cls._executor_pid != os.getpid():
+                # Новий процес: слоти батьківського процесу не успадковуються
+                cls._slots = threading.BoundedSemaphore(cls._capacity())
+                cls._stats['in_flight'] = 0
+                cls._executor_pid = os.getpid()
+
+    @staticmethod
+    def _mp_context():
+        """
+        forkserver: воркери не успадковують потоки, блокування та з'єднання
+        процесу gunicorn (fork у багатопотоковому процесі може успадкувати
+        захоплений lock); у сервер попередньо завантажується лише bcrypt.
+        """
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('spawn')
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['bcrypt'])
+        return context
+
+    @classmethod
+    def _reset_executor(cls):
+        """Зламаний пул (воркер завершився) замінюється при наступному виклику"""
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['executor'] = type(cls._executor).__name__ if cls._executor else None
+        return stats
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Перевірка планів гарячих запитів списку файлів (EXPLAIN QUERY PLAN, SQLite)
+"""
+import re
+from types import SimpleNamespace
+from typing import Iterator, List, Tuple
+
+from app import db
+from app.services.access_policy import AccessPolicy
+from app.services.storage_service import StorageService
+
+
+class QueryPlanChecker:
+    """
+    Будує ті самі запити, що й StorageService (сторінка списку для кожної
+    ролі, вибірки та поля сортування, COUNT, статистика сховища), і перевіряє
+    їхні плани:
+        - жодного повного сканування таблиці (SCAN <таблиця> без індексу);
+        - жодного обходу всього індексу з читанням рядків таблиці, після
+          якого результат ще й сортується (індекс не дав ні порядку, ні
+          покриття);
+        - сторінки, які мають іти в порядку індексу (ORDERED_SCOPES), — без
+          сортування в тимчасовому B-дереві.
+
+    Решта обходів часткового індексу (SCAN ... USING INDEX) допустимі: вони
+    читають лише живі рядки, а для сторінки зупиняються після LIMIT.
+    """
+
+    FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+    INDEX_WALK = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)? USING INDEX (\w+)$')
+    TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+    TEMP_BTREE = 'USE TEMP B-TREE FOR'
+
+    # Вибірки, що впорядковуються індексом: (вибірка, поле) -> чи лише для
+    # ролей з read_all (для решти visible обмежується грантами)
+    ORDERED_SCOPES = {
+        ('own', 'created_at'): False,
+        ('public', 'created_at'): False,
+        ('visible', 'created_at'): True,
+        ('visible', 'original_name'): True,
+        ('visible', 'file_size'): True
+    }
+
+    def __init__(self):
+        self.storage_service = StorageService()
+
+    def hot_queries(self) -> Iterator[Tuple[str, object, bool]]:
+        """(назва, select, чи заборонене тимчасове сортування)"""
+        for role in AccessPolicy.PERMISSIONS:
+            user = SimpleNamespace(id='plan-check', role=role)
+            sees_all = AccessPolicy.can(role, 'files', 'read_all')
+
+            for scope in StorageService.LIST_SCOPES:
+                for sort_by in StorageService.SORT_COLUMNS:
+                    query, ordered = self.storage_service.build_file_list_query(
+                        user, sort_by=sort_by, order='desc', scope=scope
+                    )
+                    admin_only = self.ORDERED_SCOPES.get((scope, sort_by))
+                    expect_ordered = admin_only is not None and (sees_all or not admin_only)
+                    yield (f'list:{role}:{scope}:{sort_by}',
+                           ordered.limit(20).offset(20).statement, expect_ordered)
+
+                yield (f'count:{role}:{scope}',
+                       query.statement.with_only_columns(db.func.count()).order_by(None), False)
+
+            yield (f'stats:{role}',
+                   self.storage_service.build_storage_stats_query(user if not sees_all else None),
+                   False)
+
+    def explain(self, statement) -> List[str]:
+        sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return [row[3] for row in rows]
+
+    def check(self) -> dict:
+        """
+        Returns:
+            {'dialect', 'checked', 'failures': [...], 'plans': {назва: [рядки плану]}}
+        """
+        if db.engine.dialect.name != 'sqlite':
+            raise ValueError('EXPLAIN QUERY PLAN перевіряється лише для SQLite')
+
+        failures = []
+        plans = {}
+        for name, statement, expect_ordered in self.hot_queries():
+            plan = self.explain(statement)
+            plans[name] = plan
+
+            sorts = any(line.startswith(self.TEMP_BTREE) for line in plan)
+            for line in plan:
+                match = self.FULL_SCAN.match(line)
+                if match:
+                    failures.append({'query': name, 'reason': f'повне сканування {match.group(1)}',
+                                     'plan': plan})
+                match = self.INDEX_WALK.match(line)
+                if match and sorts:
+                    failures.append({'query': name, 'plan': plan,
+                                     'reason': f'обхід {match.group(2)} без порядку та покриття'})
+            if expect_ordered and self.TEMP_SORT in plan:
+                failures.append({'query': name, 'reason': 'сортування без індексу', 'plan': plan})
+
+        return {
+            'dialect': db.engine.dialect.name,
+            'checked': len(plans),
+            'failures': failures,
+            'plans': plans
+        }
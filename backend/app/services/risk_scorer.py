@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетна оцінка ризику всіх користувачів
+"""
+import math
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from flask import Flask, current_app
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import AuditLog, FileMetadata, ThreatEvent, User
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy опційний
+    np = None
+
+
+class RiskScorer:
+    """
+    Періодична оцінка ризику для всієї популяції користувачів.
+
+    Ознаки збираються кількома GROUP BY запитами (без запиту на користувача):
+        - події загроз за severity та за threat_type у вікнах RISK_SCORE_WINDOWS
+          (з урахуванням occurrences);
+        - failed_logins, поточний (згаслий) threat_score;
+        - розрізнені IP та обсяг скачувань з аудит-логу за останнє вікно.
+
+    Ознаки складаються в матрицю (користувачі x ознаки), вікна зважуються
+    коефіцієнтами згасання, і ризик обчислюється одним матричним множенням:
+        raw  = X · w
+        risk = 100 · (1 − exp(−raw / RISK_SCORE_SCALE))   ∈ [0, 100)
+
+    Результат записується в users.risk_score одним executemany лише для
+    рядків, де значення змінилось. Без NumPy використовується еквівалентний
+    (повільніший) розрахунок на чистому Python.
+    """
+
+    SEVERITIES = ThreatEvent.VALID_SEVERITIES
+
+    def __init__(self, session=None):
+        self.session = session or db.session
+        config = current_app.config
+        # [(назва, секунд, вага)] від найкоротшого вікна
+        self.windows = sorted(
+            ((name, seconds, weight) for name, (seconds, weight) in config['RISK_SCORE_WINDOWS'].items()),
+            key=lambda item: item[1]
+        )
+        self.weights = config['RISK_SCORE_WEIGHTS']
+        self.type_weights = config.get('RISK_SCORE_TYPE_WEIGHTS', {})
+        self.scale = float(config.get('RISK_SCORE_SCALE', 100))
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Періодичний перерахунок у фоновій задачі процесу (0 — вимкнено, лише CLI)"""
+        from app.services.maintenance import MaintenanceScheduler
+        MaintenanceScheduler.register(
+            'risk-score',
+            app.config.get('RISK_SCORE_INTERVAL_SECONDS', 900),
+            lambda: cls().run()
+        )
+
+    @property
+    def backend(self) -> str:
+        return 'numpy' if np is not None else 'python'
+
+    # ------------------------------------------------------------------
+    # Завантаження ознак
+    # ------------------------------------------------------------------
+
+    def feature_names(self) -> List[str]:
+        """Назви стовпців матриці ознак (до зважування вікон)"""
+        names = [f'severity_{severity}:{window}'
+                 for severity in self.SEVERITIES for window, _, _ in self.windows]
+        names += [f'type_{threat_type}:{window}'
+                  for threat_type in self.type_weights for window, _, _ in self.windows]
+        return names + ['failed_logins', 'threat_score', 'distinct_ips', 'downloads', 'download_mb']
+
+    def load_features(self, now: datetime = None) -> tuple:
+        """
+        Returns:
+            (user_ids, старі risk_score, рядки ознак) — рядок ознак у порядку
+            feature_names(); лічильники вікон кумулятивні (коротше ⊂ довше)
+        """
+        now = now or datetime.utcnow()
+        window_count = len(self.windows)
+        severity_offset = {severity: i * window_count for i, severity in enumerate(self.SEVERITIES)}
+        type_base = len(self.SEVERITIES) * window_count
+        type_offset = {threat_type: type_base + i * window_count
+                       for i, threat_type in enumerate(self.type_weights)}
+        tail = type_base + len(self.type_weights) * window_count
+        width = tail + 5
+
+        users = self.session.query(
+            User.id, User.risk_score, User.failed_logins,
+            User.threat_score, User.threat_score_updated_at
+        ).filter(User.deleted_at.is_(None)).all()
+
+        rows = self._zeros(len(users), width)
+        user_ids, previous, index = [], [], {}
+        for position, (user_id, risk_score, failed_logins, score, updated_at) in enumerate(users):
+            index[user_id] = position
+            user_ids.append(user_id)
+            previous.append(risk_score)
+            row = rows[position]
+            row[tail] = failed_logins or 0
+            row[tail + 1] = User.decay_threat_score(score, updated_at, now)
+
+        # Події загроз: одна агрегація з умовними сумами по всіх вікнах
+        longest = now - timedelta(seconds=self.windows[-1][1])
+        occurrences = db.func.coalesce(ThreatEvent.occurrences, 1)
+        window_sums = [
+            db.func.sum(db.case((ThreatEvent.timestamp >= now - timedelta(seconds=seconds), occurrences), else_=0))
+            for _, seconds, _ in self.windows
+        ]
+        events = self.session.query(
+            ThreatEvent.user_id, ThreatEvent.severity, ThreatEvent.threat_type, *window_sums
+        ).filter(
+            ThreatEvent.user_id.isnot(None),
+            ThreatEvent.timestamp >= longest
+        ).group_by(ThreatEvent.user_id, ThreatEvent.severity, ThreatEvent.threat_type).all()
+
+        for user_id, severity, threat_type, *counts in events:
+            position = index.get(user_id)
+            if position is None:
+                continue
+            row = rows[position]
+            offsets = [severity_offset.get(severity), type_offset.get(threat_type)]
+            for offset in offsets:
+                if offset is None:
+                    continue
+                for i, count in enumerate(counts):
+                    row[offset + i] += count or 0
+
+        # Аудит-лог за перше вікно не коротше доби: розрізнені IP та скачування
+        activity_since = now - timedelta(seconds=self._activity_window())
+        ips = self.session.query(
+            AuditLog.user_id, db.func.count(db.distinct(AuditLog.ip_address))
+        ).filter(
+            AuditLog.user_id.isnot(None),
+            AuditLog.timestamp >= activity_since
+        ).group_by(AuditLog.user_id).all()
+        for user_id, count in ips:
+            if user_id in index:
+                rows[index[user_id]][tail + 2] = count
+
+        downloads = self.session.query(
+            AuditLog.user_id, db.func.count(AuditLog.id), db.func.coalesce(db.func.sum(FileMetadata.file_size), 0)
+        ).outerjoin(
+            FileMetadata, FileMetadata.id == AuditLog.resource_id
+        ).filter(
+            AuditLog.action == 'FILE_DOWNLOADED',
+            AuditLog.status == 'success',
+            AuditLog.user_id.isnot(None),
+            AuditLog.timestamp >= activity_since
+        ).group_by(AuditLog.user_id).all()
+        for user_id, count, size in downloads:
+            if user_id in index:
+                row = rows[index[user_id]]
+                row[tail + 3] = count
+                row[tail + 4] = (size or 0) / (1024 * 1024)
+
+        return user_ids, previous, rows
+
+    @staticmethod
+    def _zeros(count: int, width: int):
+        """Матриця ознак: ndarray з NumPy, інакше список рядків"""
+        if np is not None:
+            return np.zeros((count, width), dtype=np.float64)
+        return [[0.0] * width for _ in range(count)]
+
+    def _activity_window(self) -> int:
+        """Вікно для ознак аудит-логу: перше вікно не коротше доби"""
+        for _, seconds, _ in self.windows:
+            if seconds >= 86400:
+                return seconds
+        return self.windows[-1][1]
+
+    def weight_vector(self) -> List[float]:
+        """
+        Ваги стовпців матриці. Кумулятивні лічильники вікон перетворюються на
+        ексклюзивні (c1, c2 − c1, ...) множенням на різницю сусідніх ваг:
+            Σ w_i·(c_i − c_{i−1}) = Σ c_i·(w_i − w_{i+1})
+        """
+        window_weights = [weight for _, _, weight in self.windows] + [0.0]
+        per_window = [window_weights[i] - window_weights[i + 1] for i in range(len(self.windows))]
+
+        vector = []
+        for severity in self.SEVERITIES:
+            base = self.weights.get(f'severity_{severity}', 0)
+            vector += [base * factor for factor in per_window]
+        for threat_type, base in self.type_weights.items():
+            vector += [base * factor for factor in per_window]
+        vector += [self.weights.get(name, 0)
+                   for name in ('failed_logins', 'threat_score', 'distinct_ips', 'downloads', 'download_mb')]
+        return vector
+
+    # ------------------------------------------------------------------
+    # Оцінка
+    # ------------------------------------------------------------------
+
+    def score(self, rows) -> list:
+        """Ризик для всіх рядків ознак одним векторизованим проходом"""
+        weights = self.weight_vector()
+        # Перший IP — норма, ризиковими вважаються додаткові
+        ip_weight = weights[-3]
+
+        if np is not None:
+            if not len(rows):
+                return []
+            matrix = np.asarray(rows, dtype=np.float64)
+            distinct_ips = matrix[:, -3]
+            raw = matrix @ np.asarray(weights, dtype=np.float64)
+            raw += ip_weight * (np.maximum(distinct_ips - 1, 0) - distinct_ips)
+            risk = 100.0 * -np.expm1(-raw / self.scale)
+            return np.round(risk, 2).tolist()
+
+        scores = []
+        for row in rows:
+            raw = sum(value * weight for value, weight in zip(row, weights))
+            raw += ip_weight * (max(row[-3] - 1, 0) - row[-3])
+            scores.append(round(100.0 * -math.expm1(-raw / self.scale), 2))
+        return scores
+
+    def run(self, now: datetime = None) -> dict:
+        """Завантажує ознаки, оцінює всіх користувачів і записує змінені значення"""
+        now = now or datetime.utcnow()
+
+        started = time.perf_counter()
+        user_ids, previous, rows = self.load_features(now)
+        loaded = time.perf_counter()
+
+        scores = self.score(rows)
+        scored = time.perf_counter()
+
+        updates = [
+            {'uid': user_id, 'risk_score': risk, 'risk_scored_at': now}
+            for user_id, old, risk in zip(user_ids, previous, scores)
+            if old is None or abs(old - risk) >= 0.01
+        ]
+        if updates:
+            users_table = User.__table__
+            self.session.execute(
+                users_table.update().where(users_table.c.id == db.bindparam('uid')),
+                updates
+            )
+        self.session.commit()
+        written = time.perf_counter()
+
+        return {
+            'backend': self.backend,
+            'users': len(user_ids),
+            'features': len(self.feature_names()),
+            'updated': len(updates),
+            'load_ms': round((loaded - started) * 1000, 2),
+            'score_ms': round((scored - loaded) * 1000, 3),
+            'write_ms': round((written - scored) * 1000, 2),
+            'max_risk': max(scores) if scores else 0.0
+        }
+
+    def benchmark(self, users: int = 100000, events_per_user: int = 3, seed: int = 42) -> dict:
+        """
+        Повний прохід run() (завантаження, оцінка, запис) на випадковій
+        популяції в тимчасовій SQLite БД у пам'яті — робоча БД не зачіпається.
+        """
+        import random
+        import uuid
+
+        rng = random.Random(seed)
+        now = datetime.utcnow()
+        longest = self.windows[-1][1]
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
+
+        started = time.perf_counter()
+        user_ids = [str(uuid.uuid4()) for _ in range(users)]
+        with engine.begin() as connection:
+            connection.execute(User.__table__.insert(), [
+                {'id': user_id, 'username': f'bench{i}', 'email': f'bench{i}@bench.local',
+                 'password_hash': '-', 'role': 'user', 'failed_logins': rng.randrange(3),
+                 'threat_score': rng.randrange(50), 'threat_score_updated_at': now}
+                for i, user_id in enumerate(user_ids)
+            ])
+            threat_types = list(ThreatEvent.THREAT_TYPES)
+            connection.execute(ThreatEvent.__table__.insert(), [
+                {'id': str(uuid.uuid4()), 'user_id': rng.choice(user_ids),
+                 'timestamp': now - timedelta(seconds=rng.randrange(longest)),
+                 'threat_type': rng.choice(threat_types), 'severity': rng.choice(self.SEVERITIES),
+                 'score_added': 10, 'ip_address': '10.0.0.1', 'description': 'benchmark',
+                 'occurrences': 1 + rng.randrange(3), 'escalation_level': 0}
+                for _ in range(users * events_per_user)
+            ])
+            connection.execute(AuditLog.__table__.insert(), [
+                {'id': str(uuid.uuid4()), 'user_id': rng.choice(user_ids),
+                 'timestamp': now - timedelta(seconds=rng.randrange(self._activity_window())),
+                 'action': 'FILE_DOWNLOADED', 'ip_address': f'10.0.{rng.randrange(4)}.1',
+                 'status': 'success'}
+                for _ in range(users * events_per_user)
+            ])
+        seeded = time.perf_counter()
+
+        with Session(engine) as session:
+            result = RiskScorer(session).run(now)
+        engine.dispose()
+
+        result['events'] = users * events_per_user
+        result['seed_ms'] = round((seeded - started) * 1000, 2)
+        return result
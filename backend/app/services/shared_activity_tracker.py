@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Спільний між процесами трекер активності на mmap-файлі
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Optional, List, Tuple, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокування лише між потоками одного процесу
+    fcntl = None
+
+from app.services.activity_tracker import ActivityTrackerBackend, UserActivity
+
+
+def wall_seconds() -> int:
+    """
+    Системний час у цілих секундах. Файл трекера переживає перезапуск хоста,
+    а монотонний годинник після нього починається заново — тому епохи кошиків
+    у файлі рахуються від UNIX epoch.
+    """
+    return int(time.time())
+
+
+class SharedMemoryActivityTracker(ActivityTrackerBackend):
+    """
+    Трекер активності, спільний для всіх воркерів на одному хості.
+
+    Стан зберігається у файлі, відображеному в пам'ять (mmap), як хеш-таблиця
+    фіксованих слотів з відкритою адресацією. Кожен слот містить хеш user_id,
+    час останньої активності, останній IP та кільцеві буфери кошиків для
+    кожного лічильника (ті ж вікна, що й у UserActivity).
+
+    Записи захищені смугами (stripes): м'ютекс смуги всередині процесу плюс
+    fcntl-блокування відповідного байта файлу між процесами. Пакет операцій
+    execute() виконується під одним захопленням — атомарне
+    «додати й порахувати вікно» та конвеєр кількох операцій за один прохід.
+    Читання виконується без блокування (можлива похибка в один кошик).
+
+    Хеш user_id — blake2b, а не hash(): PYTHONHASHSEED відрізняється між
+    процесами, тож вбудований hash() дав би різні слоти в різних воркерах.
+
+    Час — системний (wall_seconds): кошики та last_seen з «майбутнього»
+    (годинник переведено назад) не рахуються, а слоти з ними вважаються
+    вільними.
+    """
+
+    BACKEND_TYPE = "shared"
+    MAGIC = b'SCTRACK1'
+    # 2 — епохи від системного часу (у версії 1 — монотонний годинник)
+    VERSION = 2
+    HEADER_SIZE = 64
+    MAX_PROBE = 32
+    IP_SIZE = 48
+
+    # Лічильники та їхні вікна (вікно, розмір кошика)
+    COUNTERS = (
+        ('requests', UserActivity.REQUESTS_WINDOW),
+        ('failed_logins', UserActivity.FAILED_LOGINS_WINDOW),
+        ('downloads', UserActivity.DOWNLOADS_WINDOW),
+        ('deletes', UserActivity.DELETES_WINDOW),
+    )
+
+    # Запис у файлі: key (Q), last_seen (q), last_ip (48s), далі кошики лічильників
+    _SLOT_HEAD = struct.Struct('<Qq48s')
+    _HEADER = struct.Struct('<8sIII')
+
+    def __init__(self, path: str, slots: int = 4096, stripes: int = 16,
+                 clock: Callable[[], int] = wall_seconds):
+        self.path = path
+        self.slots = max(1, slots)
+        self.stripes = max(1, stripes)
+        self._clock = clock
+
+        # Розмітка лічильників: name -> (bucket_seconds, size, epochs_offset, counts_offset)
+        self._layout = {}
+        offset = self._SLOT_HEAD.size
+        for name, (window, bucket) in self.COUNTERS:
+            size = max(1, -(-window // bucket))
+            self._layout[name] = (bucket, size, offset, offset + size * 8)
+            offset += size * 12
+        self.record_size = offset
+
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+        self._acquisitions = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._open()
+
+    # ------------------------------------------------------------------
+    # Файл та блокування
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        """Відкриває (або створює) файл і відображає його в пам'ять"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        size = self.HEADER_SIZE + self.slots * self.record_size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        if fcntl:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self.stripes)
+        try:
+            magic, version, slots, record_size = self._HEADER.unpack(
+                os.pread(self._fd, self._HEADER.size, 0).ljust(self._HEADER.size, b'\0')
+            )
+            if (magic, version, slots, record_size) != (self.MAGIC, self.VERSION, self.slots, self.record_size):
+                # Новий файл або інша розмітка — ініціалізуємо заново
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, self.VERSION, self.slots, self.record_size), 0)
+        finally:
+            if fcntl:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self.stripes)
+
+        self._map = mmap.mmap(self._fd, size)
+
+    def _lock(self, stripe: int):
+        """Захоплює смугу: спершу м'ютекс процесу, потім блокування файлу"""
+        lock = self._locks[stripe]
+        if lock.acquire(blocking=False):
+            self._acquisitions += 1
+        else:
+            started = time.perf_counter()
+            lock.acquire()
+            waited = time.perf_counter() - started
+            self._acquisitions += 1
+            self._contended += 1
+            self._wait_total += waited
+            if waited > self._wait_max:
+                self._wait_max = waited
+
+        if fcntl:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+
+    def _unlock(self, stripe: int):
+        if fcntl:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        self._locks[stripe].release()
+
+    # ------------------------------------------------------------------
+    # Слоти
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _key(user_id: str) -> int:
+        """Стабільний між процесами 64-бітний ключ (0 зарезервовано під порожній слот)"""
+        digest = hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') | 1
+
+    def _offset(self, slot: int) -> int:
+        return self.HEADER_SIZE + slot * self.record_size
+
+    def _slot_head(self, slot: int) -> tuple:
+        return self._SLOT_HEAD.unpack_from(self._map, self._offset(slot))
+
+    def _probe(self, key: int):
+        """Послідовність слотів для ключа"""
+        home = key % self.slots
+        for i in range(min(self.MAX_PROBE, self.slots)):
+            yield (home + i) % self.slots
+
+    def _find(self, key: int) -> Optional[int]:
+        """Пошук слота ключа без блокування"""
+        for slot in self._probe(key):
+            slot_key = self._slot_head(slot)[0]
+            if slot_key == key:
+                return slot
+            if slot_key == 0:
+                return None
+        return None
+
+    def _claim_candidate(self, key: int, now: int) -> int:
+        """Перший порожній або неактивний слот ланцюжка; інакше — найдавніший"""
+        idle_after = UserActivity.FAILED_LOGINS_WINDOW[0]
+        oldest_slot, oldest_seen = None, None
+
+        for slot in self._probe(key):
+            slot_key, last_seen, _ = self._slot_head(slot)
+            if slot_key == 0 or not 0 <= now - last_seen <= idle_after:
+                return slot
+            if oldest_seen is None or last_seen < oldest_seen:
+                oldest_slot, oldest_seen = slot, last_seen
+
+        return oldest_slot
+
+    def _acquire_slot(self, key: int, now: int) -> Tuple[int, int]:
+        """
+        Знаходить або займає слот ключа та захоплює його смугу.
+        Returns: (slot, stripe) — смугу потрібно звільнити через _unlock.
+        """
+        while True:
+            slot = self._find(key)
+            if slot is not None:
+                stripe = slot % self.stripes
+                self._lock(stripe)
+                if self._slot_head(slot)[0] == key:
+                    return slot, stripe
+                self._unlock(stripe)
+                continue
+
+            slot = self._claim_candidate(key, now)
+            stripe = slot % self.stripes
+            self._lock(stripe)
+
+            # Під блокуванням: ключ міг з'явитися в іншому процесі, слот — бути зайнятий
+            if self._find(key) is not None or self._claim_candidate(key, now) != slot:
+                self._unlock(stripe)
+                continue
+
+            offset = self._offset(slot)
+            self._map[offset:offset + self.record_size] = bytes(self.record_size)
+            self._SLOT_HEAD.pack_into(self._map, offset, key, now, b'')
+            return slot, stripe
+
+    # ------------------------------------------------------------------
+    # Кошики
+    # ------------------------------------------------------------------
+
+    def _add(self, offset: int, counter: str, now: int, amount: int = 1):
+        bucket, size, epochs_at, counts_at = self._layout[counter]
+        epoch = now // bucket
+        index = epoch % size
+        # Епоха зберігається як epoch + 1, щоб нульовий слот означав «порожньо»
+        stored = epoch + 1
+        epoch_pos = offset + epochs_at + index * 8
+        count_pos = offset + counts_at + index * 4
+
+        if struct.unpack_from('<q', self._map, epoch_pos)[0] != stored:
+            struct.pack_into('<q', self._map, epoch_pos, stored)
+            struct.pack_into('<I', self._map, count_pos, 0)
+        current = struct.unpack_from('<I', self._map, count_pos)[0]
+        struct.pack_into('<I', self._map, count_pos, min(current + amount, 0xFFFFFFFF))
+
+    def _count(self, offset: int, counter: str, now: int, window_seconds: Optional[int] = None) -> int:
+        bucket, size, epochs_at, counts_at = self._layout[counter]
+        epoch = now // bucket
+        if window_seconds is None:
+            span = size
+        else:
+            span = min(size, max(1, -(-window_seconds // bucket)))
+        # Збережені епохи зсунуті на 1 (див. _add)
+        oldest = epoch - span + 1
+        newest = epoch + 1
+
+        epochs = struct.unpack_from(f'<{size}q', self._map, offset + epochs_at)
+        counts = struct.unpack_from(f'<{size}I', self._map, offset + counts_at)
+        return sum(c for e, c in zip(epochs, counts) if oldest < e <= newest)
+
+    # ------------------------------------------------------------------
+    # Публічний інтерфейс
+    # ------------------------------------------------------------------
+
+    def execute(self, user_id: str, operations: List[Tuple]) -> List[Any]:
+        """Виконує пакет операцій під одним захопленням смуги"""
+        now = self._clock()
+        key = self._key(user_id)
+        results = []
+
+        slot, stripe = self._acquire_slot(key, now)
+        try:
+            offset = self._offset(slot)
+            _, _, raw_ip = self._SLOT_HEAD.unpack_from(self._map, offset)
+            last_ip = raw_ip.rstrip(b'\0').decode('ascii') or None
+
+            for operation in operations:
+                kind = operation[0]
+                if kind == 'request':
+                    ip_address = operation[1]
+                    self._add(offset, 'requests', now)
+                    results.append(last_ip if last_ip and last_ip != ip_address else None)
+                    last_ip = ip_address
+                elif kind == 'add':
+                    self._add(offset, operation[1], now, operation[2])
+                    results.append(None)
+                elif kind == 'count':
+                    results.append(self._count(offset, operation[1], now, operation[2]))
+                elif kind == 'incr_count':
+                    self._add(offset, operation[1], now)
+                    results.append(self._count(offset, operation[1], now, operation[2]))
+                else:
+                    raise ValueError(f"Невідома операція трекера: {kind}")
+
+            ip_bytes = (last_ip or '').encode('ascii', 'ignore')[:self.IP_SIZE]
+            self._SLOT_HEAD.pack_into(self._map, offset, key, now, ip_bytes)
+        finally:
+            self._unlock(stripe)
+
+        return results
+
+    def count(self, user_id: str, counter: str, window_seconds: int = None) -> int:
+        """Кількість подій у вікні лічильника (без блокування)"""
+        slot = self._find(self._key(user_id))
+        if slot is None:
+            return 0
+        return self._count(self._offset(slot), counter, self._clock(), window_seconds)
+
+    def last_ip(self, user_id: str) -> Optional[str]:
+        """Останній IP користувача (без блокування)"""
+        slot = self._find(self._key(user_id))
+        if slot is None:
+            return None
+        return self._slot_head(slot)[2].rstrip(b'\0').decode('ascii') or None
+
+    def lock_stats(self) -> dict:
+        """Статистика захоплень смуг цього процесу та заповненість файлу"""
+        now = self._clock()
+        idle_after = UserActivity.FAILED_LOGINS_WINDOW[0]
+        tracked = 0
+        for slot in range(self.slots):
+            slot_key, last_seen, _ = self._slot_head(slot)
+            if slot_key and 0 <= now - last_seen <= idle_after:
+                tracked += 1
+
+        return {
+            'backend': self.BACKEND_TYPE,
+            'path': self.path,
+            'shards': self.stripes,
+            'slots': self.slots,
+            'tracked_users': tracked,
+            'acquisitions': self._acquisitions,
+            'contended': self._contended,
+            'contention_ratio': round(self._contended / self._acquisitions, 4) if self._acquisitions else 0.0,
+            'wait_total_ms': round(self._wait_total * 1000, 3),
+            'wait_max_ms': round(self._wait_max * 1000, 3),
+            'wait_avg_us': round(self._wait_total / self._contended * 1e6, 3) if self._contended else 0.0
+        }
+
+    def reset(self):
+        """Очищає всі слоти (для всіх процесів) та статистику"""
+        for stripe in range(self.stripes):
+            self._lock(stripe)
+        try:
+            start = self.HEADER_SIZE
+            self._map[start:start + self.slots * self.record_size] = bytes(self.slots * self.record_size)
+        finally:
+            for stripe in reversed(range(self.stripes)):
+                self._unlock(stripe)
+
+        self._acquisitions = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
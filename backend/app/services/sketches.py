@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Імовірнісні структури з фіксованою пам'яттю для виявлення атак з однієї IP
+"""
+import hashlib
+import math
+import threading
+import time
+from array import array
+from typing import Optional
+
+
+def hash64(value: str) -> int:
+    """64-бітний хеш рядка (стабільний між процесами, на відміну від hash())"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch: depth рядків по width лічильників.
+
+    Оцінка ніколи не менша за справжню кількість і перевищує її не більше
+    ніж на e/width * (сума всіх подій) з імовірністю 1 - e^-depth.
+    Індекси рядків — подвійне хешування одного 64-бітного хешу.
+    """
+
+    __slots__ = ('width', 'depth', 'rows', 'total')
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', [0]) * width for _ in range(depth)]
+        self.total = 0
+
+    def _indexes(self, key: str):
+        value = hash64(key)
+        h1, h2 = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key: str, amount: int = 1) -> int:
+        """Додає подію та повертає нову оцінку для ключа"""
+        self.total += amount
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += amount
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def memory_bytes(self) -> int:
+        return self.width * self.depth * 4
+
+
+class HyperLogLog:
+    """
+    HyperLogLog з 2^precision регістрами по байту.
+    Стандартна похибка ~1.04/sqrt(2^precision): 6.5% при precision=8 (256 Б).
+    """
+
+    __slots__ = ('precision', 'size', 'registers')
+
+    def __init__(self, precision: int = 8):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value: str):
+        hashed = hash64(value)
+        index = hashed & (self.size - 1)
+        rest = hashed >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Нове HLL — об'єднання двох множин"""
+        merged = HyperLogLog(self.precision)
+        merged.registers = bytearray(map(max, self.registers, other.registers))
+        return merged
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+
+        # Корекція для малих кардинальностей (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+
+        return int(round(estimate))
+
+
+class BloomFilter:
+    """
+    Bloom filter: відповідь «точно немає» або «можливо є».
+
+    Розмір (біти, кількість хешів) обчислюється з очікуваної кількості
+    елементів і допустимої частки хибних спрацювань. Індекси — подвійне
+    хешування одного 128-бітного blake2b.
+    """
+
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, value: str):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value: str):
+        for index in self._indexes(value):
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(value))
+
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+
+class _IpWindow:
+    """Розрізнені username та користувачі однієї IP у вікні"""
+
+    __slots__ = ('usernames', 'users', 'flagged')
+
+    def __init__(self, precision: int):
+        self.usernames = HyperLogLog(precision)
+        self.users = HyperLogLog(precision)
+        # Типи загроз, уже позначені для IP у цьому вікні
+        self.flagged = set()
+
+
+class FailedLoginSketch:
+    """
+    Невдалі входи за IP-адресою джерела з фіксованою пам'яттю.
+
+    - Count-Min рахує невдачі для всіх IP (width * depth лічильників);
+    - для IP, що набрали min_failures, заводяться два HyperLogLog: розрізнені
+      username (включно з неіснуючими) і розрізнені наявні користувачі;
+      кількість таких IP обмежена max_ips.
+
+    Вікна перемикаються кожні window_seconds: поточне та попереднє зберігаються
+    одночасно. Кількість невдач — поточне вікно плюс попереднє, зважене часткою
+    перекриття (ковзне вікно); HLL — об'єднання обох вікон.
+    """
+
+    def __init__(self, window_seconds: int = 600, width: int = 16384, depth: int = 4,
+                 precision: int = 8, min_failures: int = 3, max_ips: int = 4096):
+        self.window_seconds = window_seconds
+        self.width = width
+        self.depth = depth
+        self.precision = precision
+        self.min_failures = min_failures
+        self.max_ips = max_ips
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._epoch = None
+        self._current = None
+        self._previous = None
+        self._rotate(int(time.monotonic()) // window_seconds)
+
+    def _rotate(self, epoch: int):
+        """Перемикає вікно; після паузи довшої за вікно обидва очищуються"""
+        if self._epoch is not None and epoch == self._epoch + 1:
+            self._previous = self._current
+        else:
+            self._previous = (CountMinSketch(self.width, self.depth), {})
+        self._current = (CountMinSketch(self.width, self.depth), {})
+        self._epoch = epoch
+
+    def record(self, ip_address: str, username: str, user_id: Optional[str] = None,
+               now: float = None) -> dict:
+        """
+        Реєструє невдалий вхід.
+
+        Returns:
+            {'failures', 'distinct_usernames', 'distinct_users', 'flagged', 'tracked'}
+            — оцінки для IP у ковзному вікні; flagged — множина вже позначених
+            типів загроз (змінюється через mark())
+        """
+        now = time.monotonic() if now is None else now
+        epoch = int(now) // self.window_seconds
+        overlap = 1.0 - (now - epoch * self.window_seconds) / self.window_seconds
+
+        with self._lock:
+            if epoch != self._epoch:
+                self._rotate(epoch)
+
+            counts, windows = self._current
+            previous_counts, previous_windows = self._previous
+
+            failures = counts.add(ip_address) + int(previous_counts.estimate(ip_address) * overlap)
+            result = {'failures': failures, 'distinct_usernames': 0, 'distinct_users': 0,
+                      'flagged': set(), 'tracked': False}
+
+            ip_window = windows.get(ip_address)
+            if ip_window is None and failures >= self.min_failures:
+                if len(windows) < self.max_ips:
+                    ip_window = windows[ip_address] = _IpWindow(self.precision)
+                else:
+                    self._dropped += 1
+
+            if ip_window is None:
+                return result
+
+            ip_window.usernames.add(username.lower())
+            if user_id:
+                ip_window.users.add(user_id)
+
+            usernames, users = ip_window.usernames, ip_window.users
+            previous_window = previous_windows.get(ip_address)
+            if previous_window is not None:
+                usernames = usernames.merge(previous_window.usernames)
+                users = users.merge(previous_window.users)
+                ip_window.flagged |= previous_window.flagged
+
+            result.update({
+                'distinct_usernames': usernames.count(),
+                'distinct_users': users.count(),
+                'flagged': ip_window.flagged,
+                'tracked': True
+            })
+            return result
+
+    def mark(self, ip_address: str, threat_type: str):
+        """Позначає тип загрози для IP до кінця поточного та наступного вікна"""
+        with self._lock:
+            ip_window = self._current[1].get(ip_address)
+            if ip_window is not None:
+                ip_window.flagged.add(threat_type)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            tracked = len(self._current[1]) + len(self._previous[1])
+            return {
+                'window_seconds': self.window_seconds,
+                'tracked_ips': len(self._current[1]),
+                'failures_in_window': self._current[0].total,
+                'dropped_ips': self._dropped,
+                'memory_bytes': 2 * self._current[0].memory_bytes() + tracked * 2 * (1 << self.precision)
+            }
+
+
+def create_failed_login_sketch(config: dict) -> FailedLoginSketch:
+    """Створює FailedLoginSketch за параметрами THREAT_SKETCH_* конфігурації"""
+    return FailedLoginSketch(
+        window_seconds=config.get('THREAT_SKETCH_WINDOW_SECONDS', 600),
+        width=config.get('THREAT_SKETCH_CMS_WIDTH', 16384),
+        depth=config.get('THREAT_SKETCH_CMS_DEPTH', 4),
+        precision=config.get('THREAT_SKETCH_HLL_PRECISION', 8),
+        min_failures=config.get('THREAT_SKETCH_TRACK_MIN_FAILURES', 3),
+        max_ips=config.get('THREAT_SKETCH_MAX_TRACKED_IPS', 4096)
+    )
@@ -10,9 +10,11 @@ from typing import Optional, Tuple, List
 import boto3
 from botocore.exceptions import ClientError
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
 
 from app import db
-from app.models import FileMetadata, User
+from app.models import FileGrant, FileMetadata, User
+from app.services.access_policy import AccessPolicy
 from app.services.crypto_service import CryptoService
 from app.services.integrity_service import IntegrityService
 
@@ -179,52 +181,86 @@ class StorageService:
             db.session.rollback()
             return False, f"Внутрішня помилка: {str(e)}"
 
-    def get_file_list(
+    # Поля сортування списку файлів — лише з частковими індексами живих рядків
+    SORT_COLUMNS = {
+        'created_at': FileMetadata.created_at,
+        'original_name': FileMetadata.original_name,
+        'file_size': FileMetadata.file_size
+    }
+
+    # Вибірки списку: visible — усі доступні, own — свої, public — публічні,
+    # shared — ті, якими поділились з користувачем
+    LIST_SCOPES = ('visible', 'own', 'public', 'shared')
+
+    def build_file_list_query(
         self,
         user: User,
-        page: int = 1,
-        per_page: int = 20,
         sort_by: str = 'created_at',
         order: str = 'desc',
-        search: str = None
-    ) -> Tuple[List[FileMetadata], int]:
+        search: str = None,
+        scope: str = 'visible'
+    ):
         """
-        Отримує список файлів з пагінацією.
+        Запит списку файлів без пагінації.
 
         Returns:
-            (files, total_count)
+            (query, ordered_query) — для COUNT та для вибірки сторінки
         """
         query = FileMetadata.query.filter(FileMetadata.deleted_at.is_(None))
 
-        # Фільтрація за роллю
-        if user.role == 'admin':
-            pass  # Бачить всі файли
-        elif user.role == 'user':
-            # Свої + публічні
-            query = query.filter(
-                db.or_(
-                    FileMetadata.user_id == user.id,
-                    FileMetadata.is_public == True
-                )
-            )
-        else:  # guest
-            # Тільки публічні
+        if not AccessPolicy.can(user.role, 'files', 'read'):
+            query = query.filter(db.false())
+        elif scope == 'own':
+            query = query.filter(FileMetadata.user_id == user.id)
+        elif scope == 'public':
             query = query.filter(FileMetadata.is_public == True)
+        elif scope == 'shared':
+            query = query.filter(FileMetadata.id.in_(
+                db.select(FileGrant.file_id).where(
+                    FileGrant.grantee_id == user.id,
+                    FileGrant.permission == 'read'
+                )
+            ))
+        else:
+            # Свої, публічні та спільні — за грантами (admin бачить всі файли)
+            visible = AccessPolicy.visible_files_clause(user)
+            if visible is not None:
+                query = query.filter(visible)
 
         # Пошук за назвою
         if search:
             query = query.filter(FileMetadata.original_name.ilike(f'%{search}%'))
 
         # Сортування
-        sort_column = getattr(FileMetadata, sort_by, FileMetadata.created_at)
+        sort_column = self.SORT_COLUMNS.get(sort_by, FileMetadata.created_at)
         if order == 'desc':
-            query = query.order_by(sort_column.desc())
+            ordered = query.order_by(sort_column.desc())
         else:
-            query = query.order_by(sort_column.asc())
+            ordered = query.order_by(sort_column.asc())
+
+        return query, ordered
+
+    def get_file_list(
+        self,
+        user: User,
+        page: int = 1,
+        per_page: int = 20,
+        sort_by: str = 'created_at',
+        order: str = 'desc',
+        search: str = None,
+        scope: str = 'visible'
+    ) -> Tuple[List[FileMetadata], int]:
+        """
+        Отримує список файлів з пагінацією.
+
+        Returns:
+            (files, total_count)
+        """
+        query, ordered = self.build_file_list_query(user, sort_by, order, search, scope)
 
-        # Пагінація
+        # Пагінація (COUNT — без ORDER BY)
         total = query.count()
-        files = query.offset((page - 1) * per_page).limit(per_page).all()
+        files = ordered.offset((page - 1) * per_page).limit(per_page).all()
 
         return files, total
 
@@ -235,33 +271,159 @@ class StorageService:
         db.session.commit()
         return True
 
+    def get_file_shares(self, file_meta: FileMetadata) -> List[dict]:
+        """Користувачі, з якими поділились файлом"""
+        rows = db.session.query(
+            FileGrant.grantee_id, User.username, FileGrant.created_at
+        ).join(
+            User, User.id == FileGrant.grantee_id
+        ).filter(
+            FileGrant.file_id == file_meta.id,
+            FileGrant.permission == 'read'
+        ).order_by(FileGrant.created_at).all()
+
+        return [
+            {
+                'user_id': row.grantee_id,
+                'username': row.username,
+                'shared_at': row.created_at.isoformat() if row.created_at else None
+            }
+            for row in rows
+        ]
+
+    def share_file(self, file_meta: FileMetadata, grantee: User, granted_by: User) -> Tuple[bool, Optional[str]]:
+        """
+        Надає користувачу доступ на читання файлу.
+
+        Returns:
+            (True, None) або (False, error_message)
+        """
+        if grantee.id == file_meta.user_id:
+            return False, "Власник вже має доступ до файлу"
+
+        exists = db.session.query(FileGrant.id).filter(
+            FileGrant.grantee_id == grantee.id,
+            FileGrant.file_id == file_meta.id
+        ).first()
+        if exists:
+            return False, "Файлом вже поділились з цим користувачем"
+
+        db.session.add(FileGrant(
+            file_id=file_meta.id,
+            grantee_id=grantee.id,
+            permission='read',
+            granted_by=granted_by.id
+        ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Конкурентний запит щойно створив той самий грант
+            db.session.rollback()
+            return False, "Файлом вже поділились з цим користувачем"
+        return True, None
+
+    def unshare_file(self, file_meta: FileMetadata, grantee_id: str) -> bool:
+        """Відкликає доступ користувача; False — доступу не було"""
+        deleted = FileGrant.query.filter(
+            FileGrant.grantee_id == grantee_id,
+            FileGrant.file_id == file_meta.id,
+            FileGrant.permission == 'read'
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted > 0
+
+    def build_storage_stats_query(self, user: User = None):
+        """SELECT для get_storage_stats (COUNT(*) — без читання id з таблиці)"""
+        query = db.select(
+            FileMetadata.is_public,
+            FileMetadata.integrity_status,
+            db.func.count(),
+            db.func.coalesce(db.func.sum(FileMetadata.file_size), 0)
+        ).where(FileMetadata.deleted_at.is_(None))
+
+        if user and not AccessPolicy.can(user.role, 'files', 'read_all'):
+            query = query.where(FileMetadata.user_id == user.id)
+
+        # Порядок GROUP BY не збігається з ix_file_metadata_live_public_created,
+        # тож планувальник обирає покриваючий ix_file_metadata_live_stats
+        return query.group_by(
+            FileMetadata.integrity_status,
+            FileMetadata.is_public
+        )
+
     def get_storage_stats(self, user: User = None) -> dict:
         """
         Отримує статистику сховища.
         Якщо user=None — загальна статистика (для admin).
-        """
-        query = FileMetadata.query.filter(FileMetadata.deleted_at.is_(None))
 
-        if user and user.role != 'admin':
-            query = query.filter(FileMetadata.user_id == user.id)
+        Один GROUP BY запит по покриваючому індексу ix_file_metadata_live_stats,
+        тому пам'ять не залежить від кількості файлів.
+        """
+        rows = db.session.execute(self.build_storage_stats_query(user)).all()
 
-        files = query.all()
+        total_files = 0
+        total_size = 0
+        public_files = 0
+        integrity_stats = {status: 0 for status in FileMetadata.VALID_INTEGRITY_STATUSES}
 
-        total_files = len(files)
-        total_size = sum(f.file_size for f in files)
-        public_files = sum(1 for f in files if f.is_public)
-        private_files = total_files - public_files
-
-        integrity_stats = {
-            'unchecked': sum(1 for f in files if f.integrity_status == 'unchecked'),
-            'verified': sum(1 for f in files if f.integrity_status == 'verified'),
-            'compromised': sum(1 for f in files if f.integrity_status == 'compromised')
-        }
+        for is_public, integrity_status, count, size in rows:
+            total_files += count
+            total_size += size
+            if is_public:
+                public_files += count
+            if integrity_status in integrity_stats:
+                integrity_stats[integrity_status] += count
 
         return {
             'total_files': total_files,
-            'total_size': total_size,
+            'total_size': int(total_size),
             'public_files': public_files,
-            'private_files': private_files,
+            'private_files': total_files - public_files,
             'integrity': integrity_stats
         }
+
+    def get_user_storage_totals(self, limit: int = 50, user_id: str = None) -> List[dict]:
+        """
+        Отримує підсумки сховища по кожному користувачу (GROUP BY user_id).
+
+        Args:
+            limit: Максимальна кількість користувачів (за спаданням розміру)
+            user_id: Обмежити підсумок одним користувачем
+
+        Returns:
+            [{'user_id', 'username', 'total_files', 'total_size', 'public_files'}, ...]
+        """
+        totals = db.session.query(
+            FileMetadata.user_id.label('user_id'),
+            db.func.count(FileMetadata.id).label('total_files'),
+            db.func.coalesce(db.func.sum(FileMetadata.file_size), 0).label('total_size'),
+            db.func.coalesce(
+                db.func.sum(db.case((FileMetadata.is_public == True, 1), else_=0)), 0
+            ).label('public_files')
+        ).filter(FileMetadata.deleted_at.is_(None))
+
+        if user_id:
+            totals = totals.filter(FileMetadata.user_id == user_id)
+
+        totals = totals.group_by(FileMetadata.user_id).subquery()
+
+        rows = db.session.query(
+            totals.c.user_id,
+            User.username,
+            totals.c.total_files,
+            totals.c.total_size,
+            totals.c.public_files
+        ).outerjoin(
+            User, User.id == totals.c.user_id
+        ).order_by(totals.c.total_size.desc()).limit(limit).all()
+
+        return [
+            {
+                'user_id': row.user_id,
+                'username': row.username,
+                'total_files': row.total_files,
+                'total_size': int(row.total_size),
+                'public_files': int(row.public_files)
+            }
+            for row in rows
+        ]
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновий запис подій загроз та змін threat_score
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+
+from flask import Flask, current_app
+
+from app import db
+from app.models import ThreatEvent, User
+
+
+class ThreatPersister:
+    """
+    Черга компактних записів про загрози, яку фоновий потік скидає в БД
+    пакетами: один INSERT (executemany) для нових подій, оновлення відкритих
+    подій та один UPDATE на користувача за пакет для сумарної зміни score.
+
+    Синхронно (в запиті) застосовується лише рішення про автоблокування:
+    користувач потрапляє в множину _blocked, яку middleware перевіряє до
+    обробки запиту — ще до того, як блокування записано в БД. Множина
+    локальна для процесу, тож фонова задача (sync_blocked) звіряє її з БД:
+    користувач, розблокований адміністратором в іншому воркері, зникає з
+    неї не пізніше ніж за THREAT_BLOCK_SYNC_SECONDS.
+
+    THREAT_PERSIST_MODE = 'sync' скидає кожен запис одразу (CLI, налагодження).
+    """
+
+    _app: Optional[Flask] = None
+    _queue: Optional[queue.Queue] = None
+    _thread: Optional[threading.Thread] = None
+    _thread_pid: Optional[int] = None
+    _lock = threading.Lock()
+
+    # Ще не записані зміни score: user_id -> сума
+    _pending_scores: Dict[str, int] = defaultdict(int)
+    # Користувачі, автоматично заблоковані в цьому процесі
+    _blocked: set = set()
+
+    _stats = {'enqueued': 0, 'batches': 0, 'inserted': 0, 'updated': 0,
+              'user_updates': 0, 'sync_fallbacks': 0, 'errors': 0, 'retries': 0,
+              'dropped': 0}
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Прив'язує персистер до додатку (потік стартує при першому записі)"""
+        cls._app = app
+        atexit.register(cls.shutdown)
+
+        from app.services.maintenance import MaintenanceScheduler
+        MaintenanceScheduler.register(
+            'threat-blocks', app.config.get('THREAT_BLOCK_SYNC_SECONDS', 5), cls.sync_blocked
+        )
+
+    # ------------------------------------------------------------------
+    # Запис у чергу (гарячий шлях)
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def enqueue_insert(cls, row: dict, user_id: Optional[str], score_delta: int):
+        """Ставить у чергу нову подію загрози"""
+        cls._enqueue(('insert', row, user_id, score_delta, None))
+
+    @classmethod
+    def enqueue_update(cls, event_id: str, values: dict, user_id: Optional[str] = None,
+                       score_delta: int = 0, open_key: Tuple[str, str] = None):
+        """
+        Ставить у чергу оновлення відкритої (не вирішеної) події.
+        Якщо подію вже вирішено, open_key закривається в ThreatService,
+        а score_delta не застосовується.
+        """
+        cls._enqueue(('update', (event_id, values), user_id, score_delta, open_key))
+
+    @classmethod
+    def _enqueue(cls, record: tuple):
+        user_id, score_delta = record[2], record[3]
+        with cls._lock:
+            cls._stats['enqueued'] += 1
+            if user_id and score_delta:
+                cls._pending_scores[user_id] += score_delta
+
+        if current_app.config.get('THREAT_PERSIST_MODE', 'background') == 'sync':
+            cls._flush_now([record])
+            return
+
+        cls._ensure_thread()
+        try:
+            cls._queue.put_nowait(record)
+        except queue.Full:
+            # Подій безпеки не втрачаємо: при переповненні пишемо синхронно
+            with cls._lock:
+                cls._stats['sync_fallbacks'] += 1
+            cls._flush_now([record])
+
+    @classmethod
+    def _flush_now(cls, batch: List[tuple]):
+        """
+        Синхронний запис у поточному потоці — окремою сесією, щоб не
+        зафіксувати (і не відкотити) незавершену роботу сесії запиту.
+        """
+        with db.session.session_factory() as session:
+            try:
+                cls._flush(batch, session)
+            except Exception:
+                session.rollback()
+                cls._release_pending(batch)
+                raise
+
+    @classmethod
+    def pending_score(cls, user_id: str) -> int:
+        """Сума змін score користувача, що ще не записані в БД"""
+        return cls._pending_scores.get(user_id, 0)
+
+    @classmethod
+    def block(cls, user_id: str):
+        """Синхронне рішення про автоблокування"""
+        with cls._lock:
+            cls._blocked.add(user_id)
+
+    @classmethod
+    def unblock(cls, user_id: str = None):
+        """Знімає автоблокування (user_id=None — для всіх)"""
+        with cls._lock:
+            if user_id is None:
+                cls._blocked.clear()
+            else:
+                cls._blocked.discard(user_id)
+
+    @classmethod
+    def sync_blocked(cls):
+        """
+        Прибирає з _blocked користувачів, не заблокованих у БД (розблоковано
+        адміністратором в іншому воркері або блокування так і не записано).
+        Користувачі з ще не записаними змінами score лишаються — їхнє
+        блокування може бути ще в черзі. Потребує контексту додатку.
+        """
+        with cls._lock:
+            candidates = [user_id for user_id in cls._blocked if user_id not in cls._pending_scores]
+        if not candidates:
+            return
+
+        blocked_in_db = {
+            row.id for row in db.session.query(User.id).filter(
+                User.id.in_(candidates), User.is_blocked == True
+            )
+        }
+        with cls._lock:
+            for user_id in candidates:
+                if user_id not in blocked_in_db and user_id not in cls._pending_scores:
+                    cls._blocked.discard(user_id)
+
+    @classmethod
+    def is_blocked(cls, user_id: str) -> bool:
+        """Чи заблоковано користувача автоматично (без звернення до БД)"""
+        return user_id in cls._blocked
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats['blocked'] = len(cls._blocked)
+        stats['queued'] = cls._queue.qsize() if cls._queue else 0
+        return stats
+
+    # ------------------------------------------------------------------
+    # Фоновий потік
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _ensure_thread(cls):
+        """Запускає потік (і після fork у воркері gunicorn)"""
+        if cls._thread is not None and cls._thread_pid == os.getpid() and cls._thread.is_alive():
+            return
+
+        with cls._lock:
+            if cls._thread is not None and cls._thread_pid == os.getpid() and cls._thread.is_alive():
+                return
+            app = cls._app or current_app._get_current_object()
+            cls._queue = queue.Queue(maxsize=app.config.get('THREAT_PERSIST_QUEUE_SIZE', 10000))
+            cls._thread = threading.Thread(target=cls._run, args=(app,), name='threat-persister', daemon=True)
+            cls._thread_pid = os.getpid()
+            cls._thread.start()
+
+    @classmethod
+    def _run(cls, app: Flask):
+        batch_size = app.config.get('THREAT_PERSIST_BATCH_SIZE', 200)
+        interval = app.config.get('THREAT_PERSIST_FLUSH_INTERVAL_MS', 500) / 1000.0
+        records_queue = cls._queue
+
+        while True:
+            batch = [records_queue.get()]
+            deadline = time.monotonic() + interval
+
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(records_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            with app.app_context():
+                try:
+                    cls._flush_with_retry(app, batch)
+                finally:
+                    db.session.remove()
+                    for _ in batch:
+                        records_queue.task_done()
+
+    @classmethod
+    def _flush_with_retry(cls, app: Flask, batch: List[tuple]):
+        """
+        Записує пакет, повторюючи з експоненційною паузою при помилці
+        (напр. БД тимчасово заблокована). Якщо пакет так і не записано,
+        записи пишуться поодинці — втрачаються (dropped) лише ті, що
+        падають і окремо.
+        """
+        retries = app.config.get('THREAT_PERSIST_RETRIES', 3)
+        backoff = app.config.get('THREAT_PERSIST_RETRY_BACKOFF_MS', 200) / 1000.0
+
+        for attempt in range(retries + 1):
+            try:
+                cls._flush(batch, db.session)
+                return
+            except Exception as e:
+                db.session.rollback()
+                with cls._lock:
+                    cls._stats['errors'] += 1
+                app.logger.warning(
+                    f"Помилка запису пакету загроз ({len(batch)}), спроба {attempt + 1}: {e}"
+                )
+            if attempt < retries:
+                with cls._lock:
+                    cls._stats['retries'] += 1
+                time.sleep(backoff * 2 ** attempt)
+
+        for record in batch:
+            try:
+                cls._flush([record], db.session)
+            except Exception as e:
+                db.session.rollback()
+                cls._release_pending([record])
+                with cls._lock:
+                    cls._stats['dropped'] += 1
+                app.logger.error(f"Запис загрози відкинуто ({record[0]}): {e}")
+
+    @classmethod
+    def flush(cls):
+        """Чекає, доки фоновий потік запише всі записи черги"""
+        if cls._queue is not None and cls._thread_pid == os.getpid():
+            cls._queue.join()
+
+    @classmethod
+    def shutdown(cls):
+        """Дописує чергу при завершенні процесу"""
+        if cls._queue is None or cls._thread_pid != os.getpid():
+            return
+        if cls._thread is not None and cls._thread.is_alive():
+            cls._queue.join()
+            return
+
+        batch = []
+        while True:
+            try:
+                batch.append(cls._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch and cls._app is not None:
+            with cls._app.app_context():
+                cls._flush_now(batch)
+
+    # ------------------------------------------------------------------
+    # Запис пакету
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _flush(cls, batch: List[tuple], session):
+        """Записує пакет: вставки, оновлення подій, один UPDATE на користувача"""
+        from app.services.threat_service import ThreatService
+
+        inserts = [record[1] for record in batch if record[0] == 'insert']
+        deltas: Dict[str, int] = defaultdict(int)
+        updated = 0
+
+        if inserts:
+            session.execute(ThreatEvent.__table__.insert(), inserts)
+
+        for kind, payload, user_id, score_delta, open_key in batch:
+            if kind == 'insert':
+                if user_id and score_delta:
+                    deltas[user_id] += score_delta
+                continue
+
+            event_id, values = payload
+            result = session.execute(
+                ThreatEvent.__table__.update().where(
+                    ThreatEvent.__table__.c.id == event_id,
+                    ThreatEvent.__table__.c.is_resolved == False
+                ).values(**values)
+            )
+            if result.rowcount:
+                updated += 1
+                if user_id and score_delta:
+                    deltas[user_id] += score_delta
+            elif open_key:
+                # Подію вирішено — наступне виявлення відкриє нову
+                ThreatService.close_open_threat(open_key)
+
+        user_rows, newly_blocked = [], []
+        if deltas:
+            users_table = User.__table__
+            now = datetime.utcnow()
+            block_threshold = current_app.config.get('THREAT_SCORE_BLOCK_THRESHOLD', 100)
+
+            rows = session.query(
+                User.id, User.threat_score, User.threat_score_updated_at, User.is_blocked
+            ).filter(User.id.in_(list(deltas))).all()
+
+            for user_id, score, updated_at, is_blocked in rows:
+                new_score = User.decay_threat_score(score, updated_at, now) + deltas[user_id]
+                blocked = bool(is_blocked or new_score >= block_threshold)
+                if blocked and not is_blocked:
+                    newly_blocked.append(user_id)
+                user_rows.append({
+                    'uid': user_id,
+                    'threat_score': new_score,
+                    'threat_score_updated_at': now,
+                    'is_blocked': blocked
+                })
+
+            if user_rows:
+                session.execute(
+                    users_table.update().where(users_table.c.id == db.bindparam('uid')),
+                    user_rows
+                )
+
+        session.commit()
+
+        # Пакетний UPDATE оминає події ORM — знімки інвалідуються явно,
+        # видані токени відкликаються
+        if newly_blocked:
+            from app.services.token_revocation import TokenRevocationStore
+            from app.services.user_cache import UserCache
+            for user_id in newly_blocked:
+                UserCache.invalidate(user_id)
+                TokenRevocationStore.revoke_user(user_id, 'blocked')
+
+        cls._release_pending(batch)
+
+        with cls._lock:
+            cls._stats['batches'] += 1
+            cls._stats['inserted'] += len(inserts)
+            cls._stats['updated'] += updated
+            cls._stats['user_updates'] += len(user_rows)
+
+    @classmethod
+    def _release_pending(cls, batch: List[tuple]):
+        """Знімає записані (або втрачені через помилку) зміни score з очікуваних"""
+        with cls._lock:
+            for record in batch:
+                user_id, score_delta = record[2], record[3]
+                if not (user_id and score_delta):
+                    continue
+                remaining = cls._pending_scores.get(user_id, 0) - score_delta
+                if remaining > 0:
+                    cls._pending_scores[user_id] = remaining
+                else:
+                    cls._pending_scores.pop(user_id, None)
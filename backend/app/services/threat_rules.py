@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Декларативні правила виявлення загроз та їх компіляція
+"""
+import json
+import operator
+from typing import List, Tuple, Dict, Optional
+
+from app.services.activity_tracker import ActivityTrackerBackend, UserActivity
+
+
+class ThreatRule:
+    """
+    Скомпільоване правило:
+        metric       — лічильник трекера ('requests', 'failed_logins', 'downloads', 'deletes')
+        window       — вікно в секундах (не більше вікна лічильника)
+        threshold    — поріг
+        op           — порівняння значення з порогом ('>', '>=')
+        threat_type  — тип події загрози (ThreatEvent.THREAT_TYPES)
+        cooldown     — cooldown повторів, секунд (None — з THREAT_COOLDOWN_SECONDS)
+        description  — шаблон опису з {value} та {window}
+    """
+
+    __slots__ = ('name', 'metric', 'window', 'threshold', 'op', 'compare',
+                 'threat_type', 'cooldown', 'description')
+
+    OPERATORS = {'>': operator.gt, '>=': operator.ge}
+
+    def __init__(self, name: str, metric: str, window: int, threshold: int, threat_type: str,
+                 op: str = '>=', cooldown: int = None, description: str = None):
+        self.name = name
+        self.metric = metric
+        self.window = int(window)
+        self.threshold = threshold
+        self.op = op
+        self.compare = self.OPERATORS[op]
+        self.threat_type = threat_type
+        self.cooldown = cooldown
+        self.description = description or f"{threat_type}: {{value}} подій за {{window}} с"
+
+    def describe(self, value: int) -> str:
+        return self.description.format(value=value, window=self.window)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'metric': self.metric,
+            'window': self.window,
+            'threshold': self.threshold,
+            'op': self.op,
+            'threat_type': self.threat_type,
+            'cooldown': self.cooldown,
+            'description': self.description
+        }
+
+
+class ThreatRuleEngine:
+    """
+    Компілює список правил в оцінювач з одним проходом на подію.
+
+    Для кожної метрики заздалегідь складається пакет операцій трекера:
+    реєстрація події та підрахунок усіх потрібних правилам вікон. Пакет
+    виконується одним викликом execute() (одне захоплення блокування), після
+    чого правила метрики перевіряються на готових значеннях. Нове правило
+    додає лише порівняння, а не ще одне звернення до трекера.
+    """
+
+    # Метрика -> максимальне вікно лічильника трекера, секунд
+    METRICS = {
+        'requests': UserActivity.REQUESTS_WINDOW[0],
+        'failed_logins': UserActivity.FAILED_LOGINS_WINDOW[0],
+        'downloads': UserActivity.DOWNLOADS_WINDOW[0],
+        'deletes': UserActivity.DELETES_WINDOW[0],
+    }
+
+    def __init__(self, rules: List[dict]):
+        self.rules = self.compile(rules)
+        # Метрика -> (вікна для підрахунку, правила)
+        self._plans: Dict[str, Tuple[Tuple[int, ...], Tuple[ThreatRule, ...]]] = {}
+        for metric in self.METRICS:
+            metric_rules = tuple(rule for rule in self.rules if rule.metric == metric)
+            windows = tuple(sorted({rule.window for rule in metric_rules}))
+            self._plans[metric] = (windows, metric_rules)
+
+    # Допустимі поля визначення правила
+    FIELDS = frozenset({'name', 'metric', 'window', 'threshold', 'op', 'threat_type',
+                        'cooldown', 'description'})
+
+    @classmethod
+    def compile(cls, rules: List[dict]) -> List[ThreatRule]:
+        """
+        Перевіряє та компілює визначення правил. ValueError при першій помилці —
+        набір відхиляється повністю.
+        """
+        from app.models import ThreatEvent
+
+        if not isinstance(rules, list):
+            raise ValueError("Правила мають бути списком")
+
+        compiled = []
+        names = set()
+
+        for index, definition in enumerate(rules):
+            if not isinstance(definition, dict):
+                raise ValueError(f"Правило #{index}: очікується об'єкт")
+
+            name = definition.get('name') or f'rule_{index}'
+            if not isinstance(name, str):
+                raise ValueError(f"Правило #{index}: назва має бути рядком")
+            metric = definition.get('metric')
+
+            unknown = set(definition) - cls.FIELDS
+            if unknown:
+                raise ValueError(f"Правило '{name}': невідомі поля {', '.join(sorted(unknown))}")
+            if name in names:
+                raise ValueError(f"Правило '{name}': дублікат назви")
+            if metric not in cls.METRICS:
+                raise ValueError(f"Правило '{name}': невідома метрика '{metric}'")
+            if definition.get('threat_type') not in ThreatEvent.THREAT_TYPES:
+                raise ValueError(f"Правило '{name}': невідомий тип загрози '{definition.get('threat_type')}'")
+            if definition.get('op', '>=') not in ThreatRule.OPERATORS:
+                raise ValueError(f"Правило '{name}': невідоме порівняння '{definition.get('op')}'")
+            if 'threshold' not in definition:
+                raise ValueError(f"Правило '{name}': не задано поріг (threshold)")
+
+            threshold = cls._number(name, 'threshold', definition['threshold'])
+            if threshold < 0:
+                raise ValueError(f"Правило '{name}': поріг не може бути від'ємним")
+
+            window = cls._number(name, 'window', definition.get('window', cls.METRICS[metric]), integer=True)
+            if not 0 < window <= cls.METRICS[metric]:
+                raise ValueError(
+                    f"Правило '{name}': вікно {window} с поза межами лічильника '{metric}' "
+                    f"(до {cls.METRICS[metric]} с)"
+                )
+
+            cooldown = definition.get('cooldown')
+            if cooldown is not None:
+                cooldown = cls._number(name, 'cooldown', cooldown, integer=True)
+                if cooldown < 0:
+                    raise ValueError(f"Правило '{name}': cooldown не може бути від'ємним")
+
+            description = definition.get('description')
+            if description is not None:
+                if not isinstance(description, str):
+                    raise ValueError(f"Правило '{name}': опис має бути рядком")
+                try:
+                    description.format(value=0, window=window)
+                except (KeyError, IndexError, ValueError) as e:
+                    raise ValueError(f"Правило '{name}': некоректний шаблон опису ({e})")
+
+            compiled.append(ThreatRule(
+                name=name,
+                metric=metric,
+                window=window,
+                threshold=threshold,
+                threat_type=definition['threat_type'],
+                op=definition.get('op', '>='),
+                cooldown=cooldown,
+                description=description
+            ))
+            names.add(name)
+
+        return compiled
+
+    @staticmethod
+    def _number(name: str, field: str, value, integer: bool = False):
+        """Число з визначення правила (bool і рядки не приймаються)"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Правило '{name}': {field} має бути числом, отримано {value!r}")
+        if integer:
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(f"Правило '{name}': {field} має бути цілим числом секунд")
+            return int(value)
+        return value
+
+    @classmethod
+    def load_file(cls, path: str) -> List[dict]:
+        """Читає правила з JSON-файлу (список або {'rules': [...]})"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('rules', []) if isinstance(data, dict) else data
+
+    def evaluate(
+        self,
+        tracker: ActivityTrackerBackend,
+        user_id: str,
+        metric: str,
+        ip_address: str = None
+    ) -> Tuple[Optional[str], List[Tuple[ThreatRule, int]]]:
+        """
+        Реєструє подію метрики та перевіряє всі її правила за один прохід.
+
+        Returns:
+            (previous_ip, [(правило, значення), ...]) — previous_ip лише для
+            'requests', якщо IP змінився
+        """
+        windows, rules = self._plans[metric]
+
+        if metric == 'requests':
+            operations = [('request', ip_address)]
+        else:
+            operations = [('add', metric, 1)]
+        operations.extend(('count', metric, window) for window in windows)
+
+        results = tracker.execute(user_id, operations)
+        values = dict(zip(windows, results[1:]))
+
+        triggered = [
+            (rule, values[rule.window])
+            for rule in rules
+            if rule.compare(values[rule.window], rule.threshold)
+        ]
+
+        return (results[0] if metric == 'requests' else None), triggered
@@ -2,77 +2,216 @@
 """
 Сервіс моніторингу та аналізу загроз
 """
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple, Dict
 from collections import defaultdict
+import os
 import threading
 import time
+import uuid
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from flask import current_app
 
 from app import db
 from app.models import ThreatEvent, User
+from app.services.activity_tracker import ActivityTrackerBackend, create_tracker_backend
+from app.services.threat_rules import ThreatRuleEngine
+from app.services.ip_blocklist import IpBlocklist
+from app.services.threat_persister import ThreatPersister
+from app.services.sketches import FailedLoginSketch, create_failed_login_sketch
 
 
 class ThreatService:
     """Сервіс для виявлення та реагування на загрози"""
 
-    # Зберігання даних про активність користувачів в пам'яті
-    # В реальному проекті використовувався б Redis
-    _activity_tracker: Dict[str, Dict] = defaultdict(lambda: {
-        'requests': [],
-        'failed_logins': [],
-        'downloads': [],
-        'deletes': [],
-        'last_ip': None
-    })
-    _lock = threading.Lock()
+    # Бекенд активності користувачів (THREAT_TRACKER_BACKEND):
+    # 'memory' — шарди в пам'яті процесу, 'shared' — mmap-файл для всіх воркерів.
+    # Створюється ліниво з конфігурації застосунку при першому зверненні.
+    _tracker: Optional[ActivityTrackerBackend] = None
+    _tracker_lock = threading.Lock()
 
     @classmethod
-    def track_request(cls, user_id: str, ip_address: str, endpoint: str):
-        """Відстежує запит користувача"""
-        with cls._lock:
-            now = datetime.utcnow()
-            tracker = cls._activity_tracker[user_id]
+    def get_tracker(cls) -> ActivityTrackerBackend:
+        """Lazy initialization бекенду трекера"""
+        if cls._tracker is None:
+            with cls._tracker_lock:
+                if cls._tracker is None:
+                    cls._tracker = create_tracker_backend(current_app.config)
+        return cls._tracker
+
+    # Скомпільовані правила виявлення (THREAT_RULES або THREAT_RULES_FILE)
+    _rule_engine: Optional[ThreatRuleEngine] = None
+    _rules_mtime: Optional[float] = None
+    _rules_checked_at = 0.0
+    _rules_lock = threading.Lock()
 
-            # Очищення старих записів (старше 10 хвилин)
-            cutoff = now - timedelta(minutes=10)
-            tracker['requests'] = [t for t in tracker['requests'] if t > cutoff]
-            tracker['failed_logins'] = [t for t in tracker['failed_logins'] if t > cutoff]
+    @classmethod
+    def get_rule_engine(cls) -> ThreatRuleEngine:
+        """
+        Повертає скомпільований оцінювач правил.
 
-            cutoff_5min = now - timedelta(minutes=5)
-            tracker['downloads'] = [t for t in tracker['downloads'] if t > cutoff_5min]
-            tracker['deletes'] = [t for t in tracker['deletes'] if t > cutoff_5min]
+        Якщо задано THREAT_RULES_FILE, файл перечитується при зміні mtime
+        (перевірка не частіше ніж раз на THREAT_RULES_RELOAD_SECONDS).
+        Некоректний файл не замінює робочі правила.
+        """
+        config = current_app.config
+        now = time.monotonic()
+        if cls._rule_engine is not None and now - cls._rules_checked_at < config.get('THREAT_RULES_RELOAD_SECONDS', 5):
+            return cls._rule_engine
+
+        with cls._rules_lock:
+            cls._rules_checked_at = now
+            path = config.get('THREAT_RULES_FILE')
+
+            if path:
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    mtime = None
+
+                if mtime is not None and (cls._rule_engine is None or mtime != cls._rules_mtime):
+                    # mtime фіксується і при помилці: файл перечитується лише після змін
+                    cls._rules_mtime = mtime
+                    try:
+                        cls._rule_engine = ThreatRuleEngine(ThreatRuleEngine.load_file(path))
+                        current_app.logger.info(
+                            f"Правила виявлення загроз завантажено з {path} ({len(cls._rule_engine.rules)})"
+                        )
+                    except (OSError, ValueError) as e:
+                        current_app.logger.error(f"Не вдалося завантажити правила з {path}: {e}")
+
+            if cls._rule_engine is None:
+                cls._rule_engine = ThreatRuleEngine(config.get('THREAT_RULES', []))
+
+        return cls._rule_engine
 
-            # Додаємо новий запит
-            tracker['requests'].append(now)
+    @classmethod
+    def reload_rules(cls) -> ThreatRuleEngine:
+        """
+        Примусово перекомпілює правила.
+        ValueError (робочі правила залишаються), якщо визначення некоректні.
+        """
+        config = current_app.config
+        path = config.get('THREAT_RULES_FILE')
+
+        with cls._rules_lock:
+            if path:
+                try:
+                    mtime = os.path.getmtime(path)
+                    engine = ThreatRuleEngine(ThreatRuleEngine.load_file(path))
+                except OSError as e:
+                    raise ValueError(f"Не вдалося прочитати {path}: {e}")
+                cls._rules_mtime = mtime
+            else:
+                engine = ThreatRuleEngine(config.get('THREAT_RULES', []))
+
+            cls._rule_engine = engine
+            cls._rules_checked_at = time.monotonic()
 
-            # Перевірка зміни IP
-            if tracker['last_ip'] and tracker['last_ip'] != ip_address:
-                cls._check_ip_change(user_id, tracker['last_ip'], ip_address)
+        return engine
 
-            tracker['last_ip'] = ip_address
+    def record_event(self, user_id: str, metric: str, ip_address: str) -> List[ThreatEvent]:
+        """
+        Реєструє подію активності ('requests', 'failed_logins', 'downloads',
+        'deletes') і перевіряє всі правила метрики за один виклик трекера.
+
+        Returns:
+            Створені (або ескальовані) події загроз
+        """
+        previous_ip, triggered = self.get_rule_engine().evaluate(
+            self.get_tracker(), user_id, metric, ip_address
+        )
+
+        # Перевірка зміни IP
+        if previous_ip:
+            self._check_ip_change(user_id, previous_ip, ip_address)
+
+        threats = []
+        for rule, value in triggered:
+            threat = self.create_threat_event(
+                user_id=user_id,
+                threat_type=rule.threat_type,
+                ip_address=ip_address,
+                description=rule.describe(value),
+                cooldown=rule.cooldown
+            )
+            if threat:
+                threats.append(threat)
+
+        return threats
 
     @classmethod
-    def track_failed_login(cls, user_id: str, ip_address: str):
-        """Відстежує невдалу спробу входу"""
-        with cls._lock:
-            tracker = cls._activity_tracker[user_id]
-            tracker['failed_logins'].append(datetime.utcnow())
+    def _get_count(cls, user_id: str, counter: str, window_seconds: int = None) -> int:
+        """Кількість подій у вікні лічильника (O(кошиків), без блокування)"""
+        return cls.get_tracker().count(user_id, counter, window_seconds)
 
     @classmethod
-    def track_download(cls, user_id: str):
-        """Відстежує скачування файлу"""
-        with cls._lock:
-            tracker = cls._activity_tracker[user_id]
-            tracker['downloads'].append(datetime.utcnow())
+    def get_tracker_stats(cls) -> dict:
+        """Статистика конкуренції за блокування трекера та скетчу невдалих входів"""
+        stats = cls.get_tracker().lock_stats()
+        stats['login_sketch'] = cls.get_login_sketch().get_stats()
+        return stats
+
+    # Невдалі входи за IP-джерелом (Count-Min + HyperLogLog, фіксована пам'ять)
+    _login_sketch: Optional[FailedLoginSketch] = None
 
     @classmethod
-    def track_delete(cls, user_id: str):
-        """Відстежує видалення файлу"""
-        with cls._lock:
-            tracker = cls._activity_tracker[user_id]
-            tracker['deletes'].append(datetime.utcnow())
+    def get_login_sketch(cls) -> FailedLoginSketch:
+        """Lazy initialization скетчу невдалих входів"""
+        if cls._login_sketch is None:
+            with cls._tracker_lock:
+                if cls._login_sketch is None:
+                    cls._login_sketch = create_failed_login_sketch(current_app.config)
+        return cls._login_sketch
+
+    def record_failed_login_source(self, ip_address: str, username: str,
+                                   user_id: str = None) -> List[ThreatEvent]:
+        """
+        Реєструє невдалий вхід за IP-джерелом — і для неіснуючих username.
+
+        CREDENTIAL_STUFFING: багато невдач з однієї IP по багатьох наявних
+        акаунтах. ACCOUNT_SCANNING: багато розрізнених username, більшість
+        з яких не існує. Кожен тип позначається для IP не частіше ніж раз
+        за вікно THREAT_SKETCH_WINDOW_SECONDS.
+
+        Returns:
+            Створені події загроз (без user_id)
+        """
+        sketch = self.get_login_sketch()
+        stats = sketch.record(ip_address, username, user_id)
+        if not stats['tracked']:
+            return []
+
+        rules = current_app.config.get('THREAT_SKETCH_RULES', {})
+        detected = []
+
+        stuffing = rules.get('CREDENTIAL_STUFFING')
+        if stuffing and stats['failures'] >= stuffing['failures'] \
+                and stats['distinct_users'] >= stuffing['distinct_users']:
+            detected.append(('CREDENTIAL_STUFFING',
+                             f"{stats['failures']} невдалих входів з {ip_address} "
+                             f"по ~{stats['distinct_users']} акаунтах"))
+
+        scanning = rules.get('ACCOUNT_SCANNING')
+        if scanning and stats['distinct_usernames'] >= scanning['distinct_usernames'] \
+                and stats['distinct_users'] <= stats['distinct_usernames'] * scanning['max_known_ratio']:
+            detected.append(('ACCOUNT_SCANNING',
+                             f"~{stats['distinct_usernames']} різних логінів з {ip_address}, "
+                             f"існують ~{stats['distinct_users']}"))
+
+        threats = []
+        for threat_type, description in detected:
+            if threat_type in stats['flagged']:
+                continue
+            sketch.mark(ip_address, threat_type)
+            threats.append(self.create_threat_event(
+                threat_type=threat_type,
+                ip_address=ip_address,
+                description=description
+            ))
+
+        return threats
 
     @classmethod
     def _check_ip_change(cls, user_id: str, old_ip: str, new_ip: str):
@@ -83,90 +222,100 @@ class ThreatService:
     def __init__(self):
         self.threat_configs = ThreatEvent.THREAT_TYPES
 
-    def check_brute_force(self, user_id: str, ip_address: str) -> Optional[ThreatEvent]:
-        """Перевіряє на brute force атаку"""
-        with self._lock:
-            tracker = self._activity_tracker.get(user_id, {})
-            failed_logins = tracker.get('failed_logins', [])
-
-            if len(failed_logins) >= 5:
-                return self.create_threat_event(
-                    user_id=user_id,
-                    threat_type='BRUTE_FORCE',
-                    ip_address=ip_address,
-                    description=f"Виявлено {len(failed_logins)} невдалих спроб входу за останні 10 хвилин"
-                )
-        return None
-
-    def check_rapid_requests(self, user_id: str, ip_address: str) -> Optional[ThreatEvent]:
-        """Перевіряє на занадто багато запитів"""
-        with self._lock:
-            tracker = self._activity_tracker.get(user_id, {})
-            requests = tracker.get('requests', [])
-
-            # Перевірка запитів за останню хвилину
-            one_minute_ago = datetime.utcnow() - timedelta(minutes=1)
-            recent_requests = [r for r in requests if r > one_minute_ago]
-
-            if len(recent_requests) > 100:
-                return self.create_threat_event(
-                    user_id=user_id,
-                    threat_type='RAPID_REQUESTS',
-                    ip_address=ip_address,
-                    description=f"Виявлено {len(recent_requests)} запитів за останню хвилину"
-                )
-        return None
-
-    def check_mass_download(self, user_id: str, ip_address: str) -> Optional[ThreatEvent]:
-        """Перевіряє на масове скачування"""
-        with self._lock:
-            tracker = self._activity_tracker.get(user_id, {})
-            downloads = tracker.get('downloads', [])
-
-            if len(downloads) > 20:
-                return self.create_threat_event(
-                    user_id=user_id,
-                    threat_type='MASS_DOWNLOAD',
-                    ip_address=ip_address,
-                    description=f"Виявлено {len(downloads)} скачувань за останні 5 хвилин"
-                )
-        return None
-
-    def check_mass_delete(self, user_id: str, ip_address: str) -> Optional[ThreatEvent]:
-        """Перевіряє на масове видалення"""
-        with self._lock:
-            tracker = self._activity_tracker.get(user_id, {})
-            deletes = tracker.get('deletes', [])
-
-            if len(deletes) > 10:
-                return self.create_threat_event(
-                    user_id=user_id,
-                    threat_type='MASS_DELETE',
-                    ip_address=ip_address,
-                    description=f"Виявлено {len(deletes)} видалень за останні 5 хвилин"
-                )
-        return None
+    # Профілі часу доступу (user_id -> (ZoneInfo, frozenset незвичних годин)),
+    # завантажуються один раз на процес
+    _time_profiles: Dict[str, tuple] = {}
+    _default_time_profile: Optional[tuple] = None
+    # Останнє позначення UNUSUAL_TIME_ACCESS: user_id -> datetime (UTC)
+    _unusual_time_flagged: Dict[str, datetime] = {}
+    _time_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _compile_time_profile(profile: dict) -> tuple:
+        """
+        Компілює профіль {'timezone', 'unusual_hours' | 'working_hours': [from, to]}
+        у (ZoneInfo, frozenset годин за місцевим часом, що вважаються незвичними)
+        """
+        try:
+            zone = ZoneInfo(profile.get('timezone', 'UTC'))
+        except (ZoneInfoNotFoundError, ValueError):
+            current_app.logger.warning(f"Невідомий часовий пояс у профілі: {profile.get('timezone')}, використано UTC")
+            zone = ZoneInfo('UTC')
+
+        if 'working_hours' in profile:
+            start, end = profile['working_hours']
+            working = {h % 24 for h in range(start, end if end > start else end + 24)}
+            hours = frozenset(set(range(24)) - working)
+        else:
+            hours = frozenset(profile.get('unusual_hours', (2, 3, 4)))
+
+        return zone, hours
+
+    @classmethod
+    def _get_time_profile(cls, user_id: str) -> tuple:
+        """Профіль часу доступу користувача (з кешу процесу)"""
+        if cls._default_time_profile is None:
+            cls._default_time_profile = cls._compile_time_profile(
+                current_app.config.get('UNUSUAL_TIME_DEFAULT_PROFILE', {})
+            )
+
+        profiles = current_app.config.get('UNUSUAL_TIME_PROFILES', {})
+        if not profiles:
+            return cls._default_time_profile
+
+        profile = cls._time_profiles.get(user_id)
+        if profile is None:
+            # Профілі задаються за username — одне звернення до БД на користувача
+            username = db.session.query(User.username).filter(User.id == user_id).scalar()
+            if username in profiles:
+                profile = cls._compile_time_profile(profiles[username])
+            else:
+                profile = cls._default_time_profile
+            with cls._time_cache_lock:
+                cls._time_profiles[user_id] = profile
+
+        return profile
 
     def check_unusual_time(self, user_id: str, ip_address: str) -> Optional[ThreatEvent]:
-        """Перевіряє на доступ у незвичний час (02:00-05:00)"""
-        current_hour = datetime.utcnow().hour
+        """
+        Перевіряє на доступ у незвичний час (за замовчуванням 02:00-05:00 UTC,
+        або за профілем користувача з UNUSUAL_TIME_PROFILES).
 
-        if 2 <= current_hour < 5:
-            # Перевіряємо, чи вже є така загроза за останню годину
-            recent_threat = ThreatEvent.query.filter(
-                ThreatEvent.user_id == user_id,
-                ThreatEvent.threat_type == 'UNUSUAL_TIME_ACCESS',
-                ThreatEvent.timestamp > datetime.utcnow() - timedelta(hours=1)
-            ).first()
-
-            if not recent_threat:
-                return self.create_threat_event(
-                    user_id=user_id,
-                    threat_type='UNUSUAL_TIME_ACCESS',
-                    ip_address=ip_address,
-                    description=f"Доступ до системи о {current_hour}:00 UTC"
-                )
-        return None
+        Поза незвичними годинами та для вже позначених користувачів перевірка
+        не звертається до БД.
+        """
+        now = datetime.utcnow()
+        zone, unusual_hours = self._get_time_profile(user_id)
+        local_hour = now.replace(tzinfo=timezone.utc).astimezone(zone).hour
+
+        if local_hour not in unusual_hours:
+            return None
+
+        flagged_at = self._unusual_time_flagged.get(user_id)
+        if flagged_at and now - flagged_at < timedelta(hours=1):
+            return None
+
+        # Промах кешу: подію міг створити інший воркер
+        recent_threat = db.session.query(ThreatEvent.timestamp).filter(
+            ThreatEvent.user_id == user_id,
+            ThreatEvent.threat_type == 'UNUSUAL_TIME_ACCESS',
+            ThreatEvent.timestamp > now - timedelta(hours=1)
+        ).order_by(ThreatEvent.timestamp.desc()).first()
+
+        with self._time_cache_lock:
+            if len(self._unusual_time_flagged) > 10000:
+                self._unusual_time_flagged.clear()
+            self._unusual_time_flagged[user_id] = recent_threat[0] if recent_threat else now
+
+        if recent_threat:
+            return None
+
+        return self.create_threat_event(
+            user_id=user_id,
+            threat_type='UNUSUAL_TIME_ACCESS',
+            ip_address=ip_address,
+            description=f"Доступ до системи о {local_hour}:00 ({zone.key})"
+        )
 
     def check_ip_change(self, user_id: str, old_ip: str, new_ip: str) -> Optional[ThreatEvent]:
         """Перевіряє зміну IP під час сесії"""
@@ -177,51 +326,249 @@ class ThreatService:
             description=f"Зміна IP-адреси з {old_ip} на {new_ip} під час активної сесії"
         )
 
+    # Відкриті події у вікні cooldown: (user_id, threat_type) -> стан повторів
+    _open_threats: Dict[Tuple[str, str], dict] = {}
+    _open_threats_lock = threading.Lock()
+    _open_threats_swept = 0.0
+
     def create_threat_event(
         self,
         threat_type: str,
         ip_address: str,
         description: str,
-        user_id: str = None
-    ) -> ThreatEvent:
-        """Створює подію загрози"""
+        user_id: str = None,
+        cooldown: int = None
+    ) -> Optional[ThreatEvent]:
+        """
+        Створює подію загрози.
+
+        Подія та зміна threat_score ставляться в чергу ThreatPersister і
+        записуються в БД пакетами поза запитом; синхронно приймається лише
+        рішення про автоблокування. Повертає transient ThreatEvent.
+
+        Для типів із THREAT_COOLDOWN_SECONDS (або з явним cooldown правила)
+        повтор у вікні cooldown не створює новий рядок: лічильник відкритої
+        події збільшується в пам'яті та періодично записується. Повертає подію
+        лише при створенні або ескалації, інакше None.
+        """
+        if cooldown is None:
+            cooldown = current_app.config.get('THREAT_COOLDOWN_SECONDS', {}).get(threat_type)
+        if user_id and cooldown:
+            handled, escalated = self._register_repeat(user_id, threat_type, cooldown)
+            if handled:
+                return escalated
+
         config = ThreatEvent.get_threat_config(threat_type)
+        now = datetime.utcnow()
 
         threat_event = ThreatEvent(
+            id=str(uuid.uuid4()),
             user_id=user_id,
             threat_type=threat_type,
             severity=config['severity'],
             score_added=config['score'],
             ip_address=ip_address,
-            description=description
+            description=description,
+            timestamp=now,
+            last_seen_at=now,
+            occurrences=1,
+            escalation_level=0,
+            is_resolved=False
         )
 
-        db.session.add(threat_event)
+        ThreatPersister.enqueue_insert(self._event_row(threat_event), user_id, config['score'])
+
+        # Тимчасовий бан IP у WSGI-фільтрі (для типів з THREAT_IP_BAN_SECONDS)
+        IpBlocklist.ban_for_threat(threat_type, ip_address)
 
-        # Оновлення threat_score користувача
+        # Рішення про блокування — синхронно, запис score — у фоні
         if user_id:
-            user = User.query.get(user_id)
-            if user:
-                user.threat_score += config['score']
-                self._check_score_thresholds(user)
+            self._check_score_thresholds(user_id)
 
-        db.session.commit()
+        if user_id and cooldown:
+            with self._open_threats_lock:
+                self._open_threats[(user_id, threat_type)] = self._open_state(threat_event, cooldown)
 
         return threat_event
 
-    def _check_score_thresholds(self, user: User):
-        """Перевіряє пороги threat_score та вживає заходів"""
-        config = current_app.config
+    @staticmethod
+    def _event_row(event: ThreatEvent) -> dict:
+        """Рядок threat_events для пакетної вставки"""
+        return {
+            column.name: getattr(event, column.key)
+            for column in ThreatEvent.__table__.columns
+        }
 
-        if user.threat_score >= config.get('THREAT_SCORE_BLOCK_THRESHOLD', 100):
-            # Автоматичне блокування
-            user.is_blocked = True
-            current_app.logger.warning(
-                f"Користувача {user.username} автоматично заблоковано (threat_score: {user.threat_score})"
+    @staticmethod
+    def _open_state(event: ThreatEvent, cooldown: int) -> dict:
+        """Стан відкритої події для обліку повторів"""
+        return {
+            'event_id': event.id,
+            'cooldown': cooldown,
+            'user_id': event.user_id,
+            'threat_type': event.threat_type,
+            'severity': event.severity,
+            'score_added': event.score_added,
+            'ip_address': event.ip_address,
+            'description': event.description,
+            'timestamp': event.timestamp,
+            'occurrences': event.occurrences or 1,
+            'level': event.escalation_level or 0,
+            'last_seen': event.last_seen_at or event.timestamp,
+            'flushed_at': datetime.utcnow()
+        }
+
+    @classmethod
+    def close_open_threat(cls, key: Tuple[str, str]):
+        """Закриває відкриту подію (її вирішено): наступне виявлення створить нову"""
+        with cls._open_threats_lock:
+            cls._open_threats.pop(key, None)
+
+    def _get_escalation_policy(self, threat_type: str) -> dict:
+        """Політика ескалації типу загрози (поверх 'default')"""
+        policies = current_app.config.get('THREAT_ESCALATION_POLICIES', {})
+        policy = {'repeats_per_level': 100, 'score_factor': 0.5, 'max_level': 3, 'raise_severity': True}
+        policy.update(policies.get('default', {}))
+        policy.update(policies.get(threat_type, {}))
+        return policy
+
+    def _register_repeat(self, user_id: str, threat_type: str, cooldown: int) -> Tuple[bool, Optional[ThreatEvent]]:
+        """
+        Враховує повторне виявлення у відкритій події.
+
+        Returns:
+            (handled, event): handled=False — відкритої події немає, потрібно
+            створити нову; event — подія після ескалації (інакше None)
+        """
+        key = (user_id, threat_type)
+        now = datetime.utcnow()
+        window = timedelta(seconds=cooldown)
+
+        with self._open_threats_lock:
+            self._sweep_open_threats(now)
+            state = self._open_threats.get(key)
+            if state and now - state['last_seen'] > window:
+                del self._open_threats[key]
+                state = None
+
+        if state is None:
+            # Подію міг відкрити інший воркер — один запит на атаку, не на повтор
+            event = ThreatEvent.query.filter(
+                ThreatEvent.user_id == user_id,
+                ThreatEvent.threat_type == threat_type,
+                ThreatEvent.is_resolved == False,
+                ThreatEvent.last_seen_at >= now - window
+            ).order_by(ThreatEvent.last_seen_at.desc()).first()
+            if event is None:
+                return False, None
+            with self._open_threats_lock:
+                state = self._open_threats.setdefault(key, self._open_state(event, cooldown))
+
+        policy = self._get_escalation_policy(threat_type)
+        flush_interval = timedelta(seconds=current_app.config.get('THREAT_REPEAT_FLUSH_SECONDS', 30))
+
+        with self._open_threats_lock:
+            state['occurrences'] += 1
+            state['last_seen'] = now
+
+            escalate = (
+                policy['repeats_per_level'] > 0
+                and state['level'] < policy['max_level']
+                and state['occurrences'] - 1 >= (state['level'] + 1) * policy['repeats_per_level']
             )
-        elif user.threat_score >= config.get('THREAT_SCORE_WARNING_THRESHOLD', 50):
+            extra_score = 0
+            if escalate:
+                config = ThreatEvent.get_threat_config(threat_type)
+                extra_score = int(round(config['score'] * policy['score_factor']))
+                state['level'] += 1
+                state['score_added'] += extra_score
+                if policy['raise_severity'] and state['severity'] in ThreatEvent.VALID_SEVERITIES:
+                    index = ThreatEvent.VALID_SEVERITIES.index(state['severity'])
+                    state['severity'] = ThreatEvent.VALID_SEVERITIES[
+                        min(index + 1, len(ThreatEvent.VALID_SEVERITIES) - 1)
+                    ]
+            elif now - state['flushed_at'] < flush_interval:
+                return True, None
+            state['flushed_at'] = now
+            snapshot = dict(state)
+
+        values = {
+            'occurrences': db.func.max(ThreatEvent.__table__.c.occurrences, snapshot['occurrences']),
+            'last_seen_at': snapshot['last_seen']
+        }
+        if not escalate:
+            ThreatPersister.enqueue_update(snapshot['event_id'], values, open_key=key)
+            return True, None
+
+        values.update({
+            'escalation_level': db.func.max(ThreatEvent.__table__.c.escalation_level, snapshot['level']),
+            'score_added': snapshot['score_added'],
+            'severity': snapshot['severity']
+        })
+        ThreatPersister.enqueue_update(snapshot['event_id'], values, user_id, extra_score, open_key=key)
+        if extra_score:
+            self._check_score_thresholds(user_id)
+
+        current_app.logger.warning(
+            f"Ескалація загрози {threat_type} (рівень {snapshot['level']}, "
+            f"повторів: {snapshot['occurrences']}) для користувача {user_id}"
+        )
+
+        return True, ThreatEvent(
+            id=snapshot['event_id'],
+            user_id=user_id,
+            threat_type=threat_type,
+            severity=snapshot['severity'],
+            score_added=snapshot['score_added'],
+            ip_address=snapshot['ip_address'],
+            description=snapshot['description'],
+            timestamp=snapshot['timestamp'],
+            last_seen_at=snapshot['last_seen'],
+            occurrences=snapshot['occurrences'],
+            escalation_level=snapshot['level'],
+            is_resolved=False
+        )
+
+    @classmethod
+    def _sweep_open_threats(cls, now: datetime):
+        """Видаляє давно неактивні відкриті події. Викликається під _open_threats_lock."""
+        if time.monotonic() - cls._open_threats_swept < 60:
+            return
+        cls._open_threats_swept = time.monotonic()
+        expired = [
+            key for key, state in cls._open_threats.items()
+            if (now - state['last_seen']).total_seconds() > state['cooldown']
+        ]
+        for key in expired:
+            del cls._open_threats[key]
+
+    def _check_score_thresholds(self, user_id: str):
+        """
+        Перевіряє пороги threat_score (зі згасанням та ще не записаними
+        змінами з черги). Блокування застосовується одразу через
+        ThreatPersister.block; запис is_blocked у БД робить персистер.
+        """
+        config = current_app.config
+
+        row = db.session.query(
+            User.username, User.threat_score, User.threat_score_updated_at, User.is_blocked
+        ).filter(User.id == user_id).first()
+        if row is None:
+            return
+
+        username, threat_score, updated_at, is_blocked = row
+        score = User.decay_threat_score(threat_score, updated_at) + ThreatPersister.pending_score(user_id)
+
+        if score >= config.get('THREAT_SCORE_BLOCK_THRESHOLD', 100):
+            if not is_blocked:
+                # Автоматичне блокування
+                ThreatPersister.block(user_id)
+                current_app.logger.warning(
+                    f"Користувача {username} автоматично заблоковано (threat_score: {score})"
+                )
+        elif score >= config.get('THREAT_SCORE_WARNING_THRESHOLD', 50):
             current_app.logger.warning(
-                f"Підозріла активність користувача {user.username} (threat_score: {user.threat_score})"
+                f"Підозріла активність користувача {username} (threat_score: {score})"
             )
 
     def create_integrity_violation(
@@ -290,6 +637,10 @@ class ThreatService:
 
         db.session.commit()
 
+        # Хибне спрацювання знімає бан IP (інші воркери — при синхронізації)
+        if resolution == 'false_positive' and threat.ip_address:
+            IpBlocklist.unban(threat.ip_address)
+
         return True, None
 
     def get_threats(
@@ -343,11 +694,30 @@ class ThreatService:
             hour = t.timestamp.strftime('%H:00')
             by_hour[hour] += 1
 
-        # Топ користувачів за threat_score
-        top_users = User.query.filter(
+        # Топ користувачів за threat_score зі згасанням (обчислюється в БД);
+        # збережене значення — верхня межа поточного, тому кандидати — лише
+        # рядки з threat_score > 0
+        current_score = User.decayed_threat_score_expr()
+        top_users = db.session.query(User.id, User.username, current_score).filter(
             User.threat_score > 0,
-            User.deleted_at.is_(None)
-        ).order_by(User.threat_score.desc()).limit(5).all()
+            User.deleted_at.is_(None),
+            current_score > 0
+        ).order_by(current_score.desc()).limit(5).all()
+
+        # Кількість подій топ-користувачів — один GROUP BY замість запиту на кожного
+        top_ids = [user_id for user_id, _, _ in top_users]
+        event_counts = dict(
+            db.session.query(ThreatEvent.user_id, db.func.count(ThreatEvent.id)).filter(
+                ThreatEvent.user_id.in_(top_ids),
+                ThreatEvent.timestamp >= since
+            ).group_by(ThreatEvent.user_id).all()
+        ) if top_ids else {}
+
+        # Топ за пакетною оцінкою ризику (індекс по users.risk_score)
+        top_risk = db.session.query(User.id, User.username, User.risk_score).filter(
+            User.deleted_at.is_(None),
+            User.risk_score > 0
+        ).order_by(User.risk_score.desc()).limit(5).all()
 
         # Заблоковані акаунти
         blocked_count = User.query.filter(
@@ -364,31 +734,15 @@ class ThreatService:
             'threat_by_hour': [{'hour': h, 'count': c} for h, c in sorted(by_hour.items())],
             'top_threat_users': [
                 {
-                    'id': u.id,
-                    'username': u.username,
-                    'score': u.threat_score,
-                    'events': ThreatEvent.query.filter(
-                        ThreatEvent.user_id == u.id,
-                        ThreatEvent.timestamp >= since
-                    ).count()
+                    'id': user_id,
+                    'username': username,
+                    'score': score,
+                    'events': event_counts.get(user_id, 0)
                 }
-                for u in top_users
+                for user_id, username, score in top_users
+            ],
+            'top_risk_users': [
+                {'id': user_id, 'username': username, 'risk_score': risk_score}
+                for user_id, username, risk_score in top_risk
             ]
         }
-
-    def decay_threat_scores(self):
-        """
-        Зменшує threat_score всіх користувачів.
-        Викликається періодично (кожні 10 хвилин).
-        """
-        decay_amount = current_app.config.get('THREAT_SCORE_DECAY_AMOUNT', 1)
-
-        users = User.query.filter(
-            User.threat_score > 0,
-            User.deleted_at.is_(None)
-        ).all()
-
-        for user in users:
-            user.threat_score = max(0, user.threat_score - decay_amount)
-
-        db.session.commit()
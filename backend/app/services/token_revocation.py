@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Сховище відкликаних JWT з Bloom-фільтром
+"""
+import calendar
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from flask import Flask, current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import TokenRevocation
+from app.services.sketches import BloomFilter
+
+
+def _epoch(moment: datetime) -> int:
+    """Наївний UTC datetime -> секунди epoch (як iat/exp у JWT)"""
+    return calendar.timegm(moment.utctimetuple())
+
+
+class TokenRevocationStore:
+    """
+    Відкликання токенів за jti та «всі токени користувача до моменту».
+
+    Джерело істини — таблиця token_revocations, спільна для всіх воркерів.
+    Кожен воркер тримає в пам'яті:
+        - Bloom-фільтр відкликаних jti: для невідкликаного токена (майже
+          всі запити) перевірка — кілька бітових проб без звернення до БД;
+          лише «можливо відкликано» перевіряється точним запитом за jti;
+        - точний словник user_id -> revoked_before (записів мало).
+
+    Стан синхронізується з таблицею інкрементально (рядки з created_at після
+    останньої синхронізації) не частіше ніж раз на TOKEN_REVOCATION_SYNC_SECONDS,
+    тож відкликання в іншому воркері діє не пізніше ніж через цей інтервал
+    (у власному воркері — одразу). Раз на TOKEN_REVOCATION_REBUILD_SECONDS
+    фільтр перебудовується лише з непрострочених рядків — перевірка в запиті
+    лише читає таблицю. Прострочені рядки видаляє фонова задача
+    (MaintenanceScheduler) раз на TOKEN_REVOCATION_PURGE_SECONDS.
+    """
+
+    # Перекриття інкрементальної синхронізації: рядки, закомічені з затримкою
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    _bloom: Optional[BloomFilter] = None
+    _user_cutoffs: Dict[str, int] = {}
+    _synced_until: Optional[datetime] = None
+    _next_sync = 0.0
+    _next_rebuild = 0.0
+    _lock = threading.Lock()
+    _stats = {'checks': 0, 'bloom_negative': 0, 'db_lookups': 0, 'revoked': 0,
+              'syncs': 0, 'rebuilds': 0}
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Реєструє фонове видалення прострочених відкликань"""
+        from app.services.maintenance import MaintenanceScheduler
+        MaintenanceScheduler.register(
+            'token-revocations', app.config.get('TOKEN_REVOCATION_PURGE_SECONDS', 3600), cls.purge_expired
+        )
+
+    # ------------------------------------------------------------------
+    # Відкликання
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def revoke_token(cls, payload: dict, reason: str = 'logout'):
+        """Відкликає один токен до кінця строку його дії"""
+        jti = payload['jti']
+        revocation = TokenRevocation(
+            jti=jti,
+            user_id=payload.get('sub'),
+            token_type=payload.get('type'),
+            reason=reason,
+            expires_at=datetime.utcfromtimestamp(payload['exp'])
+        )
+        db.session.add(revocation)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Уже відкликано (повторний logout)
+            db.session.rollback()
+
+        cls._ensure_synced()
+        with cls._lock:
+            cls._bloom.add(jti)
+
+    @classmethod
+    def revoke_user(cls, user_id: str, reason: str, before: datetime = None):
+        """
+        Відкликає всі токени користувача, видані не пізніше before
+        (за замовчуванням — зараз). Рядок живе до закінчення найдовшого
+        строку дії токенів, виданих до цього моменту.
+        """
+        config = current_app.config
+        before = before or datetime.utcnow()
+        lifetime = max(config['JWT_ACCESS_TOKEN_EXPIRES'], config['JWT_REFRESH_TOKEN_EXPIRES'])
+
+        db.session.add(TokenRevocation(
+            user_id=user_id,
+            revoked_before=before,
+            reason=reason,
+            expires_at=before + lifetime
+        ))
+        db.session.commit()
+
+        with cls._lock:
+            cls._set_cutoff(user_id, _epoch(before))
+
+    # ------------------------------------------------------------------
+    # Перевірка (token_in_blocklist_loader)
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def is_revoked(cls, payload: dict) -> bool:
+        """Чи відкликано токен. Без звернення до БД, якщо фільтр відповідає «ні»."""
+        cls._ensure_synced()
+        cls._stats['checks'] += 1
+
+        cutoff = cls._user_cutoffs.get(payload.get('sub'))
+        # iat має точність до секунди: токени тієї ж секунди вважаються відкликаними
+        if cutoff is not None and payload.get('iat', 0) <= cutoff:
+            cls._stats['revoked'] += 1
+            return True
+
+        jti = payload.get('jti')
+        if not jti or jti not in cls._bloom:
+            cls._stats['bloom_negative'] += 1
+            return False
+
+        cls._stats['db_lookups'] += 1
+        revoked = db.session.query(TokenRevocation.id).filter(TokenRevocation.jti == jti).first() is not None
+        if revoked:
+            cls._stats['revoked'] += 1
+        return revoked
+
+    # ------------------------------------------------------------------
+    # Синхронізація між воркерами
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _ensure_synced(cls):
+        now = time.monotonic()
+        if cls._bloom is not None and now < cls._next_sync:
+            return
+
+        with cls._lock:
+            if cls._bloom is not None and now < cls._next_sync:
+                return
+            config = current_app.config
+            if cls._bloom is None or now >= cls._next_rebuild:
+                cls._rebuild()
+                cls._next_rebuild = now + config.get('TOKEN_REVOCATION_REBUILD_SECONDS', 3600)
+            else:
+                cls._sync()
+            cls._next_sync = now + config.get('TOKEN_REVOCATION_SYNC_SECONDS', 2)
+
+    @classmethod
+    def _rebuild(cls):
+        """Будує фільтр заново з непрострочених рядків (лише читання). Під _lock."""
+        config = current_app.config
+        now = datetime.utcnow()
+
+        rows = db.session.query(
+            TokenRevocation.jti, TokenRevocation.user_id,
+            TokenRevocation.revoked_before, TokenRevocation.created_at
+        ).filter(TokenRevocation.expires_at >= now).all()
+
+        jti_count = sum(1 for row in rows if row.jti)
+        bloom = BloomFilter(
+            capacity=max(config.get('TOKEN_REVOCATION_BLOOM_CAPACITY', 100000), 2 * jti_count),
+            error_rate=config.get('TOKEN_REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        )
+
+        cls._user_cutoffs = {}
+        cls._synced_until = None
+        cls._bloom = bloom
+        cls._apply(rows)
+        cls._synced_until = cls._synced_until or now
+        cls._stats['rebuilds'] += 1
+
+    @classmethod
+    def purge_expired(cls) -> int:
+        """
+        Видаляє відкликання, чиї токени вже прострочені самі по собі.
+        Фонова задача; потребує контексту додатку.
+        """
+        deleted = TokenRevocation.query.filter(
+            TokenRevocation.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    @classmethod
+    def _sync(cls):
+        """Додає рядки, створені після останньої синхронізації. Під _lock."""
+        rows = db.session.query(
+            TokenRevocation.jti, TokenRevocation.user_id,
+            TokenRevocation.revoked_before, TokenRevocation.created_at
+        ).filter(
+            TokenRevocation.created_at >= cls._synced_until - cls.SYNC_OVERLAP
+        ).all()
+        cls._apply(rows)
+        cls._stats['syncs'] += 1
+
+    @classmethod
+    def _apply(cls, rows):
+        for jti, user_id, revoked_before, created_at in rows:
+            if jti:
+                cls._bloom.add(jti)
+            elif user_id and revoked_before:
+                cls._set_cutoff(user_id, _epoch(revoked_before))
+            if cls._synced_until is None or created_at > cls._synced_until:
+                cls._synced_until = created_at
+
+    @classmethod
+    def _set_cutoff(cls, user_id: str, cutoff: int):
+        if cutoff > cls._user_cutoffs.get(user_id, -1):
+            cls._user_cutoffs[user_id] = cutoff
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['users_with_cutoff'] = len(cls._user_cutoffs)
+        if cls._bloom is not None:
+            stats['bloom_items'] = cls._bloom.count
+            stats['bloom_bytes'] = cls._bloom.memory_bytes()
+        return stats
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Кеш знімків користувачів для JWT та RBAC
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from flask import Flask, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import User
+
+
+class UserSnapshot(NamedTuple):
+    """
+    Незмінний знімок користувача для ідентифікації та перевірки прав.
+    Сумісний з User у тому, що читають маршрути та сервіси: id, username,
+    role, is_active(), can_access().
+    """
+    id: str
+    username: str
+    role: str
+    is_blocked: bool
+    blocked_until: Optional[datetime]
+    deleted: bool
+    version: int
+
+    def is_active(self) -> bool:
+        """Як User.is_active(), але без зміни стану"""
+        if self.deleted:
+            return False
+        if self.is_blocked:
+            return bool(self.blocked_until and datetime.utcnow() > self.blocked_until)
+        return True
+
+    def can_access(self, action: str) -> bool:
+        return User.can_access(self, action)
+
+    def load(self) -> Optional[User]:
+        """Повний об'єкт User з БД (для змін і повної серіалізації)"""
+        return db.session.get(User, self.id)
+
+
+class UserCache:
+    """
+    Кеш знімків користувачів у процесі з TTL (USER_CACHE_TTL_SECONDS).
+
+    Інвалідація — через лічильник версій на користувача: будь-яка зміна
+    role, is_blocked, blocked_until або deleted_at через ORM (а також
+    пакетні оновлення ThreatPersister) збільшує версію та видаляє знімок.
+    Знімок, прочитаний з БД до інвалідації, не потрапляє в кеш — версія
+    на момент читання вже не збігається. Інші воркери бачать зміни не
+    пізніше ніж через TTL.
+    """
+
+    # Поля, зміна яких робить знімок недійсним
+    TRACKED_FIELDS = ('role', 'is_blocked', 'blocked_until', 'deleted_at', 'username')
+
+    # user_id -> (знімок або None для відсутніх, момент завершення TTL)
+    _entries: Dict[str, Tuple[Optional[UserSnapshot], float]] = {}
+    _versions: Dict[str, int] = {}
+    # Загальна версія — для інвалідації всіх користувачів
+    _generation = 0
+    _lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    _listeners_installed = False
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Підписується на зміни User через події SQLAlchemy"""
+        if cls._listeners_installed:
+            return
+        event.listen(User, 'after_update', cls._after_update)
+        event.listen(Session, 'after_commit', cls._after_commit)
+        cls._listeners_installed = True
+
+    @classmethod
+    def get(cls, user_id: str) -> Optional[UserSnapshot]:
+        """Знімок активного (не видаленого) користувача або None"""
+        ttl = current_app.config.get('USER_CACHE_TTL_SECONDS', 30)
+        now = time.monotonic()
+
+        entry = cls._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            cls._stats['hits'] += 1
+            snapshot = entry[0]
+            return snapshot if snapshot is not None and not snapshot.deleted else None
+
+        cls._stats['misses'] += 1
+        generation, version = cls._generation, cls._versions.get(user_id, 0)
+
+        row = db.session.query(
+            User.id, User.username, User.role, User.is_blocked, User.blocked_until, User.deleted_at
+        ).filter(User.id == user_id).first()
+
+        snapshot = None
+        if row is not None:
+            snapshot = UserSnapshot(
+                id=row.id,
+                username=row.username,
+                role=row.role,
+                is_blocked=bool(row.is_blocked),
+                blocked_until=row.blocked_until,
+                deleted=row.deleted_at is not None,
+                version=version
+            )
+
+        if ttl > 0:
+            with cls._lock:
+                # Інвалідація під час читання — знімок міг застаріти
+                if cls._generation == generation and cls._versions.get(user_id, 0) == version:
+                    if len(cls._entries) >= current_app.config.get('USER_CACHE_MAX_SIZE', 10000):
+                        cls._evict(now)
+                    cls._entries[user_id] = (snapshot, now + ttl)
+
+        return snapshot if snapshot is not None and not snapshot.deleted else None
+
+    @classmethod
+    def invalidate(cls, user_id: str = None):
+        """Збільшує версію та видаляє знімок (user_id=None — усі)"""
+        with cls._lock:
+            cls._stats['invalidations'] += 1
+            if user_id is None:
+                cls._generation += 1
+                cls._entries.clear()
+                return
+            cls._versions[user_id] = cls._versions.get(user_id, 0) + 1
+            cls._entries.pop(user_id, None)
+
+    @classmethod
+    def _evict(cls, now: float):
+        """Видаляє прострочені знімки; якщо таких немає — очищує кеш. Під _lock."""
+        expired = [key for key, (_, expires) in cls._entries.items() if expires <= now]
+        for key in expired:
+            del cls._entries[key]
+        if not expired:
+            cls._entries.clear()
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['size'] = len(cls._entries)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Події SQLAlchemy
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _after_update(cls, mapper, connection, target: User):
+        state = db.inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in cls.TRACKED_FIELDS):
+            cls.invalidate(target.id)
+            # Повторно після commit: конкурентне читання могло бачити старий рядок
+            session = state.session
+            if session is not None:
+                session.info.setdefault('user_cache_invalidate', set()).add(target.id)
+
+    @classmethod
+    def _after_commit(cls, session: Session):
+        for user_id in session.info.pop('user_cache_invalidate', ()):
+            cls.invalidate(user_id)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Bloom-фільтр імен користувачів для швидкої відмови при вході
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import Flask, current_app
+from sqlalchemy import event
+
+from app import db
+from app.models import User
+from app.services.sketches import BloomFilter
+
+
+class UsernameFilter:
+    """
+    Множина наявних username у пам'яті воркера.
+
+    «Точно немає» дозволяє відповісти на вхід з неіснуючим іменем без запитів
+    до БД (перебір облікових даних — переважно саме такі імена). «Можливо є»
+    завжди перевіряється в БД, тож хибні спрацювання лише повертають звичайний
+    шлях.
+
+    Наповнення:
+        - повна побудова при старті та раз на USERNAME_FILTER_REBUILD_SECONDS
+          (або коли видалених імен накопичилось понад 10%);
+        - нові користувачі цього воркера — одразу (подія after_insert);
+        - нові користувачі інших воркерів — інкрементально за created_at, не
+          частіше ніж раз на USERNAME_FILTER_SYNC_SECONDS і лише коли фільтр
+          відповів «немає». Користувач, зареєстрований в іншому воркері,
+          може до цього інтервалу отримувати «невірний логін».
+    """
+
+    # Перекриття інкрементальної синхронізації: рядки, закомічені з затримкою
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    _bloom: Optional[BloomFilter] = None
+    _synced_until: Optional[datetime] = None
+    _next_sync = 0.0
+    _next_rebuild = 0.0
+    _stale = 0
+    _lock = threading.Lock()
+    _stats = {'checks': 0, 'rejected': 0, 'syncs': 0, 'rebuilds': 0}
+    _listeners_installed = False
+
+    @classmethod
+    def init_app(cls, app: Flask):
+        """Підписується на нових і видалених користувачів та будує фільтр"""
+        if not cls._listeners_installed:
+            event.listen(User, 'after_insert', cls._after_insert)
+            event.listen(User, 'after_update', cls._after_update)
+            cls._listeners_installed = True
+        if app.config.get('USERNAME_FILTER_ENABLED', True):
+            with app.app_context():
+                with cls._lock:
+                    cls._rebuild()
+
+    @classmethod
+    def might_exist(cls, username: str) -> bool:
+        """False — користувача з таким username точно немає"""
+        config = current_app.config
+        if not config.get('USERNAME_FILTER_ENABLED', True):
+            return True
+
+        cls._stats['checks'] += 1
+        now = time.monotonic()
+        if cls._bloom is None or now >= cls._next_rebuild:
+            with cls._lock:
+                if cls._bloom is None or now >= cls._next_rebuild:
+                    cls._rebuild()
+
+        if username in cls._bloom:
+            return True
+
+        # Перш ніж відмовити — підтягнути реєстрації з інших воркерів
+        if now >= cls._next_sync:
+            with cls._lock:
+                if now >= cls._next_sync:
+                    cls._sync()
+            if username in cls._bloom:
+                return True
+
+        cls._stats['rejected'] += 1
+        return False
+
+    @classmethod
+    def _rebuild(cls):
+        """Будує фільтр з усіх наявних імен. Під _lock."""
+        config = current_app.config
+        started = datetime.utcnow()
+        usernames = [row.username for row in
+                     db.session.query(User.username).filter(User.deleted_at.is_(None))]
+
+        bloom = BloomFilter(
+            capacity=max(config.get('USERNAME_FILTER_CAPACITY', 100000), 2 * len(usernames)),
+            error_rate=config.get('USERNAME_FILTER_ERROR_RATE', 0.01)
+        )
+        for username in usernames:
+            bloom.add(username)
+
+        now = time.monotonic()
+        cls._bloom = bloom
+        cls._stale = 0
+        cls._synced_until = started
+        cls._next_sync = now + config.get('USERNAME_FILTER_SYNC_SECONDS', 2)
+        cls._next_rebuild = now + config.get('USERNAME_FILTER_REBUILD_SECONDS', 3600)
+        cls._stats['rebuilds'] += 1
+
+    @classmethod
+    def _sync(cls):
+        """Додає користувачів, створених після останньої синхронізації. Під _lock."""
+        started = datetime.utcnow()
+        rows = db.session.query(User.username).filter(
+            User.created_at >= cls._synced_until - cls.SYNC_OVERLAP
+        ).all()
+        for row in rows:
+            cls._bloom.add(row.username)
+
+        cls._synced_until = started
+        cls._next_sync = time.monotonic() + current_app.config.get('USERNAME_FILTER_SYNC_SECONDS', 2)
+        cls._stats['syncs'] += 1
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['stale'] = cls._stale
+        if cls._bloom is not None:
+            stats['size'] = cls._bloom.count
+            stats['bytes'] = cls._bloom.memory_bytes()
+        return stats
+
+    # ------------------------------------------------------------------
+    # Події SQLAlchemy
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _after_insert(cls, mapper, connection, target: User):
+        # Додається ще до commit: відкат лише лишає зайве «можливо є»
+        if cls._bloom is not None:
+            with cls._lock:
+                cls._bloom.add(target.username)
+
+    @classmethod
+    def _after_update(cls, mapper, connection, target: User):
+        # Видалити з Bloom-фільтра неможливо: накопичені видалення
+        # прибираються позачерговою перебудовою
+        if target.deleted_at is None or cls._bloom is None:
+            return
+        if not db.inspect(target).attrs.deleted_at.history.has_changes():
+            return
+        with cls._lock:
+            cls._stale += 1
+            if cls._stale * 10 > cls._bloom.count:
+                cls._next_rebuild = 0.0
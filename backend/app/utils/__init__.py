@@ -4,6 +4,7 @@
 """
 from app.utils.helpers import (
     get_client_ip,
+    get_environ_client_ip,
     parse_datetime,
     format_file_size,
     sanitize_filename
@@ -11,6 +12,7 @@ from app.utils.helpers import (
 
 __all__ = [
     'get_client_ip',
+    'get_environ_client_ip',
     'parse_datetime',
     'format_file_size',
     'sanitize_filename'
@@ -6,18 +6,44 @@ import re
 from datetime import datetime
 from typing import Optional
 
-from flask import request
+from flask import current_app, g, request
 
 
 def get_client_ip() -> str:
     """
-    Отримує IP-адресу клієнта з урахуванням проксі.
+    Отримує IP-адресу клієнта (з урахуванням довірених проксі, TRUSTED_PROXIES).
+    Обчислюється один раз на запит і зберігається в g.client_ip
+    (g прив'язується до об'єкта запиту: контекст додатку може бути спільним
+    для кількох запитів, напр. у CLI чи тестовому клієнті).
     """
-    if request.headers.get('X-Forwarded-For'):
-        return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    if request.headers.get('X-Real-IP'):
-        return request.headers.get('X-Real-IP')
-    return request.remote_addr or '0.0.0.0'
+    current_request = request._get_current_object()
+    if g.get('client_ip_request') is current_request:
+        return g.client_ip
+
+    ip_address = get_environ_client_ip(request.environ, current_app.config.get('TRUSTED_PROXIES', 0))
+    g.client_ip = ip_address
+    g.client_ip_request = current_request
+    return ip_address
+
+
+def get_environ_client_ip(environ: dict, trusted_proxies: int = 0) -> str:
+    """
+    IP-адреса клієнта з WSGI environ — та сама логіка і для WSGI-фільтра до Flask.
+
+    За замовчуванням — адреса з'єднання (REMOTE_ADDR): заголовки клієнт може
+    підробити. За trusted_proxies довірених проксі (як ProxyFix x_for)
+    береться trusted_proxies-та адреса з кінця X-Forwarded-For — та, яку
+    дописав найближчий до клієнта довірений проксі; якщо адрес менше —
+    REMOTE_ADDR.
+    """
+    remote_addr = environ.get('REMOTE_ADDR') or '0.0.0.0'
+    if trusted_proxies <= 0:
+        return remote_addr
+
+    forwarded = [part.strip() for part in environ.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    if len(forwarded) >= trusted_proxies:
+        return forwarded[-trusted_proxies]
+    return remote_addr
 
 
 def parse_datetime(date_string: str) -> Optional[datetime]:
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Спільні фікстури тестів: додаток на SQLite в пам'яті
+"""
+import os
+
+import pytest
+
+# Конфігурація читається при імпорті app.config — до імпорту додатку
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('BCRYPT_EXECUTOR', 'thread')
+os.environ['JWT_SECRET_KEY'] = 'test-jwt-secret-key-of-32-bytes-min'
+
+from app import create_app, db  # noqa: E402
+from app.services.audit_service import AuditService  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Один додаток на сесію тестів; CloudWatch вимкнено"""
+    AuditService._send_to_cloudwatch = lambda self, audit_log: None
+    app = create_app()
+    app.config.update(TESTING=True, RATE_LIMIT_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
+        db.session.rollback()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Тести політики доступу: матриця ролей та рішення щодо файлів
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.models import FileGrant, FileMetadata, User
+from app.services.access_policy import AccessPolicy
+
+
+@pytest.mark.parametrize('role, resource, action, expected', [
+    ('admin', 'files', 'read_all', True),
+    ('admin', 'users', 'change_role', True),
+    ('user', 'files', 'share', True),
+    ('user', 'files', 'read_all', False),
+    ('user', 'audit', 'read', False),
+    ('guest', 'files', 'read', True),
+    ('guest', 'files', 'create', False),
+    ('unknown', 'files', 'read', False),
+    ('admin', 'files', 'unknown', False),
+])
+def test_role_matrix_decisions(role, resource, action, expected):
+    assert AccessPolicy.can(role, resource, action) is expected
+
+
+def test_compiled_decisions_match_permissions():
+    decisions = AccessPolicy.compile()
+
+    for role, resources in AccessPolicy.PERMISSIONS.items():
+        for resource, actions in resources.items():
+            allowed = [action for (r, res, action), ok in decisions.items() if r == role and res == resource and ok]
+            assert sorted(allowed) == sorted(actions)
+            assert sorted(AccessPolicy.allowed_actions(role, resource)) == sorted(actions)
+
+
+def test_action_aliases():
+    assert AccessPolicy.can_action('admin', 'download_any_file')
+    assert AccessPolicy.can_action('user', 'upload_file')
+    assert not AccessPolicy.can_action('user', 'view_audit')
+    assert not AccessPolicy.can_action('admin', 'launch_rockets')
+
+
+@pytest.fixture
+def files(app_context):
+    """Приватний, публічний та спільний файли адміністратора"""
+    admin = User.query.filter_by(username='admin').one()
+    user = User.query.filter_by(username='user').one()
+
+    def make(name, is_public=False):
+        file_meta = FileMetadata(
+            user_id=admin.id, original_name=name, s3_key=f'test/{uuid.uuid4()}',
+            encrypted_data_key='key', client_iv='iv', sha256_hash='0' * 64,
+            file_size=1, is_public=is_public
+        )
+        db.session.add(file_meta)
+        return file_meta
+
+    private, public, shared = make('private.txt'), make('public.txt', is_public=True), make('shared.txt')
+    db.session.flush()
+    db.session.add(FileGrant(file_id=shared.id, grantee_id=user.id, permission='read', granted_by=admin.id))
+    db.session.commit()
+
+    yield SimpleNamespace(admin=admin, user=user, private=private, public=public, shared=shared)
+
+    ids = [private.id, public.id, shared.id]
+    FileGrant.query.filter(FileGrant.file_id.in_(ids)).delete(synchronize_session=False)
+    FileMetadata.query.filter(FileMetadata.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def test_file_decisions(files):
+    user, admin = files.user, files.admin
+    guest = SimpleNamespace(id='guest-1', role='guest')
+
+    assert AccessPolicy.can_access_file(admin, files.private, 'delete')
+    assert AccessPolicy.can_access_file(user, files.public)
+    assert AccessPolicy.can_access_file(user, files.shared)
+    assert not AccessPolicy.can_access_file(user, files.private)
+    assert not AccessPolicy.can_access_file(user, files.shared, 'delete')
+    assert not AccessPolicy.can_access_file(user, files.public, 'share')
+    assert AccessPolicy.can_access_file(guest, files.public)
+    assert not AccessPolicy.can_access_file(guest, files.private)
+    assert AccessPolicy.can_access_file(None, files.public)
+    assert not AccessPolicy.can_access_file(None, files.public, 'delete')
+
+
+def test_visible_files_follow_grants(files):
+    ids = {files.private.id, files.public.id, files.shared.id}
+
+    def visible(user):
+        clause = AccessPolicy.visible_files_clause(user)
+        query = FileMetadata.query.filter(FileMetadata.id.in_(ids))
+        if clause is not None:
+            query = query.filter(clause)
+        return {file_meta.original_name for file_meta in query}
+
+    assert AccessPolicy.visible_files_clause(files.admin) is None
+    assert visible(files.user) == {'public.txt', 'shared.txt'}
+
+    # Зміна публічності оновлює грант через слухача ORM
+    files.public.is_public = False
+    db.session.commit()
+    assert visible(files.user) == {'shared.txt'}
+    assert visible(SimpleNamespace(id='nobody', role='unknown')) == set()
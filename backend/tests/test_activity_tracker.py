@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Тести ковзних вікон трекера активності
+"""
+from app.services.activity_tracker import SlidingWindowCounter, ShardedActivityTracker
+
+
+def test_counts_events_within_window():
+    counter = SlidingWindowCounter(60)
+    for _ in range(3):
+        counter.add(100)
+    counter.add(130, amount=2)
+
+    assert counter.count(130) == 5
+    assert counter.count(130, window_seconds=10) == 2
+    assert counter.last_epoch() == 130
+
+
+def test_expired_buckets_are_not_counted():
+    counter = SlidingWindowCounter(60)
+    counter.add(100)
+    counter.add(130)
+
+    assert counter.count(159) == 2
+    assert counter.count(160) == 1
+    assert counter.count(200) == 0
+
+
+def test_stale_bucket_is_reused():
+    counter = SlidingWindowCounter(60)
+    counter.add(100, amount=5)
+    # 160 потрапляє в той самий кошик, що й 100 — старе значення скидається
+    counter.add(160)
+
+    assert counter.count(160) == 1
+
+
+def test_wide_buckets_round_window_up():
+    counter = SlidingWindowCounter(600, bucket_seconds=10)
+    counter.add(1000)
+    counter.add(1005)
+    counter.add(1015)
+
+    assert counter.size == 60
+    assert counter.count(1019, window_seconds=5) == 1
+    assert counter.count(1019, window_seconds=15) == 3
+
+
+def test_tracker_batch_uses_one_clock_reading():
+    now = [1000]
+    tracker = ShardedActivityTracker(shards=4, clock=lambda: now[0])
+
+    assert tracker.track_request('u1', '10.0.0.1') is None
+    assert tracker.track_request('u1', '10.0.0.2') == '10.0.0.1'
+    assert tracker.incr_count('u1', 'failed_logins', 60) == 1
+
+    now[0] += 61
+    assert tracker.execute('u1', [('add', 'failed_logins', 2), ('count', 'failed_logins', 60)]) == [None, 2]
+    assert tracker.count('u1', 'requests', 60) == 0
+    assert tracker.last_ip('u1') == '10.0.0.2'
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Тести завершення сегментів архіву аудит-логу
+"""
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app import db
+from app.models import AuditArchiveSegment, AuditLog
+from app.services.audit_archive_service import AuditArchiveService
+
+
+class FakeS3:
+    """Сховище об'єктів у пам'яті; available=False імітує збій читання"""
+
+    def __init__(self):
+        self.objects = {}
+        self.available = True
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if not self.available:
+            raise ClientError({'Error': {'Code': 'ServiceUnavailable', 'Message': 'down'}}, 'GetObject')
+        return {'Body': BytesIO(self.objects[Key])}
+
+
+@pytest.fixture
+def archive(app_context):
+    old = datetime.utcnow() - timedelta(days=60)
+    for i in range(3):
+        db.session.add(AuditLog(timestamp=old + timedelta(minutes=i), action='LOGIN_SUCCESS',
+                                ip_address='10.0.0.1', status='success'))
+    db.session.commit()
+
+    service = AuditArchiveService()
+    service._s3_client = FakeS3()
+    AuditArchiveService._segment_cache.clear()
+    yield service
+
+    AuditArchiveService._segment_cache.clear()
+    AuditLog.query.delete()
+    AuditArchiveSegment.query.delete()
+    db.session.commit()
+
+
+def test_unreadable_segment_stays_pending(archive):
+    archive.s3_client.available = False
+
+    result = archive.archive_closed_partitions()
+
+    assert (len(result['segments']), result['rows_deleted'], result['pending']) == (1, 0, 1)
+    assert AuditArchiveSegment.query.one().status == 'pending'
+    assert AuditLog.query.count() == 3
+    assert archive.find_segments(datetime.utcnow() - timedelta(days=365)) == []
+
+    # Поки сегмент pending, партиція не архівується повторно
+    result = archive.archive_closed_partitions()
+    assert (result['segments'], result['pending']) == ([], 1)
+    assert len(archive.s3_client.objects) == 2
+
+
+def test_pending_segment_is_finished_on_next_run(archive):
+    archive.s3_client.available = False
+    archive.archive_closed_partitions()
+    archive.s3_client.available = True
+
+    result = archive.archive_closed_partitions()
+
+    assert (result['segments'], result['rows_deleted'], result['pending']) == ([], 3, 0)
+    assert AuditArchiveSegment.query.one().status == 'complete'
+    assert AuditLog.query.count() == 0
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Тести радикс-дерева CIDR, банів IP та визначення IP клієнта
+"""
+import ipaddress
+
+import pytest
+
+from app.services.ip_blocklist import CidrRadixTree, IpBlocklist
+from app.utils.helpers import get_environ_client_ip
+
+
+def match(tree, ip):
+    return tree.match(ipaddress.ip_address(ip))
+
+
+def test_radix_tree_matches_containing_network():
+    tree = CidrRadixTree(['10.0.0.0/8', '192.168.1.0/24', '203.0.113.7', '2001:db8::/32'])
+
+    assert len(tree) == 4
+    assert match(tree, '10.20.30.40') == '10.0.0.0/8'
+    assert match(tree, '192.168.1.255') == '192.168.1.0/24'
+    assert match(tree, '192.168.2.1') is None
+    assert match(tree, '203.0.113.7') == '203.0.113.7/32'
+    assert match(tree, '203.0.113.8') is None
+    assert match(tree, '2001:db8::1') == '2001:db8::/32'
+    assert match(tree, '2001:db9::1') is None
+
+
+def test_radix_tree_normalizes_and_deduplicates():
+    tree = CidrRadixTree(['10.1.2.3/16', ' 10.1.0.0/16 '])
+
+    assert len(tree) == 1
+    assert match(tree, '10.1.255.1') == '10.1.0.0/16'
+
+
+def test_radix_tree_default_route_matches_everything():
+    tree = CidrRadixTree(['0.0.0.0/0'])
+
+    assert match(tree, '8.8.8.8') == '0.0.0.0/0'
+    assert match(tree, '::1') is None
+
+
+def test_radix_tree_rejects_invalid_network():
+    with pytest.raises(ValueError):
+        CidrRadixTree(['10.0.0.0/33'])
+
+
+@pytest.fixture
+def blocklist(monkeypatch):
+    """Ізольований стан IpBlocklist"""
+    monkeypatch.setattr(IpBlocklist, '_deny', CidrRadixTree(['198.51.100.0/24']))
+    monkeypatch.setattr(IpBlocklist, '_exempt', CidrRadixTree(['127.0.0.0/8']))
+    monkeypatch.setattr(IpBlocklist, '_local_bans', {})
+    monkeypatch.setattr(IpBlocklist, '_synced_bans', {})
+    monkeypatch.setattr(IpBlocklist, '_ban_seconds', {'BRUTE_FORCE': 300})
+    monkeypatch.setattr(IpBlocklist, '_stats', dict.fromkeys(IpBlocklist._stats, 0))
+    return IpBlocklist
+
+
+def test_blocklist_denies_networks_and_bans_ips(blocklist):
+    assert blocklist.check('198.51.100.9') == (403, '198.51.100.0/24', 0)
+    assert blocklist.check('203.0.113.5') is None
+    assert blocklist.check('not-an-ip') is None
+
+    blocklist.ban_for_threat('BRUTE_FORCE', '203.0.113.5')
+    status, reason, retry_after = blocklist.check('203.0.113.5')
+    assert (status, reason) == (429, 'BRUTE_FORCE')
+    assert 0 < retry_after <= 301
+
+    blocklist.unban('203.0.113.5')
+    assert blocklist.check('203.0.113.5') is None
+
+
+def test_blocklist_skips_exempt_and_unconfigured_bans(blocklist):
+    blocklist.ban_for_threat('BRUTE_FORCE', '127.0.0.1')
+    blocklist.ban_for_threat('RAPID_REQUESTS', '203.0.113.5')
+
+    assert blocklist.check('127.0.0.1') is None
+    assert blocklist.check('203.0.113.5') is None
+    assert blocklist.get_stats()['active_bans'] == 0
+
+
+@pytest.mark.parametrize('environ, trusted_proxies, expected', [
+    ({'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '1.2.3.4'}, 0, '10.0.0.2'),
+    ({'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_REAL_IP': '1.2.3.4'}, 1, '10.0.0.2'),
+    ({'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '6.6.6.6, 1.2.3.4'}, 1, '1.2.3.4'),
+    ({'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '6.6.6.6, 1.2.3.4, 10.0.0.3'}, 2, '1.2.3.4'),
+    ({'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '1.2.3.4'}, 2, '10.0.0.2'),
+    ({}, 0, '0.0.0.0'),
+])
+def test_client_ip_trusts_only_configured_proxies(environ, trusted_proxies, expected):
+    assert get_environ_client_ip(environ, trusted_proxies) == expected
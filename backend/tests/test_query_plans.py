@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Тести планів гарячих запитів списку файлів на SQLite в пам'яті
+"""
+from app.services.query_plan_checker import QueryPlanChecker
+
+
+def test_hot_queries_use_indexes(app_context):
+    result = QueryPlanChecker().check()
+
+    assert result['dialect'] == 'sqlite'
+    assert result['checked'] > 0
+    assert result['failures'] == []
+
+
+def test_bad_plans_are_reported(app_context, monkeypatch):
+    plans = {
+        'SCAN file_metadata': 'повне сканування file_metadata',
+        'SCAN file_metadata USING INDEX ix_file_metadata_user_id|USE TEMP B-TREE FOR ORDER BY':
+            'обхід ix_file_metadata_user_id без порядку та покриття',
+    }
+    checker = QueryPlanChecker()
+
+    for plan, reason in plans.items():
+        monkeypatch.setattr(checker, 'explain', lambda statement, plan=plan: plan.split('|'))
+        failures = checker.check()['failures']
+
+        assert failures
+        assert {failure['reason'] for failure in failures} >= {reason}
+        ordered = {failure['query'] for failure in failures if failure['reason'] == 'сортування без індексу'}
+        assert ('list:admin:visible:created_at' in ordered) == ('USE TEMP B-TREE FOR ORDER BY' in plan)
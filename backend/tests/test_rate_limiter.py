@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Тести token bucket обмеження частоти запитів
+"""
+import pytest
+
+from app.middleware.rate_limiter import TokenBucketRateLimiter
+
+
+def test_bucket_drains_and_refills():
+    limiter = TokenBucketRateLimiter(shards=2)
+
+    for expected in (2, 1, 0):
+        assert limiter.consume('ip:a', capacity=3, rate=1, now=0) == (True, expected, 0.0)
+
+    allowed, remaining, retry_after = limiter.consume('ip:a', capacity=3, rate=1, now=0)
+    assert (allowed, remaining) == (False, 0)
+    assert retry_after == pytest.approx(1.0)
+
+    # За 1.5 с поповнюється 1.5 токена, але не більше місткості
+    assert limiter.consume('ip:a', capacity=3, rate=1, now=1.5) == (True, 0.5, 0.0)
+    assert limiter.consume('ip:a', capacity=3, rate=1, now=100)[1] == 2
+
+
+def test_keys_have_separate_buckets():
+    limiter = TokenBucketRateLimiter(shards=1)
+
+    assert limiter.consume('user:1', capacity=1, rate=1, now=0)[0]
+    assert not limiter.consume('user:1', capacity=1, rate=1, now=0)[0]
+    assert limiter.consume('user:2', capacity=1, rate=1, now=0)[0]
+
+
+def test_cost_above_capacity_waits_for_full_bucket():
+    limiter = TokenBucketRateLimiter()
+
+    allowed, remaining, retry_after = limiter.consume('ip:a', capacity=2, rate=0.5, cost=5, now=0)
+
+    assert not allowed
+    assert remaining == 2
+    assert retry_after == 0
+
+
+def test_full_buckets_are_evicted_first():
+    limiter = TokenBucketRateLimiter(shards=1, max_keys_per_shard=2)
+    limiter.consume('ip:idle', capacity=10, rate=1, now=0)
+    limiter.consume('ip:busy', capacity=10, rate=1, cost=10, now=5)
+
+    limiter.consume('ip:new', capacity=10, rate=1, now=10)
+
+    assert set(limiter._buckets[0]) == {'ip:busy', 'ip:new'}
+    limiter.reset()
+    assert limiter.get_stats() == {'shards': 1, 'keys': 0}
+
+
+def test_anonymous_requests_are_limited_per_ip(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ANONYMOUS', 2)
+    limiter = app.extensions['rate_limiter']
+    limiter.reset()
+    client = app.test_client()
+
+    try:
+        statuses = [client.get('/api/files/').status_code for _ in range(3)]
+        other = client.get('/api/files/', environ_base={'REMOTE_ADDR': '10.9.9.9'})
+    finally:
+        limiter.reset()
+
+    assert 429 not in statuses[:2] and statuses[2] == 429
+    assert other.status_code != 429
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Тести контексту запиту: одне декодування JWT на запит
+"""
+import pytest
+from flask_jwt_extended import JWTManager
+
+from app.models import User
+from app.services.auth_service import AuthService
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    """Перевірки підпису JWT (усі шляхи декодування flask_jwt_extended)"""
+    calls = []
+    decode = JWTManager._decode_jwt_from_config
+
+    def counting_decode(self, encoded_token, *args, **kwargs):
+        calls.append(encoded_token)
+        return decode(self, encoded_token, *args, **kwargs)
+
+    monkeypatch.setattr(JWTManager, '_decode_jwt_from_config', counting_decode)
+    return calls
+
+
+@pytest.fixture
+def tokens(app_context):
+    return AuthService().generate_tokens(User.query.filter_by(username='user').one())
+
+
+@pytest.mark.parametrize('rate_limit_enabled', [True, False])
+def test_token_is_decoded_once_per_request(app, monkeypatch, decode_calls, tokens, rate_limit_enabled):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', rate_limit_enabled)
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+
+    response = app.test_client().get('/api/auth/me', headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['user']['username'] == 'user'
+    assert len(decode_calls) == 1
+
+
+def test_limiter_keys_authenticated_requests_by_user(app, monkeypatch, tokens):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    limiter = app.extensions['rate_limiter']
+    limiter.reset()
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+
+    try:
+        app.test_client().get('/api/auth/me', headers=headers)
+        keys = [key for shard in limiter._buckets for key in shard]
+    finally:
+        limiter.reset()
+
+    assert keys == [f"user:{User.query.filter_by(username='user').one().id}"]
+
+
+def test_invalid_token_gets_jwt_error(app, decode_calls):
+    response = app.test_client().get('/api/auth/me', headers={'Authorization': 'Bearer not-a-jwt'})
+
+    assert response.status_code == 422
+    assert app.test_client().get('/api/auth/me').status_code == 401
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Тести спільного трекера активності на mmap-файлі
+"""
+import pytest
+
+from app.services.shared_activity_tracker import SharedMemoryActivityTracker
+
+
+@pytest.fixture
+def clock():
+    return [1_700_000_000]
+
+
+@pytest.fixture
+def tracker(tmp_path, clock):
+    return SharedMemoryActivityTracker(str(tmp_path / 'tracker.bin'), slots=8, stripes=2,
+                                       clock=lambda: clock[0])
+
+
+def test_counts_shared_between_instances(tmp_path, tracker, clock):
+    other = SharedMemoryActivityTracker(tracker.path, slots=8, stripes=2, clock=lambda: clock[0])
+
+    tracker.track_request('u1', '10.0.0.1')
+    assert other.incr_count('u1', 'requests', 60) == 2
+    assert other.track_request('u1', '10.0.0.2') == '10.0.0.1'
+
+    clock[0] += 61
+    assert tracker.count('u1', 'requests', 60) == 0
+
+
+def test_buckets_from_the_future_are_ignored(tracker, clock):
+    for _ in range(5):
+        tracker.add('u1', 'failed_logins')
+
+    # Годинник переведено назад (або файл від іншого джерела часу)
+    clock[0] -= 3600
+
+    assert tracker.count('u1', 'failed_logins') == 0
+    assert tracker.incr_count('u1', 'failed_logins', 600) == 1
+    assert tracker.lock_stats()['tracked_users'] == 1
+
+
+def test_slots_seen_in_the_future_are_reclaimed(tmp_path, clock):
+    tracker = SharedMemoryActivityTracker(str(tmp_path / 'tracker.bin'), slots=1, stripes=1,
+                                          clock=lambda: clock[0])
+    tracker.track_request('u1', '10.0.0.1')
+
+    clock[0] -= 3600
+    tracker.track_request('u2', '10.0.0.2')
+
+    assert tracker.last_ip('u1') is None
+    assert tracker.last_ip('u2') == '10.0.0.2'
+
+
+def test_file_with_old_layout_is_reinitialized(tmp_path, tracker):
+    tracker.track_request('u1', '10.0.0.1')
+    header = SharedMemoryActivityTracker._HEADER
+    with open(tracker.path, 'r+b') as handle:
+        handle.write(header.pack(SharedMemoryActivityTracker.MAGIC, 1, tracker.slots, tracker.record_size))
+
+    reopened = SharedMemoryActivityTracker(tracker.path, slots=8, stripes=2)
+
+    assert reopened.last_ip('u1') is None
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Тести імовірнісних структур (Count-Min, HyperLogLog, FailedLoginSketch)
+"""
+import pytest
+
+from app.services.sketches import CountMinSketch, FailedLoginSketch, HyperLogLog, hash64
+
+
+def test_hash64_is_stable():
+    assert hash64('10.0.0.1') == hash64('10.0.0.1')
+    assert hash64('10.0.0.1') != hash64('10.0.0.2')
+    assert 0 <= hash64('x') < 2 ** 64
+
+
+def test_count_min_never_underestimates():
+    sketch = CountMinSketch(width=64, depth=4)
+    expected = {f'ip-{i}': i % 7 + 1 for i in range(500)}
+    for key, amount in expected.items():
+        sketch.add(key, amount)
+
+    assert sketch.total == sum(expected.values())
+    assert all(sketch.estimate(key) >= amount for key, amount in expected.items())
+
+
+def test_count_min_is_exact_without_collisions():
+    sketch = CountMinSketch()
+
+    assert sketch.add('10.0.0.1') == 1
+    assert sketch.add('10.0.0.1', 4) == 5
+    assert sketch.estimate('10.0.0.1') == 5
+    assert sketch.estimate('10.0.0.2') == 0
+
+
+@pytest.mark.parametrize('cardinality', [10, 200, 5000])
+def test_hyperloglog_estimate_within_error(cardinality):
+    hll = HyperLogLog(precision=8)
+    for i in range(cardinality):
+        hll.add(f'user-{i}')
+        hll.add(f'user-{i}')
+
+    # 4 стандартні похибки (~6.5% при precision=8)
+    assert hll.count() == pytest.approx(cardinality, rel=0.26)
+
+
+def test_hyperloglog_merge_is_union():
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(100):
+        first.add(f'user-{i}')
+        second.add(f'user-{i + 50}')
+
+    assert first.merge(second).count() == pytest.approx(150, rel=0.26)
+    assert first.count() == pytest.approx(100, rel=0.26)
+
+
+def test_failed_login_sketch_tracks_ip_after_min_failures():
+    sketch = FailedLoginSketch(window_seconds=600, width=1024, min_failures=3)
+
+    results = [sketch.record('10.0.0.1', f'name-{i}', now=6000 + i) for i in range(5)]
+
+    assert [r['failures'] for r in results] == [1, 2, 3, 4, 5]
+    assert [r['tracked'] for r in results] == [False, False, True, True, True]
+    assert results[-1]['distinct_usernames'] == 3
+
+    sketch.mark('10.0.0.1', 'CREDENTIAL_STUFFING')
+    # Наступне вікно: половина попереднього вікна ще враховується
+    result = sketch.record('10.0.0.1', 'name-0', now=6900)
+    assert result['failures'] == 1 + 5 // 2
+    assert result['flagged'] == {'CREDENTIAL_STUFFING'}
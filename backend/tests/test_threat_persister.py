@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Тести звірки автоблокувань персистера загроз з БД
+"""
+import uuid
+
+import pytest
+
+from app import db
+from app.models import ThreatEvent, User
+from app.services.threat_persister import ThreatPersister
+
+
+@pytest.fixture
+def user(app_context, monkeypatch):
+    monkeypatch.setattr(ThreatPersister, '_blocked', set())
+    monkeypatch.setattr(ThreatPersister, '_pending_scores', {})
+    user = User.query.filter_by(username='user').one()
+    yield user
+    user.is_blocked = False
+    user.threat_score = 0
+    db.session.commit()
+
+
+def test_sync_drops_users_unblocked_in_db(user):
+    ThreatPersister.block(user.id)
+
+    ThreatPersister.sync_blocked()
+
+    assert not ThreatPersister.is_blocked(user.id)
+
+
+def test_sync_keeps_blocked_and_pending_users(user):
+    ThreatPersister.block(user.id)
+    ThreatPersister._pending_scores[user.id] = 50
+
+    ThreatPersister.sync_blocked()
+    assert ThreatPersister.is_blocked(user.id)
+
+    ThreatPersister._pending_scores.clear()
+    user.is_blocked = True
+    db.session.commit()
+
+    ThreatPersister.sync_blocked()
+    assert ThreatPersister.is_blocked(user.id)
+
+
+def test_flush_does_not_restore_block_from_memory(user):
+    ThreatPersister.block(user.id)
+    row = {'id': str(uuid.uuid4()), 'user_id': user.id, 'threat_type': 'RAPID_REQUESTS',
+           'severity': 'medium', 'score_added': 5, 'ip_address': '10.0.0.1', 'description': 'test'}
+
+    with db.session.session_factory() as session:
+        ThreatPersister._flush([('insert', row, user.id, 5, None)], session)
+    db.session.refresh(user)
+    ThreatEvent.query.filter_by(id=row['id']).delete()
+    db.session.commit()
+
+    assert user.threat_score == 5
+    assert not user.is_blocked
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Тести компіляції та оцінки правил виявлення загроз
+"""
+import pytest
+
+from app.services.activity_tracker import ShardedActivityTracker
+from app.services.threat_rules import ThreatRuleEngine
+
+BRUTE_FORCE = {'name': 'brute_force', 'metric': 'failed_logins', 'window': 300,
+               'threshold': 3, 'threat_type': 'BRUTE_FORCE'}
+
+
+def rule(**overrides):
+    return dict(BRUTE_FORCE, **overrides)
+
+
+def test_compiles_rule_with_defaults():
+    compiled, = ThreatRuleEngine.compile([{'metric': 'requests', 'threshold': 100,
+                                           'threat_type': 'RAPID_REQUESTS'}])
+
+    assert compiled.name == 'rule_0'
+    assert compiled.window == ThreatRuleEngine.METRICS['requests']
+    assert compiled.op == '>='
+    assert compiled.cooldown is None
+    assert compiled.describe(120) == 'RAPID_REQUESTS: 120 подій за 60 с'
+
+
+def test_integral_float_window_is_accepted():
+    compiled, = ThreatRuleEngine.compile([rule(window=300.0, cooldown=60.0)])
+
+    assert compiled.window == 300
+    assert compiled.cooldown == 60
+
+
+@pytest.mark.parametrize('rules, message', [
+    ({'name': 'r'}, 'списком'),
+    (['r'], "очікується об'єкт"),
+    ([rule(name=1)], 'назва має бути рядком'),
+    ([rule(extra=1)], 'невідомі поля extra'),
+    ([rule(), rule()], 'дублікат назви'),
+    ([rule(metric='uploads')], "невідома метрика 'uploads'"),
+    ([rule(threat_type='NOPE')], "невідомий тип загрози 'NOPE'"),
+    ([rule(op='<')], "невідоме порівняння '<'"),
+    ([{k: v for k, v in BRUTE_FORCE.items() if k != 'threshold'}], 'не задано поріг'),
+    ([rule(threshold='10')], "threshold має бути числом, отримано '10'"),
+    ([rule(threshold=True)], 'threshold має бути числом'),
+    ([rule(threshold=-1)], "від'ємним"),
+    ([rule(window=0)], 'поза межами'),
+    ([rule(window=601)], 'поза межами'),
+    ([rule(window=30.5)], 'цілим числом секунд'),
+    ([rule(cooldown=-5)], "cooldown не може бути від'ємним"),
+    ([rule(description=5)], 'опис має бути рядком'),
+    ([rule(description='{count} спроб')], 'некоректний шаблон опису'),
+])
+def test_invalid_rules_are_rejected(rules, message):
+    with pytest.raises(ValueError, match=message):
+        ThreatRuleEngine.compile(rules)
+
+
+def test_evaluate_triggers_rules_of_metric_only():
+    engine = ThreatRuleEngine([
+        rule(),
+        rule(name='strict', window=60, threshold=2, op='>'),
+        {'name': 'flood', 'metric': 'requests', 'threshold': 2, 'threat_type': 'RAPID_REQUESTS'},
+    ])
+    tracker = ShardedActivityTracker(shards=1, clock=lambda: 1000)
+
+    assert engine.evaluate(tracker, 'u1', 'failed_logins') == (None, [])
+    _, triggered = engine.evaluate(tracker, 'u1', 'failed_logins')
+    assert triggered == []
+
+    _, triggered = engine.evaluate(tracker, 'u1', 'failed_logins')
+    assert [(r.name, value) for r, value in triggered] == [('brute_force', 3), ('strict', 3)]
+
+
+def test_evaluate_reports_ip_change_for_requests():
+    engine = ThreatRuleEngine([{'name': 'flood', 'metric': 'requests', 'threshold': 2,
+                                'threat_type': 'RAPID_REQUESTS'}])
+    tracker = ShardedActivityTracker(shards=1, clock=lambda: 1000)
+
+    assert engine.evaluate(tracker, 'u1', 'requests', '10.0.0.1') == (None, [])
+    previous_ip, triggered = engine.evaluate(tracker, 'u1', 'requests', '10.0.0.2')
+
+    assert previous_ip == '10.0.0.1'
+    assert [(r.name, value) for r, value in triggered] == [('flood', 2)]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Тести Bloom-фільтра та сховища відкликаних токенів
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import TokenRevocation
+from app.services.sketches import BloomFilter
+from app.services.token_revocation import TokenRevocationStore, _epoch
+
+
+@pytest.fixture
+def store(app_context):
+    """Порожня таблиця та стан сховища до і після тесту"""
+    def reset():
+        TokenRevocation.query.delete()
+        db.session.commit()
+        TokenRevocationStore._bloom = None
+        TokenRevocationStore._user_cutoffs = {}
+        TokenRevocationStore._synced_until = None
+        TokenRevocationStore._next_sync = 0.0
+        TokenRevocationStore._next_rebuild = 0.0
+
+    reset()
+    yield TokenRevocationStore
+    reset()
+
+
+def payload(sub='user-1', iat=None, jti=None):
+    iat = _epoch(datetime.utcnow()) if iat is None else iat
+    return {'sub': sub, 'iat': iat, 'exp': iat + 900, 'type': 'access', 'jti': jti or str(uuid.uuid4())}
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [f'jti-{i}' for i in range(1000)]
+    for value in added:
+        bloom.add(value)
+
+    assert all(value in bloom for value in added)
+    false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert bloom.count == 1000
+
+
+def test_revoked_token_is_found_by_jti(store):
+    revoked, other = payload(), payload()
+
+    store.revoke_token(revoked)
+    store.revoke_token(revoked)  # повторний logout
+
+    assert store.is_revoked(revoked)
+    assert not store.is_revoked(other)
+    assert TokenRevocation.query.count() == 1
+
+
+def test_user_cutoff_revokes_tokens_issued_until_moment(store):
+    before = datetime.utcnow().replace(microsecond=0)
+    cutoff = _epoch(before)
+
+    store.revoke_user('user-1', 'role_changed', before=before)
+
+    assert store.is_revoked(payload(iat=cutoff - 60))
+    assert store.is_revoked(payload(iat=cutoff))
+    assert not store.is_revoked(payload(iat=cutoff + 1))
+    assert not store.is_revoked(payload(sub='user-2', iat=cutoff - 60))
+
+
+def test_later_cutoff_wins(store):
+    now = datetime.utcnow().replace(microsecond=0)
+    store.revoke_user('user-1', 'blocked', before=now)
+    store.revoke_user('user-1', 'blocked', before=now - timedelta(minutes=5))
+
+    assert store._user_cutoffs['user-1'] == _epoch(now)
+
+
+def test_revocations_from_other_worker_are_synced(store):
+    token = payload()
+    assert not store.is_revoked(token)
+
+    # Рядки, записані іншим воркером напряму в таблицю
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    db.session.add(TokenRevocation(jti=token['jti'], user_id='user-1', expires_at=expires_at))
+    db.session.add(TokenRevocation(user_id='user-2', revoked_before=datetime.utcnow(), expires_at=expires_at))
+    db.session.commit()
+    store._next_sync = 0.0
+
+    assert store.is_revoked(token)
+    assert store.is_revoked(payload(sub='user-2', iat=_epoch(datetime.utcnow()) - 10))
+    assert store.get_stats()['syncs'] >= 1
+
+
+def test_rebuild_skips_expired_rows_without_writing(store):
+    db.session.add(TokenRevocation(jti='expired', expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.add(TokenRevocation(jti='active', expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.session.commit()
+
+    assert store.is_revoked(payload(jti='active'))
+    assert 'expired' not in store._bloom
+    assert TokenRevocation.query.count() == 2
+
+
+def test_check_does_not_commit_request_session(store):
+    db.session.add(TokenRevocation(jti='uncommitted', expires_at=datetime.utcnow() + timedelta(hours=1)))
+
+    store.is_revoked(payload())
+    db.session.rollback()
+
+    assert TokenRevocation.query.count() == 0
+
+
+def test_purge_deletes_expired_rows(store):
+    db.session.add(TokenRevocation(jti='expired', expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.add(TokenRevocation(jti='active', expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.session.commit()
+
+    assert store.purge_expired() == 1
+    assert [row.jti for row in TokenRevocation.query.all()] == ['active']
+
+
+def test_purge_is_a_maintenance_task(app):
+    from app.services.maintenance import MaintenanceScheduler
+
+    assert MaintenanceScheduler._tasks['token-revocations']['func'] == TokenRevocationStore.purge_expired
@@ -117,6 +117,9 @@ export const auditApi = {
   list: (params = {}) =>
     apiClient.get('/audit', { params }),
 
+  get: (logId) =>
+    apiClient.get(`/audit/${logId}`),
+
   export: (params = {}) =>
     apiClient.get('/audit/export', {
       params,
@@ -76,6 +76,24 @@ export default function AuditPage() {
     }
   }
 
+  // Повні details завантажуються лише при розгортанні рядка
+  const toggleRow = async (log) => {
+    if (expandedRow === log.id) {
+      setExpandedRow(null)
+      return
+    }
+    setExpandedRow(log.id)
+
+    if (log.details === undefined) {
+      try {
+        const response = await auditApi.get(log.id)
+        setLogs(current => current.map(l => l.id === log.id ? response.data.log : l))
+      } catch (error) {
+        console.error('Помилка завантаження деталей:', error)
+      }
+    }
+  }
+
   const loadLogs = async () => {
     try {
       setLoading(true)
@@ -306,7 +324,7 @@ export default function AuditPage() {
                     <tr
                       key={log.id}
                       className="border-b border-[#95122C]/30 hover:bg-[#95122C]/10 cursor-pointer transition-colors"
-                      onClick={() => setExpandedRow(expandedRow === log.id ? null : log.id)}
+                      onClick={() => toggleRow(log)}
                     >
                       <td className="px-4 py-3 text-[#D0E0E1] text-xs whitespace-nowrap font-mono">
                         {new Date(log.timestamp).toLocaleString('uk-UA')}